@@ -4,7 +4,7 @@ from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from .forms import RegisterForm, AddressForm
 from pedidos.models import Carrinho
-from clientes.models import CustomUser, EnderecoUser
+from clientes.models import EnderecoUser
 from django.shortcuts import get_object_or_404
 from django.http import JsonResponse
 from .forms import (
@@ -29,11 +29,7 @@ def registrar_cliente(request):
             # messages.success(request, 'Usuário criado com sucesso')
 
             # Quando uma conta é registrada, um carrinho é vinculado a ela
-            custom_user = get_object_or_404(
-                CustomUser, email=user_form.cleaned_data['email']
-            )
-            criar_carrinho = Carrinho.objects.create(cliente=custom_user)
-            criar_carrinho.save()
+            Carrinho.objects.create(cliente=user)
 
             return redirect('clientes:login_cliente')
 
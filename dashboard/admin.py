@@ -1 +1,11 @@
 from django.contrib import admin
+from dashboard.models import VendaDiaria
+
+
+@admin.register(VendaDiaria)
+class VendaDiariaAdmin(admin.ModelAdmin):
+    list_display = ('dia', 'detalhe_produto', 'marca', 'metodo_pagamento', 'unidades', 'faturamento', 'pedidos')
+    list_select_related = ('detalhe_produto__produto', 'detalhe_produto__cor', 'marca')
+    list_filter = ('metodo_pagamento',)
+    readonly_fields = [campo.name for campo in VendaDiaria._meta.fields]
+    date_hierarchy = 'dia'
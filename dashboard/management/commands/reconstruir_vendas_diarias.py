@@ -0,0 +1,32 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from dashboard import vendas
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstrói a tabela VendaDiaria a partir dos pedidos, recentes e arquivados, um dia por transação. '
+        'O histórico anterior à tabela já é somado pela migração dashboard 0002; use este comando para '
+        'corrigir divergências ou depois de restaurar um backup'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde',
+                            help='Só os dias a partir desta data (AAAA-MM-DD); padrão: tudo')
+        parser.add_argument('--lote', type=int, default=vendas.TAMANHO_LOTE,
+                            help='Pedidos lidos por consulta')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            try:
+                desde = date.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError('--desde precisa estar no formato AAAA-MM-DD')
+
+        pedidos, linhas = vendas.reconstruir(
+            desde,
+            options['lote'],
+            progresso=lambda dia, total: self.stdout.write(f'  {dia:%d/%m/%Y}: {total} pedidos lidos...'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'✓ {pedidos} pedidos somados em {linhas} linhas de venda diária'))
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('menu', '0006_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoContabilizado',
+            fields=[
+                ('pedido_id', models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+            options={
+                'verbose_name': 'Pedido Contabilizado',
+                'verbose_name_plural': 'Pedidos Contabilizados',
+            },
+        ),
+        migrations.CreateModel(
+            name='VendaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('metodo_pagamento', models.CharField(max_length=20)),
+                ('unidades', models.PositiveIntegerField(default=0)),
+                ('faturamento', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pedidos', models.PositiveIntegerField(default=0)),
+                ('detalhe_produto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='vendas_diarias', to='menu.detalheproduto')),
+                ('marca', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='vendas_diarias', to='menu.marca')),
+            ],
+            options={
+                'verbose_name': 'Venda Diária',
+                'verbose_name_plural': 'Vendas Diárias',
+                'constraints': [models.UniqueConstraint(fields=('dia', 'detalhe_produto', 'marca', 'metodo_pagamento'), name='venda_diaria_chave')],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations
+from django.utils import timezone
+
+
+def popular_vendas_diarias(apps, schema_editor):
+    """
+    Soma em VendaDiaria os pedidos que já existiam, recentes e arquivados;
+    os novos chegam pela fila. Refaz a tabela inteira (como `reconstruir`)
+    e marca todos os pedidos como contabilizados, para que tarefas ainda na
+    fila não os somem de novo.
+    """
+    ItemPedido = apps.get_model('pedidos', 'ItemPedido')
+    PedidoArquivado = apps.get_model('pedidos', 'PedidoArquivado')
+    DetalheProduto = apps.get_model('menu', 'DetalheProduto')
+    VendaDiaria = apps.get_model('dashboard', 'VendaDiaria')
+    PedidoContabilizado = apps.get_model('dashboard', 'PedidoContabilizado')
+
+    marcas = dict(DetalheProduto.objects.values_list('id', 'produto__marca_id'))
+    recentes = ItemPedido.objects.values_list(
+        'pedido_id', 'pedido__criado_em', 'pedido__metodo_pagamento',
+        'detalhe_produto_id', 'detalhe_produto__produto__marca_id', 'quantidade', 'preco_unitario',
+    ).iterator(chunk_size=2000)
+    arquivados = (
+        (pk, criado_em, metodo, item['variante_id'], marcas[item['variante_id']],
+         item['quantidade'], Decimal(item['preco']))
+        for pk, criado_em, metodo, itens in PedidoArquivado.objects.values_list(
+            'id', 'criado_em', 'metodo_pagamento', 'itens'
+        ).iterator(chunk_size=500)
+        for item in itens
+        if item['variante_id'] in marcas
+    )
+
+    fatos = defaultdict(lambda: [0, Decimal(0), 0])
+    contados = set()
+    pedido_ids = set()
+    for itens in (recentes, arquivados):
+        for pedido_id, criado_em, metodo, variante_id, marca_id, quantidade, preco in itens:
+            chave = (timezone.localdate(criado_em), variante_id, marca_id, metodo)
+            fato = fatos[chave]
+            fato[0] += quantidade
+            fato[1] += quantidade * preco
+            if (pedido_id, chave) not in contados:
+                contados.add((pedido_id, chave))
+                fato[2] += 1
+            pedido_ids.add(pedido_id)
+
+    VendaDiaria.objects.all().delete()
+    VendaDiaria.objects.bulk_create(
+        (
+            VendaDiaria(
+                dia=dia, detalhe_produto_id=variante_id, marca_id=marca_id, metodo_pagamento=metodo,
+                unidades=unidades, faturamento=faturamento, pedidos=pedidos,
+            )
+            for (dia, variante_id, marca_id, metodo), (unidades, faturamento, pedidos) in fatos.items()
+        ),
+        batch_size=500,
+    )
+    PedidoContabilizado.objects.bulk_create(
+        (PedidoContabilizado(pedido_id=pk) for pk in pedido_ids), batch_size=500, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+        ('pedidos', '0006_pedido_arquivado'),
+    ]
+
+    operations = [
+        migrations.RunPython(popular_vendas_diarias, migrations.RunPython.noop),
+    ]
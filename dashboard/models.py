@@ -1,9 +1,44 @@
 from django.db import models
+from menu.models import DetalheProduto, Marca
+
+
+class VendaDiaria(models.Model):
+    """
+    Vendas de um dia por variante, marca e método de pagamento, somadas
+    pela fila a cada pedido (dashboard/vendas.py). Os relatórios do
+    dashboard leem daqui em vez de percorrer ItemPedido; o comando
+    `reconstruir_vendas_diarias` refaz a tabela a partir dos pedidos.
+    """
+    dia = models.DateField()
+    detalhe_produto = models.ForeignKey(DetalheProduto, on_delete=models.PROTECT, related_name='vendas_diarias')
+    marca = models.ForeignKey(Marca, on_delete=models.PROTECT, related_name='vendas_diarias')
+    metodo_pagamento = models.CharField(max_length=20)
+    unidades = models.PositiveIntegerField(default=0)
+    faturamento = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pedidos = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.dia:%d/%m/%Y} - variante {self.detalhe_produto_id}: {self.unidades} un."
+
+    class Meta:
+        verbose_name = 'Venda Diária'
+        verbose_name_plural = 'Vendas Diárias'
+        constraints = [
+            # Também é o índice dos relatórios por período
+            models.UniqueConstraint(
+                fields=['dia', 'detalhe_produto', 'marca', 'metodo_pagamento'], name='venda_diaria_chave'
+            ),
+        ]
 
-from typing import ClassVar
-from django.db import models
-import datetime
-from menu.models import Produto
 
+class PedidoContabilizado(models.Model):
+    """
+    Pedidos já somados em VendaDiaria. A tarefa da fila pode rodar mais de
+    uma vez; a marca, gravada na mesma transação da soma, impede que o
+    pedido conte em dobro. Guarda só o id: o pedido pode ser arquivado.
+    """
+    pedido_id = models.BigIntegerField(primary_key=True)
 
-    
\ No newline at end of file
+    class Meta:
+        verbose_name = 'Pedido Contabilizado'
+        verbose_name_plural = 'Pedidos Contabilizados'
@@ -0,0 +1,9 @@
+"""Tarefas da fila (tarefas/fila.py) que mantêm as tabelas do dashboard"""
+from tarefas.fila import tarefa
+
+
+@tarefa('dashboard.contabilizar_pedido')
+def contabilizar_pedido(pedido_id):
+    from dashboard.vendas import contabilizar
+
+    contabilizar(pedido_id)
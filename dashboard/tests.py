@@ -1,3 +1,145 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from importlib import import_module
+from django.apps import apps
 from django.test import TestCase
+from django.utils import timezone
+from clientes.models import CustomUser
+from dashboard import vendas
+from dashboard.models import PedidoContabilizado, VendaDiaria
+from menu.models import Cor, DetalheProduto, Marca, Produto
+from pedidos.arquivamento import arquivar
+from pedidos.models import ItemPedido, Pedido
 
-# Create your tests here.
+
+class AcumularTests(TestCase):
+    def test_soma_por_dia_e_conta_cada_pedido_uma_vez(self):
+        segunda = timezone.make_aware(datetime(2026, 10, 12, 10))
+        terca = segunda + timedelta(days=1)
+        itens = [
+            # Duas linhas da mesma variante no pedido 1: um pedido só
+            (1, segunda, 'pix', 10, 1, 2, Decimal('5.00')),
+            (1, segunda, 'pix', 10, 1, 1, Decimal('5.00')),
+            (2, segunda, 'pix', 10, 1, 1, Decimal('4.00')),
+            (3, segunda, 'cartao', 10, 1, 1, Decimal('5.00')),
+            (4, terca, 'pix', 10, 1, 3, Decimal('5.00')),
+        ]
+
+        fatos = vendas._acumular(vendas._novos_fatos(), itens)
+
+        self.assertEqual(dict(fatos), {
+            (date(2026, 10, 12), 10, 1, 'pix'): [4, Decimal('19.00'), 2],
+            (date(2026, 10, 12), 10, 1, 'cartao'): [1, Decimal('5.00'), 1],
+            (date(2026, 10, 13), 10, 1, 'pix'): [3, Decimal('15.00'), 1],
+        })
+
+
+class VendasTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = CustomUser.objects.create_user(
+            username='comprador', password='senha', email='comprador@example.com', cpf='1',
+        )
+        cls.marca = Marca.objects.create(nome='Marca')
+        produto = Produto.objects.create(nome='Runner', marca=cls.marca)
+        cor = Cor.objects.create(nome='Preto')
+        cls.variantes = [
+            DetalheProduto.objects.create(
+                produto=produto, cor=cor, tamanho=tamanho, genero='M', preco=100, estoque=10,
+            )
+            for tamanho in ('40', '42')
+        ]
+
+    @classmethod
+    def pedido(cls, *quantidades, dias_atras=0, metodo='pix'):
+        """Pedido com `quantidades[n]` unidades da variante n, criado há `dias_atras` dias"""
+        pedido = Pedido.objects.create(
+            cliente=cls.usuario, total=100 * sum(quantidades), endereco_envio='Rua A, 1', metodo_pagamento=metodo,
+        )
+        for variante, quantidade in zip(cls.variantes, quantidades):
+            if quantidade:
+                ItemPedido.objects.create(
+                    pedido=pedido, cliente=cls.usuario, detalhe_produto=variante,
+                    quantidade=quantidade, preco_unitario=100,
+                )
+        Pedido.objects.filter(id=pedido.id).update(criado_em=timezone.now() - timedelta(days=dias_atras))
+        return pedido
+
+    def tabela(self):
+        return set(VendaDiaria.objects.values_list(
+            'dia', 'detalhe_produto_id', 'marca_id', 'metodo_pagamento', 'unidades', 'faturamento', 'pedidos',
+        ))
+
+
+class ContabilizarTests(VendasTestCase):
+    def test_repetir_a_tarefa_nao_conta_de_novo(self):
+        primeiro, segundo = self.pedido(2, 1), self.pedido(1)
+
+        self.assertTrue(vendas.contabilizar(primeiro.id))
+        self.assertTrue(vendas.contabilizar(segundo.id))
+        somado = self.tabela()
+        self.assertFalse(vendas.contabilizar(primeiro.id))
+
+        self.assertEqual(self.tabela(), somado)
+        hoje = timezone.localdate()
+        self.assertEqual(somado, {
+            (hoje, self.variantes[0].id, self.marca.id, 'pix', 3, Decimal('300.00'), 2),
+            (hoje, self.variantes[1].id, self.marca.id, 'pix', 1, Decimal('100.00'), 1),
+        })
+
+
+class ReconstruirTests(VendasTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.pedidos = [
+            cls.pedido(1, 2, dias_atras=40),
+            cls.pedido(3, dias_atras=40, metodo='cartao'),
+            cls.pedido(1, dias_atras=2),
+            cls.pedido(0, 1),
+        ]
+        arquivar(timezone.now() - timedelta(days=30))
+
+    def contabilizado_pela_fila(self):
+        for pedido in self.pedidos:
+            vendas.contabilizar(pedido.id)
+        tabela = self.tabela()
+        VendaDiaria.objects.all().delete()
+        PedidoContabilizado.objects.all().delete()
+        return tabela
+
+    def test_igual_ao_contabilizado_pela_fila(self):
+        esperado = self.contabilizado_pela_fila()
+        VendaDiaria.objects.create(
+            dia=timezone.localdate() - timedelta(days=5), detalhe_produto=self.variantes[0], marca=self.marca,
+            metodo_pagamento='pix', unidades=9, faturamento=900, pedidos=9,
+        )
+        dias = []
+
+        self.assertEqual(vendas.reconstruir(tamanho_lote=1, progresso=lambda dia, total: dias.append(dia)), (4, 5))
+        self.assertEqual(self.tabela(), esperado)
+        self.assertEqual(len(dias), 3)
+        self.assertEqual(PedidoContabilizado.objects.count(), 4)
+        self.assertFalse(vendas.contabilizar(self.pedidos[-1].id))
+
+    def test_desde_so_refaz_os_dias_a_partir_dele(self):
+        esperado = self.contabilizado_pela_fila()
+        antigo = VendaDiaria.objects.create(
+            dia=timezone.localdate() - timedelta(days=40), detalhe_produto=self.variantes[0], marca=self.marca,
+            metodo_pagamento='pix', unidades=9, faturamento=900, pedidos=9,
+        )
+
+        self.assertEqual(vendas.reconstruir(desde=timezone.localdate() - timedelta(days=2)), (2, 2))
+        recentes = {linha for linha in self.tabela() if linha[0] != antigo.dia}
+        self.assertEqual(recentes, {linha for linha in esperado if linha[0] != antigo.dia})
+        # O dia anterior a `desde` fica como estava
+        self.assertEqual(VendaDiaria.objects.filter(dia=antigo.dia).get(), antigo)
+
+    def test_migracao_soma_o_historico(self):
+        esperado = self.contabilizado_pela_fila()
+        migracao = import_module('dashboard.migrations.0002_popular_vendas_diarias')
+
+        migracao.popular_vendas_diarias(apps, None)
+
+        self.assertEqual(self.tabela(), esperado)
+        self.assertEqual(PedidoContabilizado.objects.count(), 4)
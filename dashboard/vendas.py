@@ -0,0 +1,184 @@
+"""
+Vendas diárias (VendaDiaria) para os relatórios do dashboard.
+
+Cada pedido criado enfileira dashboard.contabilizar_pedido (pelo evento
+pedidos.pedido_criado), que soma os itens do pedido nas linhas de
+(dia, variante, marca, método de pagamento). A soma roda no worker e não
+na transação da finalização: numa venda disputada todos os pedidos cairiam
+na mesma linha, que viraria um ponto de espera no checkout.
+
+A fila entrega "pelo menos uma vez"; PedidoContabilizado, gravado na mesma
+transação da soma, faz uma repetição da tarefa não contar o pedido de novo.
+`pedidos` é o número de pedidos com a variante no dia, então somar linhas
+de variantes diferentes conta em dobro os pedidos com mais de uma.
+
+O histórico anterior à tabela é somado pela migração
+0002_popular_vendas_diarias. reconstruir() refaz a tabela a partir de
+Pedido/ItemPedido e de PedidoArquivado, um dia por transação: cada uma é
+curta e não segura o checkout nem os workers durante a reconstrução toda.
+No SQLite a transação de um dia já exclui os workers; nos demais bancos,
+pare os workers enquanto reconstrói.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+from dashboard.models import PedidoContabilizado, VendaDiaria
+from menu.models import DetalheProduto
+from pedidos.models import ItemPedido, Pedido, PedidoArquivado
+
+TAMANHO_LOTE = 1000
+
+
+def _itens_recentes(pedido_ids):
+    """(pedido_id, criado_em, metodo, variante_id, marca_id, quantidade, preco) dos pedidos em Pedido"""
+    return ItemPedido.objects.filter(pedido_id__in=pedido_ids).values_list(
+        'pedido_id', 'pedido__criado_em', 'pedido__metodo_pagamento',
+        'detalhe_produto_id', 'detalhe_produto__produto__marca_id', 'quantidade', 'preco_unitario',
+    )
+
+
+def _itens_arquivados(pedido_ids):
+    """Os mesmos campos de _itens_recentes, lidos do JSON de PedidoArquivado"""
+    pedidos = list(PedidoArquivado.objects.filter(id__in=pedido_ids).values_list(
+        'id', 'criado_em', 'metodo_pagamento', 'itens'
+    ))
+    variante_ids = {item['variante_id'] for *_, itens in pedidos for item in itens}
+    marcas = dict(DetalheProduto.objects.filter(id__in=variante_ids).values_list('id', 'produto__marca_id'))
+    return [
+        (pk, criado_em, metodo, item['variante_id'], marcas[item['variante_id']],
+         item['quantidade'], Decimal(item['preco']))
+        for pk, criado_em, metodo, itens in pedidos
+        for item in itens
+        if item['variante_id'] in marcas  # Variante apagada depois do arquivamento
+    ]
+
+
+def _acumular(fatos, itens):
+    """Soma os itens em fatos[(dia, variante_id, marca_id, metodo)] = [unidades, faturamento, pedidos]"""
+    contados = set()
+    for pedido_id, criado_em, metodo, variante_id, marca_id, quantidade, preco in itens:
+        chave = (timezone.localdate(criado_em), variante_id, marca_id, metodo)
+        fato = fatos[chave]
+        fato[0] += quantidade
+        fato[1] += quantidade * preco
+        if (pedido_id, chave) not in contados:
+            contados.add((pedido_id, chave))
+            fato[2] += 1
+    return fatos
+
+
+def _novos_fatos():
+    return defaultdict(lambda: [0, Decimal(0), 0])
+
+
+def _somar(dia, variante_id, marca_id, metodo, unidades, faturamento, pedidos):
+    linhas = VendaDiaria.objects.filter(
+        dia=dia, detalhe_produto_id=variante_id, marca_id=marca_id, metodo_pagamento=metodo
+    )
+    incrementos = {
+        'unidades': F('unidades') + unidades,
+        'faturamento': F('faturamento') + faturamento,
+        'pedidos': F('pedidos') + pedidos,
+    }
+    if linhas.update(**incrementos):
+        return
+    try:
+        with transaction.atomic():
+            VendaDiaria.objects.create(
+                dia=dia, detalhe_produto_id=variante_id, marca_id=marca_id, metodo_pagamento=metodo,
+                unidades=unidades, faturamento=faturamento, pedidos=pedidos,
+            )
+    except IntegrityError:
+        # Outro worker criou a linha entre o UPDATE e o INSERT
+        linhas.update(**incrementos)
+
+
+def contabilizar(pedido_id):
+    """Soma o pedido em VendaDiaria, uma vez só; retorna se somou agora"""
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                PedidoContabilizado.objects.create(pedido_id=pedido_id)
+        except IntegrityError:
+            return False
+        fatos = _acumular(_novos_fatos(), [*_itens_recentes([pedido_id]), *_itens_arquivados([pedido_id])])
+        for chave, valores in fatos.items():
+            _somar(*chave, *valores)
+    return True
+
+
+def _lotes(pedidos, tamanho_lote):
+    ultimo = 0
+    while ids := list(
+        pedidos.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:tamanho_lote]
+    ):
+        yield ids
+        ultimo = ids[-1]
+
+
+def _inicio_do_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def _primeiro_dia():
+    """O dia mais antigo com pedido ou venda somada; None se não há nenhum"""
+    instantes = [
+        modelo.objects.aggregate(primeiro=Min('criado_em'))['primeiro'] for modelo in (Pedido, PedidoArquivado)
+    ]
+    dias = [timezone.localdate(instante) for instante in instantes if instante]
+    dias.append(VendaDiaria.objects.aggregate(primeiro=Min('dia'))['primeiro'])
+    return min(filter(None, dias), default=None)
+
+
+def reconstruir_dia(dia, tamanho_lote=TAMANHO_LOTE):
+    """Refaz as linhas de VendaDiaria de `dia` numa transação; retorna (pedidos, linhas)"""
+    periodo = {'criado_em__gte': _inicio_do_dia(dia), 'criado_em__lt': _inicio_do_dia(dia + timedelta(days=1))}
+    fatos = _novos_fatos()
+    total = 0
+    with transaction.atomic():
+        VendaDiaria.objects.filter(dia=dia).delete()
+        for pedidos, ler_itens in (
+            (Pedido.objects.filter(**periodo), _itens_recentes),
+            (PedidoArquivado.objects.filter(**periodo), _itens_arquivados),
+        ):
+            for ids in _lotes(pedidos, tamanho_lote):
+                _acumular(fatos, ler_itens(ids))
+                # Tarefas ainda na fila para estes pedidos não somam de novo
+                PedidoContabilizado.objects.bulk_create(
+                    [PedidoContabilizado(pedido_id=pk) for pk in ids], ignore_conflicts=True
+                )
+                total += len(ids)
+        VendaDiaria.objects.bulk_create(
+            [
+                VendaDiaria(
+                    dia=dia, detalhe_produto_id=variante_id, marca_id=marca_id, metodo_pagamento=metodo,
+                    unidades=unidades, faturamento=faturamento, pedidos=quantidade_pedidos,
+                )
+                for (dia, variante_id, marca_id, metodo), (unidades, faturamento, quantidade_pedidos) in fatos.items()
+            ],
+            batch_size=tamanho_lote,
+        )
+    return total, len(fatos)
+
+
+def reconstruir(desde=None, tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """
+    Refaz VendaDiaria a partir dos pedidos, recentes e arquivados, dia a
+    dia; com `desde` (date), só os dias a partir dele. Retorna (pedidos, linhas).
+    """
+    dia = desde or _primeiro_dia()
+    pedidos = linhas = 0
+    if dia is None:
+        return pedidos, linhas
+    hoje = timezone.localdate()
+    while dia <= hoje:
+        lidos, criadas = reconstruir_dia(dia, tamanho_lote)
+        pedidos += lidos
+        linhas += criadas
+        if progresso and lidos:
+            progresso(dia, pedidos)
+        dia += timedelta(days=1)
+    return pedidos, linhas
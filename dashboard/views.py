@@ -4,7 +4,10 @@ from pedidos.models import ItemPedido
 from menu.models import Produto
 from datetime import datetime
 from django.db.models import Count,Sum
+from django.db.models.functions import ExtractMonth
+from django.utils import timezone
 from collections import Counter
+from dashboard.models import VendaDiaria
 
 
 def graph(request):
@@ -21,80 +24,42 @@ def graph(request):
 
 
 
+MESES = ['jan', 'fev', 'mar', 'abr', 'mai', 'jun', 'jul', 'ago', 'set', 'out', 'nov', 'dez']
+
+
+def _por_mes(campo, ano):
+    """Soma de `campo` de VendaDiaria em cada mês do ano, de janeiro a dezembro"""
+    totais = dict(
+        VendaDiaria.objects.filter(dia__year=ano)
+        .annotate(mes=ExtractMonth('dia'))
+        .values('mes')
+        .annotate(total=Sum(campo))
+        .values_list('mes', 'total')
+    )
+    return [totais.get(mes, 0) for mes in range(1, 13)]
+
+
 def relatorio_faturamento(request):
-    x = ItemPedido.objects.all()
-    
-    meses = ['jan', 'fev', 'mar', 'abr', 'mai', 'jun', 'jul', 'ago', 'set', 'out', 'nov', 'dez']
-    data = []
-    labels = []
-    cont = 0
-    mes = 0
-    ano = datetime.now().year
-    print(x)
-    for m in range(0,12): 
-        
-        # if mes == 0:
-        #     mes = 12
-        #     ano -= 1
-        
-        y = sum([i.produto.preco * i.quantidade for i in x if i.data.month == m+1 and i.data.year == ano])
-        
-        labels.append(meses[m])
-        data.append(y)
-        cont += 1
-        print(data, labels)
-    data_json = {'data': data[::], 'labels': labels[::]}
-     
-    return JsonResponse(data_json)
+    # Lido das vendas diárias (dashboard/vendas.py), não dos itens dos pedidos
+    data = [float(total) for total in _por_mes('faturamento', timezone.localdate().year)]
+    return JsonResponse({'data': data, 'labels': MESES})
 
 
 def relatorio_vendas(request):
-    x = ItemPedido.objects.all()
-    print(x[0], 'XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX')
-    meses = ['jan', 'fev', 'mar', 'abr', 'mai', 'jun', 'jul', 'ago', 'set', 'out', 'nov', 'dez']
-    data = []
-    labels = []
-    cont = 0
-    mes = 0
-    ano = datetime.now().year
-    for m in range(0,12): 
-        
-        # if mes == 0:
-        #     mes = 12
-        #     ano -= 1
-        
-        y = sum([i.quantidade for i in x if i.data.month == m+1 and i.data.year == ano])
-        
-        labels.append(meses[m])
-        data.append(y)
-        cont += 1
-        print(data, labels)
-    data_json = {'data': data[::], 'labels': labels[::]}
-     
-    return JsonResponse(data_json)
+    data = _por_mes('unidades', timezone.localdate().year)
+    return JsonResponse({'data': data, 'labels': MESES})
+
 
 def relatorio_produtos(request):
-    produtos = (ItemPedido.objects
-          .select_related('menu__produto')  # Fazendo a junção com a tabela Produto
-          .values('produto__categoria')  # Incluindo a categoria do produto
-          .annotate(total=Count('id')))  
-    print(produtos)
-    label = []
-    data = []
-    for produto_unico in produtos:
-        # quantidade_vendas = ItemPedido.objects.filter(produto=produto_unico).aggregate(Count('id'))
-        # print(quantidade_vendas)
-        if not produto_unico['total']:
-            produto_unico['total'] = 0
-        label.append(produto_unico['produto__categoria'])
-        data.append(produto_unico['total'])
-
-    x = list(zip(label, data))
-
-    x.sort(key=lambda x: x[1], reverse=True)
-    x = list(zip(*x))
-    print(x)
-    return JsonResponse({'labels': x[0][:], 'data': x[1][:]})
+    # Os 10 produtos com mais unidades vendidas
+    produtos = (
+        VendaDiaria.objects.values('detalhe_produto__produto__nome')
+        .annotate(total=Sum('unidades'))
+        .order_by('-total')[:10]
+    )
+    label = [produto['detalhe_produto__produto__nome'] for produto in produtos]
+    data = [produto['total'] for produto in produtos]
+    return JsonResponse({'labels': label, 'data': data})
 
 
 def relatorio_clientes(request):
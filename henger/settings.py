@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'funcionarios',
     'pedidos',
     'dashboard',
+    'tarefas',
 ]
 
 MIDDLEWARE = [
@@ -52,6 +53,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'pedidos.middleware.CarrinhoMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -69,6 +71,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'pedidos.context_processors.carrinho',
             ],
         },
     },
@@ -84,9 +87,59 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Escritas concorrentes (carrinho, checkout) esperam a vez em vez de
+        # falhar com "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # Banco de testes em arquivo: os testes de concorrência usam várias threads
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Com mais de um processo (gunicorn, uwsgi) use um backend compartilhado,
+# por exemplo FileBasedCache ('LOCATION': BASE_DIR / 'cache') ou
+# RedisCache ('LOCATION': 'redis://127.0.0.1:6379'), para que todos
+# enxerguem a mesma versão do catálogo.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'henger',
+    }
+}
+
+# Carrinho de compras
+# 'banco': cada clique grava direto em ItemCarrinho.
+# 'cache': o carrinho vive no cache e é gravado em ItemCarrinho no checkout,
+# quando fica pendente por mais de CARRINHO_INTERVALO_PERSISTENCIA segundos e
+# pelo comando `persistir_carrinhos` (agendar no cron com o mesmo intervalo).
+# Requer um cache compartilhado entre os processos (Redis, Memcached).
+CARRINHO_ARMAZENAMENTO = 'banco'
+CARRINHO_INTERVALO_PERSISTENCIA = 60
+
+# Por quantos minutos o estoque fica reservado ao abrir a finalização do
+# pedido. Reservas vencidas são ignoradas; `expirar_reservas` as apaga.
+RESERVA_ESTOQUE_MINUTOS = 10
+
+# Validade das chaves de idempotência da finalização do pedido
+IDEMPOTENCIA_HORAS = 24
+
+# E-mails (confirmação de pedido, alertas de estoque) são enviados pelo
+# worker da fila: `python manage.py processar_tarefas`.
+# Em desenvolvimento são impressos no console.
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'Henger <pedidos@henger.com.br>'
+ESTOQUE_MINIMO_ALERTA = 5
+
+# Pedidos mais antigos que isso vão para PedidoArquivado (`arquivar_pedidos`)
+ARQUIVAR_PEDIDOS_APOS_DIAS = 365
+
 # Custom user
 AUTH_USER_MODEL = 'clientes.CustomUser'
 
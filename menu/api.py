@@ -0,0 +1,116 @@
+"""
+API JSON somente leitura do catálogo (lista de produtos, produto com
+variantes e marcas) para o app mobile e os feeds de parceiros.
+
+As respostas levam ETag forte e Last-Modified derivados da versão do
+catálogo (menu/versao.py). Um GET condicional com a versão atual recebe
+304 antes de a view rodar, sem nenhuma consulta ao banco. Vendas não mudam
+a versão do catálogo: o produto usa também a versão de estoque dele, e as
+listagens a de estoque_publicado(), com o mesmo atraso da grade da vitrine.
+Use ?campos=id,nome,... para receber só os campos necessários.
+"""
+import hashlib
+from datetime import datetime, timezone
+from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET
+from menu.models import Marca
+from menu.resumo import produtos_do_catalogo
+from menu.variantes import matriz_variantes
+from menu.versao import catalogo_alterado_em, estoque_publicado, versao_catalogo, versao_estoque_produto
+from menu.views import grade_do_catalogo
+
+CAMPOS_PRODUTO = (
+    'id', 'nome', 'descricao', 'marca_id', 'marca', 'imagem',
+    'preco_minimo', 'estoque_total', 'qtd_variantes',
+)
+
+
+def _etag(request, *args, **kwargs):
+    parametros = sorted(
+        (nome, valor) for nome, valores in request.GET.lists() for valor in valores
+    )
+    if 'id' in kwargs:
+        estoque = versao_estoque_produto(kwargs['id'])
+    else:
+        estoque = estoque_publicado()[0]
+    conteudo = f'{versao_catalogo()}|{estoque}|{request.path}|{parametros}'
+    return hashlib.sha1(conteudo.encode()).hexdigest()
+
+
+def _ultima_modificacao(request, *args, **kwargs):
+    estoque = datetime.fromtimestamp(int(estoque_publicado()[1]), tz=timezone.utc)
+    return max(catalogo_alterado_em(), estoque)
+
+
+def _endpoint(view):
+    """GET com ETag/Last-Modified do catálogo e cache revalidável pelo cliente"""
+    return require_GET(
+        cache_control(public=True, max_age=0, must_revalidate=True)(
+            condition(etag_func=_etag, last_modified_func=_ultima_modificacao)(view)
+        )
+    )
+
+
+def _resposta(dados, status=200):
+    return JsonResponse(dados, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def _campos_pedidos(request):
+    pedidos = request.GET.get('campos')
+    if not pedidos:
+        return CAMPOS_PRODUTO
+    campos = tuple(c for c in pedidos.split(',') if c in CAMPOS_PRODUTO)
+    return campos or CAMPOS_PRODUTO
+
+
+def _serializar_produto(produto, campos):
+    valores = {
+        'id': lambda: produto.id,
+        'nome': lambda: produto.nome,
+        'descricao': lambda: produto.descricao,
+        'marca_id': lambda: produto.marca_id,
+        'marca': lambda: produto.marca.nome,
+        'imagem': lambda: produto.imagem.url if produto.imagem else None,
+        'preco_minimo': lambda: produto.preco_minimo,
+        'estoque_total': lambda: produto.estoque_total,
+        'qtd_variantes': lambda: produto.qtd_variantes,
+    }
+    return {campo: valores[campo]() for campo in campos}
+
+
+@_endpoint
+def produtos(request):
+    """
+    Lista paginada por cursor. Aceita os mesmos filtros da vitrine:
+    ?q= (busca), facetas (?tamanho=42&marca=3...) e ?cursor=.
+    """
+    query = request.GET.get('q', '').strip() or None
+    grade = grade_do_catalogo(request, query)
+    page_obj = grade['page_obj']
+    campos = _campos_pedidos(request)
+    return _resposta({
+        'produtos': [_serializar_produto(produto, campos) for produto in page_obj],
+        'proximo': page_obj.next_cursor,
+        'anterior': page_obj.previous_cursor,
+    })
+
+
+@_endpoint
+def produto(request, id):
+    produto = produtos_do_catalogo().filter(id=id).first()
+    if produto is None:
+        return _resposta({'status': 'error', 'message': 'Produto não encontrado'}, status=404)
+    dados = _serializar_produto(produto, _campos_pedidos(request))
+    dados['variantes'] = matriz_variantes(produto.id)
+    return _resposta(dados)
+
+
+@_endpoint
+def marcas(request):
+    return _resposta({
+        'marcas': [
+            {'id': pk, 'nome': nome}
+            for pk, nome in Marca.objects.order_by('nome').values_list('id', 'nome')
+        ],
+    })
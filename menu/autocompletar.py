@@ -0,0 +1,185 @@
+"""
+Autocompletar da busca: índice de prefixos em memória sobre os nomes de
+produtos do catálogo (produtos_do_catalogo(), os que têm variantes),
+marcas (Marca.nome) e cores (Cor.nome).
+
+Cada nome é normalizado como na busca (minúsculas, sem acentos) e gera
+uma chave por palavra, a partir dela até o fim do nome: "Air Max 90" vira
+"air max 90", "max 90" e "90". As chaves ficam numa lista ordenada, e a
+consulta é uma busca binária (bisect) pelo prefixo digitado seguida de uma
+varredura curta, sem tocar no banco.
+
+O índice é montado na primeira consulta do processo. Escritas em Produto,
+Marca e Cor incrementam uma versão própria no cache (as de estoque não
+afetam as sugestões); o processo que fez a escrita aplica a mudança no
+próprio índice e os demais reconstroem quando veem a versão nova.
+Variantes criadas ou apagadas podem pôr ou tirar um produto do catálogo;
+produtos_alterados() só incrementa a versão quando isso acontece.
+"""
+import threading
+from bisect import bisect_left
+from django.urls import reverse
+from menu.busca import normalizar, tokens
+from menu.versao import versao, incrementar_versao
+
+CHAVE_VERSAO = 'menu:autocompletar:versao'
+LIMITE_SUGESTOES = 8
+
+PRODUTO, MARCA, COR = 'produto', 'marca', 'cor'
+
+
+def chaves_do_nome(nome):
+    """Sufixos do nome normalizado que começam em cada palavra"""
+    palavras = tokens(nome)
+    return {' '.join(palavras[inicio:]) for inicio in range(len(palavras))}
+
+
+def _url(tipo, pk):
+    if tipo == PRODUTO:
+        return reverse('menu:produto_detalhado', args=[pk])
+    if tipo == MARCA:
+        return f"{reverse('menu:index')}?marca={pk}"
+    return f"{reverse('menu:index')}?cor={pk}"
+
+
+class IndiceAutocompletar:
+    def __init__(self, versao_indice):
+        self.versao = versao_indice
+        # (chaves ordenadas, alvos): alvos[i] é a entidade de chaves[i].
+        # Trocado de uma vez nas atualizações, então quem consulta sem a
+        # trava sempre vê as duas listas alinhadas.
+        self.pares = ([], [])
+        self.entidades = {}     # (tipo, id) -> {'tipo', 'id', 'rotulo', 'url'}
+        self.chaves_de = {}     # (tipo, id) -> chaves usadas, para remoção
+
+    @classmethod
+    def montar(cls, versao_indice):
+        indice = cls(versao_indice)
+        pares = []
+        for tipo in (PRODUTO, MARCA, COR):
+            for pk, nome in _nomes(tipo).values_list('id', 'nome').iterator():
+                alvo = (tipo, pk)
+                indice._registrar(alvo, nome)
+                pares.extend((chave, alvo) for chave in indice.chaves_de[alvo])
+        pares.sort()
+        indice.pares = ([chave for chave, _ in pares], [alvo for _, alvo in pares])
+        return indice
+
+    def _registrar(self, alvo, nome):
+        tipo, pk = alvo
+        self.entidades[alvo] = {'tipo': tipo, 'id': pk, 'rotulo': nome, 'url': _url(tipo, pk)}
+        self.chaves_de[alvo] = sorted(chaves_do_nome(nome))
+
+    def atualizar(self, alvo, nome):
+        """Troca as chaves de uma entidade; `nome=None` remove"""
+        chaves, alvos = list(self.pares[0]), list(self.pares[1])
+        for chave in self.chaves_de.pop(alvo, ()):
+            posicao = bisect_left(chaves, chave)
+            while posicao < len(chaves) and chaves[posicao] == chave:
+                if alvos[posicao] == alvo:
+                    del chaves[posicao], alvos[posicao]
+                    break
+                posicao += 1
+
+        if nome is None:
+            self.entidades.pop(alvo, None)
+        else:
+            self._registrar(alvo, nome)
+            for chave in self.chaves_de[alvo]:
+                # Mesma ordem de montar(): por chave e depois por alvo
+                posicao = bisect_left(chaves, chave)
+                while posicao < len(chaves) and chaves[posicao] == chave and alvos[posicao] < alvo:
+                    posicao += 1
+                chaves.insert(posicao, chave)
+                alvos.insert(posicao, alvo)
+        self.pares = (chaves, alvos)
+
+    def sugerir(self, texto, limite=LIMITE_SUGESTOES):
+        prefixo = ' '.join(tokens(texto))
+        if not prefixo:
+            return []
+        # Mantém o espaço final: "air " só casa com nomes que têm outra palavra
+        if normalizar(texto).endswith(' '):
+            prefixo += ' '
+
+        chaves, alvos = self.pares
+        sugestoes, vistos = [], set()
+        posicao = bisect_left(chaves, prefixo)
+        while posicao < len(chaves) and len(sugestoes) < limite:
+            if not chaves[posicao].startswith(prefixo):
+                break
+            alvo = alvos[posicao]
+            entidade = self.entidades.get(alvo)
+            if entidade is not None and alvo not in vistos:
+                vistos.add(alvo)
+                sugestoes.append(entidade)
+            posicao += 1
+        return sugestoes
+
+
+def _nomes(tipo):
+    """Queryset das entidades de `tipo` que entram nas sugestões"""
+    from menu.models import Marca, Cor
+    from menu.resumo import produtos_do_catalogo
+
+    if tipo == PRODUTO:
+        return produtos_do_catalogo()
+    return {MARCA: Marca, COR: Cor}[tipo].objects.all()
+
+
+_indice = None
+_trava = threading.Lock()
+
+
+def obter_indice():
+    """Índice do processo, reconstruído se a versão mudou em outro processo"""
+    global _indice
+    atual = versao(CHAVE_VERSAO)
+    indice = _indice
+    if indice is not None and indice.versao == atual:
+        return indice
+    with _trava:
+        if _indice is None or _indice.versao != atual:
+            _indice = IndiceAutocompletar.montar(atual)
+        return _indice
+
+
+def sugerir(texto, limite=LIMITE_SUGESTOES):
+    return obter_indice().sugerir(texto, limite)
+
+
+def _aplicar(tipo, nomes):
+    """
+    Incrementa a versão e, se o índice deste processo estava em dia, aplica
+    só as mudanças ({id: nome, ou None para remover}) em vez de reconstruir.
+    """
+    nova = incrementar_versao(CHAVE_VERSAO)
+    indice = _indice
+    if indice is None:
+        return
+    with _trava:
+        if indice is _indice and indice.versao == nova - 1:
+            for pk, nome in nomes.items():
+                indice.atualizar((tipo, pk), nome)
+            indice.versao = nova
+
+
+def entidade_alterada(tipo, pk):
+    """Chamado pelos sinais após o commit de Produto, Marca ou Cor"""
+    nome = _nomes(tipo).filter(id=pk).values_list('nome', flat=True).first()
+    _aplicar(tipo, {pk: nome})
+
+
+def produtos_alterados(produto_ids):
+    """
+    Chamado quando variantes mudam (menu.signals.variantes_alteradas), com
+    ResumoProduto já atualizado. Se o índice deste processo está em dia e
+    nenhum produto entrou ou saiu do catálogo, não incrementa a versão.
+    """
+    nomes = dict(_nomes(PRODUTO).filter(id__in=produto_ids).values_list('id', 'nome'))
+    indice = _indice
+    if indice is not None and indice.versao == versao(CHAVE_VERSAO):
+        produto_ids = [pk for pk in produto_ids if ((PRODUTO, pk) in indice.entidades) != (pk in nomes)]
+        if not produto_ids:
+            return
+    _aplicar(PRODUTO, {pk: nomes.get(pk) for pk in produto_ids})
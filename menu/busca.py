@@ -0,0 +1,327 @@
+"""
+Índice de busca textual do catálogo.
+
+Usa FTS5 quando o banco é SQLite e tsvector/GIN quando é PostgreSQL.
+Em outros bancos cai para a busca antiga com icontains.
+O texto é normalizado (minúsculas, sem acentos) antes de ser indexado
+e antes de ser consultado, então "tenis" encontra "Tênis".
+
+Os resultados são paginados no banco: cada página é uma consulta com
+LIMIT a partir da chave (relevância, id) do último item. Em todos os
+bancos a relevância cresce do resultado mais relevante para o menos
+relevante, então a ordem é sempre crescente. As contagens das facetas
+da busca usam o conjunto dos resultados mais relevantes, limitado a
+MAXIMO_CONJUNTO e guardado no cache pela versão do catálogo e do índice.
+"""
+import hashlib
+import re
+import unicodedata
+from django.core.cache import cache
+from django.db import connection as conexao_padrao, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from menu.versao import incrementar_versao, versao
+from utils.paginacao import CursorPaginator, decodificar_cursor
+
+TABELA_FTS = 'menu_busca_fts'
+TABELA_PG = 'menu_busca_pg'
+TAMANHO_LOTE = 500
+CHAVE_VERSAO = 'menu:busca:versao'
+MAXIMO_CONJUNTO = 5000
+TEMPO_CONJUNTO = 60 * 10
+
+
+def normalizar(texto):
+    """Converte para minúsculas e remove acentos"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def tokens(texto):
+    return re.findall(r'\w+', normalizar(texto))
+
+
+def _pagina_sql(consulta, parametros, chave, para_frente, limite):
+    """
+    Envolve `consulta` (colunas id e relevancia) com o filtro da chave
+    (relevância, id) e o LIMIT. Sem chave, começa do primeiro resultado.
+    """
+    comparacao, ordem = ('>', 'ASC') if para_frente else ('<', 'DESC')
+    filtro = ''
+    if chave is not None:
+        filtro = f"WHERE relevancia {comparacao} %s OR (relevancia = %s AND id {comparacao} %s)"
+        parametros = [*parametros, chave[0], chave[0], chave[1]]
+    return (
+        f"SELECT id, relevancia FROM ({consulta}) resultados {filtro} "
+        f"ORDER BY relevancia {ordem}, id {ordem} LIMIT %s",
+        [*parametros, limite],
+    )
+
+
+class _BuscaSQLite:
+    def criar(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_FTS} USING fts5("
+            "nome, descricao, marca, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+    def remover_estrutura(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABELA_FTS}")
+
+    def indexar(self, cursor, linhas):
+        self.remover(cursor, [linha[0] for linha in linhas])
+        cursor.executemany(
+            f"INSERT INTO {TABELA_FTS} (rowid, nome, descricao, marca) VALUES (%s, %s, %s, %s)",
+            [(pk, normalizar(nome), normalizar(descricao), normalizar(marca))
+             for pk, nome, descricao, marca in linhas],
+        )
+
+    def remover(self, cursor, produto_ids):
+        for inicio in range(0, len(produto_ids), TAMANHO_LOTE):
+            lote = produto_ids[inicio:inicio + TAMANHO_LOTE]
+            marcadores = ', '.join(['%s'] * len(lote))
+            cursor.execute(f"DELETE FROM {TABELA_FTS} WHERE rowid IN ({marcadores})", lote)
+
+    def buscar(self, cursor, query, chave, para_frente, limite):
+        # Cada termo vira um prefixo entre aspas; termos separados = AND
+        consulta = ' '.join(f'"{termo}"*' for termo in tokens(query))
+        # bm25: quanto menor, mais relevante. Pesos: nome > marca > descrição
+        cursor.execute(*_pagina_sql(
+            f"SELECT f.rowid AS id, bm25({TABELA_FTS}, 10.0, 1.0, 5.0) AS relevancia FROM {TABELA_FTS} f "
+            "JOIN menu_resumoproduto r ON r.produto_id = f.rowid AND r.qtd_variantes > 0 "
+            f"WHERE {TABELA_FTS} MATCH %s",
+            [consulta], chave, para_frente, limite,
+        ))
+        return cursor.fetchall()
+
+
+class _BuscaPostgres:
+    def criar(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABELA_PG} ("
+            "produto_id bigint PRIMARY KEY REFERENCES menu_produto(id) ON DELETE CASCADE, "
+            "documento tsvector NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TABELA_PG}_documento ON {TABELA_PG} USING GIN (documento)"
+        )
+
+    def remover_estrutura(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABELA_PG}")
+
+    def indexar(self, cursor, linhas):
+        cursor.executemany(
+            f"INSERT INTO {TABELA_PG} (produto_id, documento) VALUES (%s, "
+            "setweight(to_tsvector('portuguese', %s), 'A') || "
+            "setweight(to_tsvector('portuguese', %s), 'B') || "
+            "setweight(to_tsvector('portuguese', %s), 'C')) "
+            "ON CONFLICT (produto_id) DO UPDATE SET documento = EXCLUDED.documento",
+            [(pk, normalizar(nome), normalizar(marca), normalizar(descricao))
+             for pk, nome, descricao, marca in linhas],
+        )
+
+    def remover(self, cursor, produto_ids):
+        cursor.execute(f"DELETE FROM {TABELA_PG} WHERE produto_id = ANY(%s)", [list(produto_ids)])
+
+    def buscar(self, cursor, query, chave, para_frente, limite):
+        consulta = ' & '.join(f"{termo}:*" for termo in tokens(query))
+        # ts_rank negativo: como no bm25, quanto menor, mais relevante
+        cursor.execute(*_pagina_sql(
+            f"SELECT b.produto_id AS id, -ts_rank(b.documento, q) AS relevancia FROM {TABELA_PG} b "
+            "JOIN menu_resumoproduto r ON r.produto_id = b.produto_id AND r.qtd_variantes > 0, "
+            "to_tsquery('portuguese', %s) q "
+            "WHERE b.documento @@ q",
+            [consulta], chave, para_frente, limite,
+        ))
+        return cursor.fetchall()
+
+
+class _BuscaGenerica:
+    """Sem índice (outros bancos): icontains, com o nome antes da marca e da descrição"""
+
+    def buscar(self, cursor, query, chave, para_frente, limite):
+        from menu.models import Produto
+
+        produtos = Produto.objects.filter(
+            Q(nome__icontains=query)
+            | Q(descricao__icontains=query)
+            | Q(marca__nome__icontains=query),
+            resumo__qtd_variantes__gt=0,
+        ).annotate(relevancia=Case(
+            When(nome__icontains=query, then=Value(0)),
+            When(marca__nome__icontains=query, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ))
+        if chave is not None:
+            comparacao = 'gt' if para_frente else 'lt'
+            produtos = produtos.filter(
+                Q(**{f'relevancia__{comparacao}': chave[0]})
+                | Q(relevancia=chave[0], **{f'id__{comparacao}': chave[1]})
+            )
+        ordem = ('relevancia', 'id') if para_frente else ('-relevancia', '-id')
+        return list(produtos.order_by(*ordem).values_list('id', 'relevancia')[:limite])
+
+
+def _backend(conexao=None):
+    vendor = (conexao or conexao_padrao).vendor
+    if vendor == 'sqlite':
+        return _BuscaSQLite()
+    if vendor == 'postgresql':
+        return _BuscaPostgres()
+    return None
+
+
+def criar_estrutura(conexao, linhas=()):
+    """Cria a tabela do índice e indexa as linhas (id, nome, descricao, marca)"""
+    backend = _backend(conexao)
+    if backend is None:
+        return
+    with conexao.cursor() as cursor:
+        backend.criar(cursor)
+        linhas = list(linhas)
+        for inicio in range(0, len(linhas), TAMANHO_LOTE):
+            backend.indexar(cursor, linhas[inicio:inicio + TAMANHO_LOTE])
+
+
+def remover_estrutura(conexao):
+    backend = _backend(conexao)
+    if backend is not None:
+        with conexao.cursor() as cursor:
+            backend.remover_estrutura(cursor)
+
+
+def _linhas(produtos):
+    return produtos.values_list('id', 'nome', 'descricao', 'marca__nome')
+
+
+def indexar_produtos(produto_ids):
+    """Atualiza o índice apenas dos produtos informados"""
+    from menu.models import Produto
+
+    backend = _backend()
+    if backend is None:
+        return
+    ids = list(set(produto_ids))
+    with conexao_padrao.cursor() as cursor:
+        for inicio in range(0, len(ids), TAMANHO_LOTE):
+            lote = ids[inicio:inicio + TAMANHO_LOTE]
+            linhas = list(_linhas(Produto.objects.filter(id__in=lote)))
+            encontrados = {linha[0] for linha in linhas}
+            backend.indexar(cursor, linhas)
+            removidos = [pk for pk in lote if pk not in encontrados]
+            if removidos:
+                backend.remover(cursor, removidos)
+    incrementar_versao(CHAVE_VERSAO)
+
+
+def remover_produtos(produto_ids):
+    backend = _backend()
+    if backend is not None:
+        with conexao_padrao.cursor() as cursor:
+            backend.remover(cursor, list(produto_ids))
+        incrementar_versao(CHAVE_VERSAO)
+
+
+def reconstruir_indice():
+    """Recria o índice inteiro a partir de Produto; retorna quantos foram indexados"""
+    from menu.models import Produto
+
+    backend = _backend()
+    if backend is None:
+        return 0
+    total = 0
+    with transaction.atomic(), conexao_padrao.cursor() as cursor:
+        backend.remover_estrutura(cursor)
+        backend.criar(cursor)
+        lote = []
+        for linha in _linhas(Produto.objects.order_by('id')).iterator(chunk_size=TAMANHO_LOTE):
+            lote.append(linha)
+            if len(lote) == TAMANHO_LOTE:
+                backend.indexar(cursor, lote)
+                total += len(lote)
+                lote = []
+        if lote:
+            backend.indexar(cursor, lote)
+            total += len(lote)
+    incrementar_versao(CHAVE_VERSAO)
+    return total
+
+
+def _buscar(query, chave=None, para_frente=True, limite=MAXIMO_CONJUNTO):
+    """Até `limite` pares (id, relevancia) depois (ou antes) da chave"""
+    if not tokens(query):
+        return []
+    backend = _backend() or _BuscaGenerica()
+    with conexao_padrao.cursor() as cursor:
+        return [tuple(linha) for linha in backend.buscar(cursor, query, chave, para_frente, limite)]
+
+
+def buscar_produtos(query, limite=MAXIMO_CONJUNTO):
+    """Ids dos `limite` produtos com variantes mais relevantes para a busca"""
+    return [pk for pk, _ in _buscar(query, limite=limite)]
+
+
+def conjunto_da_busca(query, indice):
+    """
+    Bitset (nas posições do índice de facetas) dos resultados da busca
+    usados nas contagens das facetas. Guardado no cache até o catálogo ou
+    o índice de busca mudarem.
+    """
+    termos = hashlib.sha1(' '.join(tokens(query)).encode()).hexdigest()
+    chave = f'menu:busca:conjunto:{indice.versao}:{versao(CHAVE_VERSAO)}:{termos}'
+    conjunto = cache.get(chave)
+    if conjunto is None:
+        conjunto = indice.bitset_de(buscar_produtos(query))
+        cache.set(chave, conjunto, TEMPO_CONJUNTO)
+    return conjunto
+
+
+class PaginadorBusca(CursorPaginator):
+    """
+    Resultados da busca paginados por cursor na chave (relevância, id).
+    Os itens das páginas são pares (id, relevancia). `restringir`, se
+    dado, recebe uma lista de ids e devolve os que ficam (os filtros de
+    facetas); a página continua nos lotes seguintes até completar.
+    """
+
+    def __init__(self, query, per_page, restringir=None):
+        super().__init__([], per_page)
+        self.query = query
+        self.restringir = restringir
+        self._campos = [('relevancia', False), ('id', False)]
+
+    def get_page(self, cursor=None):
+        posicao = decodificar_cursor(cursor)
+        if posicao is not None and not self._chave_valida(posicao[1]):
+            # Cursor de outra listagem: volta ao início
+            posicao = None
+        return self._pagina_queryset(posicao)
+
+    @staticmethod
+    def _chave_valida(chave):
+        return (
+            isinstance(chave, list) and len(chave) == 2
+            and type(chave[0]) in (int, float) and type(chave[1]) is int
+        )
+
+    def _chave(self, obj):
+        produto_id, relevancia = obj
+        return [relevancia, produto_id]
+
+    def _filtro(self, chave, para_frente):
+        return chave
+
+    def _buscar(self, filtro, para_frente, limite):
+        if self.restringir is None:
+            return _buscar(self.query, filtro, para_frente, limite)
+        itens = []
+        chave = filtro
+        while len(itens) < limite:
+            lote = _buscar(self.query, chave, para_frente, TAMANHO_LOTE)
+            restantes = set(self.restringir([pk for pk, _ in lote]))
+            itens += [item for item in lote if item[0] in restantes]
+            if len(lote) < TAMANHO_LOTE:
+                break
+            chave = self._chave(lote[-1])
+        return itens[:limite]
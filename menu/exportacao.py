@@ -0,0 +1,36 @@
+"""
+Exportação do catálogo (uma linha por variante, com os dados do produto)
+para os feeds dos marketplaces. Com `desde`, só entram as variantes em que
+a variante ou o produto foram alterados a partir daquele instante.
+"""
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Q
+from django.db.models.functions import Greatest
+from menu.models import DetalheProduto
+from utils.exportacao import TAMANHO_BLOCO, exportar
+
+COLUNAS = (
+    'variante_id', 'sku', 'produto_id', 'produto', 'descricao', 'marca', 'cor',
+    'tamanho', 'genero', 'preco', 'estoque', 'atualizado_em',
+)
+
+
+def linhas_catalogo(desde=None):
+    variantes = DetalheProduto.objects.order_by('id')
+    if desde is not None:
+        variantes = variantes.filter(
+            Q(atualizado_em__gte=desde) | Q(produto__atualizado_em__gte=desde)
+        )
+    return variantes.annotate(
+        alterado_em=Greatest('atualizado_em', 'produto__atualizado_em'),
+    ).values_list(
+        'id', 'sku', 'produto_id', 'produto__nome', 'produto__descricao',
+        'produto__marca__nome', 'cor__nome', 'tamanho', 'genero', 'preco',
+        'estoque', 'alterado_em',
+    ).iterator(chunk_size=TAMANHO_BLOCO)
+
+
+@staff_member_required
+def exportar_catalogo(request):
+    """GET ?formato=jsonl|csv&desde=2025-01-31T00:00:00"""
+    return exportar(request, 'catalogo', COLUNAS, linhas_catalogo)
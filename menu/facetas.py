@@ -0,0 +1,322 @@
+"""
+Navegação por facetas do catálogo (tamanho, cor, gênero, marca e faixa de preço).
+
+O índice é montado em memória com poucas consultas e guarda bitsets (int
+do Python). Marca é uma faceta de produto: o bit i corresponde ao i-ésimo
+produto do catálogo em ordem de nome, então o resultado filtrado já sai
+na ordem da listagem. Combinar filtros e recontar as facetas são ANDs e
+popcounts, sem GROUP BY por faceta.
+
+As facetas de variante (tamanho, cor, gênero, preço) consideram só
+variantes com estoque e precisam casar na mesma variante: tamanho=42 e
+cor=X só trazem produtos com uma variante X/42 em estoque. Para isso o
+índice também guarda bitsets por variante; com duas ou mais facetas de
+variante na seleção elas são cruzadas por variante e só então levadas
+para os produtos. Com uma só, basta o bitset de produtos da faceta.
+
+O índice é reconstruído quando a versão do catálogo (menu/versao.py) muda.
+Vendas só mudam a versão do estoque: o índice é copiado com o estoque das
+variantes dos produtos vendidos relido (com_estoque_de), sem reconstruir.
+A cópia troca o índice do processo de uma vez; quem está usando o anterior
+termina a consulta com ele.
+"""
+import copy
+import threading
+from decimal import Decimal
+from menu.models import DetalheProduto, Marca, Cor, SIZE_CHOICES, GENDER_CHOICES
+from menu.resumo import produtos_do_catalogo
+from menu.versao import estoque_alterado_entre, versao_catalogo, versao_estoque
+
+FAIXAS_PRECO = [
+    ('ate-300', 'Até R$ 300', None, Decimal('300')),
+    ('300-500', 'R$ 300 a 500', Decimal('300'), Decimal('500')),
+    ('500-700', 'R$ 500 a 700', Decimal('500'), Decimal('700')),
+    ('acima-700', 'Acima de R$ 700', Decimal('700'), None),
+]
+
+# (parâmetro da URL, título exibido)
+FACETAS = [
+    ('tamanho', 'Tamanho'),
+    ('cor', 'Cor'),
+    ('genero', 'Gênero'),
+    ('marca', 'Marca'),
+    ('preco', 'Preço'),
+]
+
+PARAMETROS_IGNORADOS = ('cursor', 'page')
+
+
+def _faixa_preco(preco):
+    for chave, _, minimo, maximo in FAIXAS_PRECO:
+        if (minimo is None or preco >= minimo) and (maximo is None or preco < maximo):
+            return chave
+    return None
+
+
+def _posicoes(bitset):
+    """Posições dos bits ligados, em ordem crescente"""
+    binario = bin(bitset)[:1:-1]
+    posicoes = []
+    posicao = binario.find('1')
+    while posicao != -1:
+        posicoes.append(posicao)
+        posicao = binario.find('1', posicao + 1)
+    return posicoes
+
+
+FACETAS_VARIANTE = ('tamanho', 'cor', 'genero', 'preco')
+
+
+class IndiceFacetas:
+    def __init__(self, versao, versao_estoque=None):
+        self.versao = versao
+        self.versao_estoque = versao_estoque
+        self.ids = list(produtos_do_catalogo().order_by('nome', 'id').values_list('id', flat=True))
+        self.posicao = {produto_id: i for i, produto_id in enumerate(self.ids)}
+        self.todos = (1 << len(self.ids)) - 1
+        # Bitsets de produtos por valor; nas facetas de variante, produtos
+        # com alguma variante em estoque com o valor
+        self.bits = {faceta: {} for faceta, _ in FACETAS}
+        # Bitsets de variantes (posição j) por valor das facetas de variante
+        self.bits_variante = {faceta: {} for faceta in FACETAS_VARIANTE}
+        self.em_estoque = 0
+        self.produto_da_variante = []
+        # Para reler o estoque: posição de cada variante, os valores dela
+        # nas facetas e as posições das variantes de cada produto
+        self.posicao_variante = {}
+        self.valores_variante = []
+        self.variantes_do_produto = [[] for _ in self.ids]
+
+        linhas = DetalheProduto.objects.values_list(
+            'id', 'produto_id', 'produto__marca_id', 'tamanho', 'cor_id', 'genero', 'preco', 'estoque'
+        ).order_by()
+        for pk, produto_id, marca_id, tamanho, cor_id, genero, preco, estoque in linhas.iterator(chunk_size=2000):
+            posicao = self.posicao.get(produto_id)
+            if posicao is None:
+                continue
+            bit = 1 << posicao
+            self._ligar(self.bits['marca'], str(marca_id), bit)
+
+            posicao_variante = len(self.produto_da_variante)
+            bit_variante = 1 << posicao_variante
+            valores = (tamanho, str(cor_id), genero, _faixa_preco(preco))
+            self.produto_da_variante.append(bit)
+            self.posicao_variante[pk] = posicao_variante
+            self.valores_variante.append(valores)
+            self.variantes_do_produto[posicao].append(posicao_variante)
+            for faceta, valor in zip(FACETAS_VARIANTE, valores):
+                self._ligar(self.bits_variante[faceta], valor, bit_variante)
+                if estoque > 0:
+                    self._ligar(self.bits[faceta], valor, bit)
+            if estoque > 0:
+                self.em_estoque |= bit_variante
+
+        self.rotulos = {
+            'tamanho': dict(SIZE_CHOICES),
+            'genero': dict(GENDER_CHOICES),
+            'preco': {chave: rotulo for chave, rotulo, _, _ in FAIXAS_PRECO},
+            'cor': {str(pk): nome for pk, nome in Cor.objects.values_list('id', 'nome')},
+            'marca': {str(pk): nome for pk, nome in Marca.objects.values_list('id', 'nome')},
+        }
+
+    def com_estoque_de(self, produto_ids, versao_estoque):
+        """Cópia do índice com o estoque das variantes de `produto_ids` relido do banco"""
+        novo = copy.copy(self)
+        novo.versao_estoque = versao_estoque
+        novo.bits = {
+            faceta: dict(bits) if faceta in FACETAS_VARIANTE else bits
+            for faceta, bits in self.bits.items()
+        }
+        linhas = DetalheProduto.objects.filter(produto_id__in=list(produto_ids)).values_list(
+            'id', 'produto_id', 'estoque'
+        )
+        alterados = set()
+        for pk, produto_id, estoque in linhas:
+            posicao_variante = self.posicao_variante.get(pk)
+            if posicao_variante is None:
+                continue  # Variante nova: vem com a versão do catálogo
+            if estoque > 0:
+                novo.em_estoque |= 1 << posicao_variante
+            else:
+                novo.em_estoque &= ~(1 << posicao_variante)
+            alterados.add(self.posicao[produto_id])
+
+        for posicao in alterados:
+            # Refaz os bits do produto nas facetas de variante a partir das variantes em estoque
+            bit = 1 << posicao
+            for faceta in FACETAS_VARIANTE:
+                bits = novo.bits[faceta]
+                for valor in bits:
+                    bits[valor] &= ~bit
+            for posicao_variante in self.variantes_do_produto[posicao]:
+                if novo.em_estoque >> posicao_variante & 1:
+                    for faceta, valor in zip(FACETAS_VARIANTE, self.valores_variante[posicao_variante]):
+                        self._ligar(novo.bits[faceta], valor, bit)
+        return novo
+
+    @staticmethod
+    def _ligar(bits, valor, bit):
+        bits[valor] = bits.get(valor, 0) | bit
+
+    @staticmethod
+    def _uniao(bits, valores):
+        uniao = 0
+        for valor in valores:
+            uniao |= bits.get(valor, 0)
+        return uniao
+
+    def _produtos_das_variantes(self, bitset_variantes):
+        """Bitset dos produtos que têm alguma das variantes"""
+        produtos = 0
+        for posicao in _posicoes(bitset_variantes):
+            produtos |= self.produto_da_variante[posicao]
+        return produtos
+
+    def _variantes_da_selecao(self, facetas_variante, selecao):
+        """Bitset das variantes em estoque que atendem a todas as `facetas_variante` da seleção"""
+        resultado = self.em_estoque
+        for faceta in facetas_variante:
+            resultado &= self._uniao(self.bits_variante[faceta], selecao[faceta])
+        return resultado
+
+    def _bitset_selecao(self, selecao, exceto=None):
+        resultado = self.todos
+        de_variante = []
+        for faceta, valores in selecao.items():
+            if faceta == exceto:
+                continue
+            if faceta in FACETAS_VARIANTE:
+                de_variante.append(faceta)
+            else:
+                resultado &= self._uniao(self.bits[faceta], valores)
+        if len(de_variante) == 1:
+            resultado &= self._uniao(self.bits[de_variante[0]], selecao[de_variante[0]])
+        elif de_variante:
+            resultado &= self._produtos_das_variantes(self._variantes_da_selecao(de_variante, selecao))
+        return resultado
+
+    def bitset_de(self, produto_ids):
+        bitset = 0
+        for produto_id in produto_ids:
+            posicao = self.posicao.get(produto_id)
+            if posicao is not None:
+                bitset |= 1 << posicao
+        return bitset
+
+    def filtrar(self, selecao):
+        """Ids dos produtos que atendem à seleção, em ordem de nome"""
+        return [self.ids[i] for i in _posicoes(self._bitset_selecao(selecao))]
+
+    def restringir(self, produto_ids, selecao):
+        """Mantém apenas os ids (em qualquer ordem) que atendem à seleção"""
+        bitset = self._bitset_selecao(selecao)
+        return [
+            pk for pk in produto_ids
+            if pk in self.posicao and bitset >> self.posicao[pk] & 1
+        ]
+
+    def contagens(self, selecao, base=None):
+        """
+        {faceta: {valor: qtd}}. Cada faceta é contada aplicando os filtros
+        das demais facetas, para que o usuário veja as alternativas.
+        """
+        base = self.todos if base is None else base
+        contagens = {}
+        for faceta, _ in FACETAS:
+            filtro = base & self._bitset_selecao(selecao, exceto=faceta)
+            outras = [f for f in selecao if f in FACETAS_VARIANTE and f != faceta]
+            if faceta in FACETAS_VARIANTE and outras:
+                # O valor precisa estar na mesma variante que atende às outras facetas
+                variantes = self._variantes_da_selecao(outras, selecao)
+                contagens[faceta] = {
+                    valor: (self._produtos_das_variantes(bitset & variantes) & filtro).bit_count()
+                    for valor, bitset in self.bits_variante[faceta].items()
+                }
+            else:
+                contagens[faceta] = {
+                    valor: (bitset & filtro).bit_count()
+                    for valor, bitset in self.bits[faceta].items()
+                }
+        return contagens
+
+    def facetas(self, selecao, parametros, base=None):
+        """Estrutura pronta para o template, com a URL que liga/desliga cada valor"""
+        contagens = self.contagens(selecao, base)
+        resultado = []
+        for faceta, titulo in FACETAS:
+            rotulos = self.rotulos[faceta]
+            selecionados = selecao.get(faceta, ())
+            opcoes = []
+            for valor in _ordenar(faceta, self.bits[faceta], rotulos):
+                quantidade = contagens[faceta].get(valor, 0)
+                selecionado = valor in selecionados
+                if not quantidade and not selecionado:
+                    continue
+                opcoes.append({
+                    'valor': valor,
+                    'rotulo': rotulos.get(valor, valor),
+                    'quantidade': quantidade,
+                    'selecionado': selecionado,
+                    'url': _url_alternando(parametros, faceta, valor),
+                })
+            if opcoes:
+                resultado.append({'nome': faceta, 'titulo': titulo, 'opcoes': opcoes})
+        return resultado
+
+
+def _ordenar(faceta, bits, rotulos):
+    if faceta in ('tamanho', 'genero', 'preco'):
+        ordem = list(rotulos)
+        return sorted(bits, key=lambda valor: ordem.index(valor) if valor in ordem else len(ordem))
+    return sorted(bits, key=lambda valor: rotulos.get(valor, ''))
+
+
+def _url_alternando(parametros, faceta, valor):
+    novos = parametros.copy()
+    for parametro in PARAMETROS_IGNORADOS:
+        novos.pop(parametro, None)
+    valores = novos.getlist(faceta)
+    if valor in valores:
+        valores.remove(valor)
+    else:
+        valores.append(valor)
+    novos.setlist(faceta, valores)
+    return f'?{novos.urlencode()}'
+
+
+def selecao_da_requisicao(parametros):
+    """Lê os filtros de facetas de request.GET: {faceta: {valores}}"""
+    selecao = {}
+    for faceta, _ in FACETAS:
+        valores = {valor for valor in parametros.getlist(faceta) if valor}
+        if valores:
+            selecao[faceta] = valores
+    return selecao
+
+
+_indice = None
+_trava = threading.Lock()
+
+
+def obter_indice():
+    """
+    Índice do processo: reconstruído se a versão do catálogo mudou, com o
+    estoque relido se só a do estoque mudou.
+    """
+    global _indice
+    versao = versao_catalogo()
+    estoque = versao_estoque()
+    indice = _indice
+    if indice is not None and indice.versao == versao and indice.versao_estoque == estoque:
+        return indice
+    with _trava:
+        indice = _indice
+        if indice is None or indice.versao != versao:
+            _indice = IndiceFacetas(versao, estoque)
+        elif indice.versao_estoque != estoque:
+            alterados = estoque_alterado_entre(indice.versao_estoque, estoque)
+            if alterados is None:
+                _indice = IndiceFacetas(versao, estoque)
+            else:
+                _indice = indice.com_estoque_de(alterados, estoque)
+        return _indice
@@ -0,0 +1,55 @@
+"""
+Cache de fragmentos das páginas do catálogo.
+
+Os templates envolvem a grade de produtos e a página de produto em
+{% cache tempo_fragmento '<nome>' versao_catalogo versao_estoque chave_fragmento %}.
+A chave inclui a versão do catálogo (menu/versao.py), então qualquer
+escrita em Produto, DetalheProduto, Marca ou Cor invalida tudo de uma vez,
+sem precisar apagar chaves. As partes por usuário (cabeçalho, carrinho)
+ficam fora do fragmento.
+
+Vendas não mudam a versão do catálogo. Na grade, versao_estoque é a de
+estoque_publicado(): o estoque exibido pode estar até
+INTERVALO_ESTOQUE_PUBLICADO segundos atrasado. A página de produto usa a
+versão do próprio produto e é refeita a cada venda dele.
+
+Funciona com qualquer backend de cache do Django (memória local, arquivo,
+Redis); com vários processos use um backend compartilhado.
+"""
+from functools import partial
+from urllib.parse import urlencode
+from django.utils.functional import SimpleLazyObject
+from menu.versao import estoque_publicado, versao_catalogo
+
+TEMPO_FRAGMENTO = 60 * 10
+
+
+def contexto_fragmento(request):
+    """Variáveis usadas na tag {% cache %}: versão, página e parâmetros"""
+    parametros = sorted(
+        (nome, valor)
+        for nome, valores in request.GET.lists()
+        for valor in valores
+    )
+    return {
+        'tempo_fragmento': TEMPO_FRAGMENTO,
+        'versao_catalogo': versao_catalogo(),
+        'versao_estoque': estoque_publicado()[0],
+        'chave_fragmento': f'{request.path}?{urlencode(parametros)}',
+    }
+
+
+def contexto_preguicoso(montar, nomes):
+    """
+    Expõe as chaves `nomes` do dict retornado por `montar()` como objetos
+    preguiçosos: `montar` só roda se o template precisar deles, isto é,
+    quando o fragmento não está no cache.
+    """
+    resultado = []
+
+    def obter(nome):
+        if not resultado:
+            resultado.append(montar())
+        return resultado[0][nome]
+
+    return {nome: SimpleLazyObject(partial(obter, nome)) for nome in nomes}
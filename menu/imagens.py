@@ -0,0 +1,159 @@
+"""
+Derivados de Produto.imagem: miniaturas em larguras fixas nos formatos
+JPEG, WebP e, se o Pillow tiver suporte, AVIF.
+
+Os arquivos ficam ao lado do original e levam o hash do conteúdo no nome
+(sneakers/air-max.3f9a1c2b7d4e5f60.w640.webp), então gerar de novo a partir
+da mesma imagem não faz nada e trocar a imagem gera nomes novos.
+O que foi gerado fica registrado em Produto.imagem_derivados, e o template
+monta o srcset a partir disso sem tocar no disco (menu/templatetags/imagens.py).
+O registro guarda também o nome do original: salvar o produto sem trocar a
+imagem não enfileira nada (menu/signals.py), e a geração roda na fila
+(menu/tarefas.py), fora da requisição que salvou.
+
+Este módulo não importa models no topo para poder rodar nos processos
+filhos do comando gerar_derivados_imagens.
+"""
+import hashlib
+import io
+import posixpath
+import warnings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+LARGURAS = (320, 640, 1024)
+QUALIDADE = {'jpeg': 82, 'webp': 80, 'avif': 60}
+TIPOS_MIME = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'avif': 'image/avif'}
+EXTENSOES = {'jpeg': 'jpg', 'webp': 'webp', 'avif': 'avif'}
+
+
+def _suporta(formato):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return bool(features.check(formato))
+
+
+# Do formato mais eficiente para o mais compatível; JPEG é sempre o fallback
+FORMATOS = tuple(f for f in ('avif', 'webp') if _suporta(f)) + ('jpeg',)
+
+
+def hash_conteudo(conteudo):
+    return hashlib.sha256(conteudo).hexdigest()[:16]
+
+
+def nome_derivado(original, hash_imagem, largura, formato):
+    base, _ = posixpath.splitext(original)
+    return f'{base}.{hash_imagem}.w{largura}.{EXTENSOES[formato]}'
+
+
+def _codificar(imagem, largura, formato):
+    altura = max(1, round(imagem.height * largura / imagem.width))
+    reduzida = imagem.resize((largura, altura), Image.Resampling.LANCZOS)
+    if formato == 'jpeg' and reduzida.mode != 'RGB':
+        fundo = Image.new('RGB', reduzida.size, (255, 255, 255))
+        fundo.paste(reduzida, mask=reduzida.getchannel('A') if 'A' in reduzida.getbands() else None)
+        reduzida = fundo
+    saida = io.BytesIO()
+    opcoes = {'quality': QUALIDADE[formato]}
+    if formato == 'jpeg':
+        opcoes.update(optimize=True, progressive=True)
+    reduzida.save(saida, format=formato.upper(), **opcoes)
+    return saida.getvalue()
+
+
+def larguras_derivadas(largura_original):
+    """Larguras geradas para uma imagem: as de LARGURAS que cabem nela, ou a própria"""
+    return [l for l in LARGURAS if l <= largura_original] or [largura_original]
+
+
+def gerar_derivados(original, anterior=None, storage=None):
+    """
+    Gera (se ainda não existirem) os derivados do arquivo `original` e
+    retorna o registro {'original', 'hash', 'larguras', 'formatos'} para o
+    model. Larguras maiores que a imagem original não são geradas. Os
+    derivados do registro `anterior` que não valem mais são apagados.
+    """
+    storage = storage or default_storage
+    with storage.open(original, 'rb') as arquivo:
+        conteudo = arquivo.read()
+    hash_imagem = hash_conteudo(conteudo)
+
+    imagem = None
+    with Image.open(io.BytesIO(conteudo)) as aberta:
+        largura_original = aberta.width
+        larguras = larguras_derivadas(largura_original)
+        for largura in larguras:
+            for formato in FORMATOS:
+                nome = nome_derivado(original, hash_imagem, largura, formato)
+                if storage.exists(nome):
+                    continue
+                if imagem is None:
+                    imagem = ImageOps.exif_transpose(aberta)
+                    if imagem.mode not in ('RGB', 'RGBA'):
+                        imagem = imagem.convert('RGBA' if 'transparency' in imagem.info else 'RGB')
+                storage.save(nome, ContentFile(_codificar(imagem, largura, formato)))
+
+    registro = {'original': original, 'hash': hash_imagem, 'larguras': larguras, 'formatos': list(FORMATOS)}
+    if anterior and anterior.get('hash') and (
+        anterior['hash'] != hash_imagem or anterior.get('original', original) != original
+    ):
+        remover_derivados(anterior, original, storage)
+    return registro
+
+
+def remover_derivados(registro, original=None, storage=None):
+    """
+    Apaga os derivados descritos em `registro`. As larguras vêm do próprio
+    registro, que as guardou com larguras_derivadas(): a imagem de onde
+    saíram pode já ter sido trocada. Registros antigos, sem 'original',
+    usam o nome `original` informado.
+    """
+    storage = storage or default_storage
+    original = registro.get('original', original)
+    if not original or not registro.get('hash'):
+        return
+    for largura in registro.get('larguras', LARGURAS):
+        for formato in EXTENSOES:
+            nome = nome_derivado(original, registro['hash'], largura, formato)
+            if storage.exists(nome):
+                storage.delete(nome)
+
+
+def processar_arquivo(tarefa):
+    """Executado nos processos filhos: (produto_id, original, registro anterior)"""
+    produto_id, original, anterior = tarefa
+    try:
+        return produto_id, gerar_derivados(original, anterior), None
+    except Exception as erro:  # arquivo ausente ou corrompido não interrompe o lote
+        return produto_id, None, str(erro)
+
+
+def derivados_desatualizados(produto):
+    """Se o registro de derivados não é da imagem atual do produto (compara só nomes)"""
+    registro = produto.imagem_derivados or {}
+    if not produto.imagem:
+        return bool(registro)
+    return registro.get('original') != produto.imagem.name
+
+
+def atualizar_derivados_produto(produto_id):
+    """Gera os derivados de um produto e grava o registro no banco"""
+    from django.db import transaction
+    from menu.models import Produto
+    from menu.versao import incrementar_versao_catalogo
+
+    produto = Produto.objects.filter(id=produto_id).only('imagem', 'imagem_derivados').first()
+    if produto is None or not derivados_desatualizados(produto):
+        return
+    anterior = produto.imagem_derivados or {}
+    if not produto.imagem:
+        remover_derivados(anterior)
+        registro = {}
+    else:
+        _, registro, erro = processar_arquivo((produto_id, produto.imagem.name, anterior))
+        if erro is not None:
+            raise RuntimeError(f'Produto {produto_id}: {erro}')
+    # update() não dispara post_save, evitando reprocessar a imagem
+    Produto.objects.filter(id=produto_id).update(imagem_derivados=registro)
+    transaction.on_commit(incrementar_versao_catalogo)
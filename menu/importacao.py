@@ -0,0 +1,234 @@
+"""
+Importação do catálogo de fornecedores a partir de CSV ou JSONL.
+
+Cada linha descreve uma variante:
+    marca, produto, descricao, cor, tamanho, genero, preco, estoque, sku
+(descricao e sku são opcionais; genero aceita o código ou o rótulo).
+
+O arquivo é lido em fluxo e gravado em lotes: marcas e cores ficam em
+dicionários nome -> id, os produtos do lote são resolvidos numa consulta
+só e as variantes entram por upsert (bulk_create com update_conflicts na
+chave produto/tamanho/cor/gênero). A memória usada depende do tamanho do
+lote, não do tamanho do arquivo.
+
+Como bulk_create não dispara sinais, finalizar() atualiza de uma vez os
+resumos, o índice de busca e as versões do catálogo.
+"""
+import csv
+import json
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.utils import timezone
+from menu.models import Marca, Cor, Produto, DetalheProduto, GENDER_CHOICES, SIZE_CHOICES
+
+TAMANHO_LOTE = 1000
+MAXIMO_ERROS_LISTADOS = 20
+COLUNAS_OBRIGATORIAS = ('marca', 'produto', 'cor', 'tamanho', 'genero', 'preco', 'estoque')
+
+_TAMANHOS = {tamanho for tamanho, _ in SIZE_CHOICES}
+_GENEROS = {
+    **{rotulo.lower(): codigo for codigo, rotulo in GENDER_CHOICES},
+    **{codigo.lower(): codigo for codigo, _ in GENDER_CHOICES},
+}
+
+
+class LinhaInvalida(ValueError):
+    pass
+
+
+def ler_linhas(arquivo, formato):
+    """Gera (registro, erro) a partir de um arquivo de texto aberto"""
+    if formato == 'csv':
+        for registro in csv.DictReader(arquivo):
+            yield registro, None
+        return
+    for numero, linha in enumerate(arquivo, start=1):
+        if not linha.strip():
+            continue
+        try:
+            registro = json.loads(linha)
+        except json.JSONDecodeError as erro:
+            yield None, f'linha {numero}: JSON inválido ({erro.msg})'
+        else:
+            yield registro, None
+
+
+def validar(registro):
+    """Normaliza um registro do arquivo; levanta LinhaInvalida se não servir"""
+    if not isinstance(registro, dict):
+        raise LinhaInvalida('registro não é um objeto')
+    faltando = [c for c in COLUNAS_OBRIGATORIAS if str(registro.get(c) or '').strip() == '']
+    if faltando:
+        raise LinhaInvalida(f'campos ausentes: {", ".join(faltando)}')
+
+    tamanho = str(registro['tamanho']).strip()
+    if tamanho not in _TAMANHOS:
+        raise LinhaInvalida(f'tamanho inválido: {tamanho}')
+    genero = _GENEROS.get(str(registro['genero']).strip().lower())
+    if genero is None:
+        raise LinhaInvalida(f'gênero inválido: {registro["genero"]}')
+    try:
+        preco = Decimal(str(registro['preco']).strip().replace(',', '.')).quantize(Decimal('0.01'))
+        estoque = int(str(registro['estoque']).strip())
+    except (InvalidOperation, ValueError):
+        raise LinhaInvalida('preço ou estoque inválido')
+    if preco < 0 or estoque < 0:
+        raise LinhaInvalida('preço e estoque não podem ser negativos')
+
+    # Coluna vazia no CSV: mantém a descrição atual, como uma coluna ausente
+    descricao = str(registro.get('descricao') or '').strip() or None
+    return {
+        'marca': str(registro['marca']).strip(),
+        'produto': str(registro['produto']).strip(),
+        'descricao': descricao,
+        'cor': str(registro['cor']).strip(),
+        'tamanho': tamanho,
+        'genero': genero,
+        'preco': preco,
+        'estoque': estoque,
+        'sku': str(registro.get('sku') or '').strip() or None,
+    }
+
+
+class ImportadorCatalogo:
+    def __init__(self, tamanho_lote=TAMANHO_LOTE):
+        self.tamanho_lote = tamanho_lote
+        self.marcas = self._por_nome(Marca)
+        self.cores = self._por_nome(Cor)
+        self.produto_ids = set()
+        self.nomes_novos = False
+        self.estatisticas = Counter()
+        self.erros = []
+
+    @staticmethod
+    def _por_nome(modelo):
+        # Nomes repetidos no banco: vale o cadastro mais antigo
+        por_nome = {}
+        for pk, nome in modelo.objects.order_by('-id').values_list('id', 'nome'):
+            por_nome[nome.strip()] = pk
+        return por_nome
+
+    def _erro(self, mensagem):
+        self.estatisticas['erros'] += 1
+        if len(self.erros) < MAXIMO_ERROS_LISTADOS:
+            self.erros.append(mensagem)
+
+    def processar(self, linhas, progresso=None):
+        """
+        Consome o iterável de ler_linhas() gravando um lote por vez.
+        `progresso(estatisticas)` é chamado após cada lote.
+        """
+        lote = []
+        for posicao, (registro, problema) in enumerate(linhas, start=1):
+            self.estatisticas['linhas'] += 1
+            if problema:
+                self._erro(problema)
+                continue
+            try:
+                lote.append(validar(registro))
+            except LinhaInvalida as erro:
+                self._erro(f'registro {posicao}: {erro}')
+                continue
+            if len(lote) >= self.tamanho_lote:
+                self._gravar(lote)
+                lote = []
+                if progresso:
+                    progresso(self.estatisticas)
+        if lote:
+            self._gravar(lote)
+            if progresso:
+                progresso(self.estatisticas)
+        return self.estatisticas
+
+    def _resolver_nomes(self, modelo, por_nome, nomes):
+        novos = [nome for nome in dict.fromkeys(nomes) if nome not in por_nome]
+        if novos:
+            for objeto in modelo.objects.bulk_create([modelo(nome=nome) for nome in novos]):
+                por_nome[objeto.nome] = objeto.pk
+            self.nomes_novos = True
+        return len(novos)
+
+    def _resolver_produtos(self, lote):
+        """Retorna {(marca_id, nome): produto_id} para os produtos do lote"""
+        descricoes = {}
+        for linha in lote:
+            chave = (self.marcas[linha['marca']], linha['produto'])
+            if linha['descricao'] is not None or chave not in descricoes:
+                descricoes[chave] = linha['descricao']
+
+        existentes = Produto.objects.filter(
+            marca_id__in={marca_id for marca_id, _ in descricoes},
+            nome__in={nome for _, nome in descricoes},
+        ).order_by('-id').values_list('id', 'marca_id', 'nome', 'descricao')
+        ids, descricoes_atuais = {}, {}
+        for pk, marca_id, nome, descricao in existentes:
+            if (marca_id, nome) in descricoes:
+                # Nomes repetidos na mesma marca: vale o cadastro mais antigo
+                ids[(marca_id, nome)] = pk
+                descricoes_atuais[pk] = descricao
+
+        agora = timezone.now()
+        alterados = [
+            Produto(id=ids[chave], descricao=descricao, atualizado_em=agora)
+            for chave, descricao in descricoes.items()
+            if chave in ids and descricao is not None and descricao != descricoes_atuais[ids[chave]]
+        ]
+        novos = [
+            Produto(marca_id=marca_id, nome=nome, descricao=descricao or '')
+            for (marca_id, nome), descricao in descricoes.items()
+            if (marca_id, nome) not in ids
+        ]
+        for produto in Produto.objects.bulk_create(novos):
+            ids[(produto.marca_id, produto.nome)] = produto.pk
+        if alterados:
+            Produto.objects.bulk_update(alterados, ['descricao', 'atualizado_em'])
+        if novos:
+            self.nomes_novos = True
+        self.estatisticas['produtos_criados'] += len(novos)
+        self.estatisticas['produtos_atualizados'] += len(alterados)
+        return ids
+
+    def _gravar(self, lote):
+        with transaction.atomic():
+            self.estatisticas['marcas_criadas'] += self._resolver_nomes(
+                Marca, self.marcas, (linha['marca'] for linha in lote))
+            self.estatisticas['cores_criadas'] += self._resolver_nomes(
+                Cor, self.cores, (linha['cor'] for linha in lote))
+            produtos = self._resolver_produtos(lote)
+
+            # A mesma variante repetida no lote: vale a última linha
+            variantes = {}
+            for linha in lote:
+                produto_id = produtos[(self.marcas[linha['marca']], linha['produto'])]
+                cor_id = self.cores[linha['cor']]
+                variantes[(produto_id, linha['tamanho'], cor_id, linha['genero'])] = DetalheProduto(
+                    produto_id=produto_id,
+                    cor_id=cor_id,
+                    tamanho=linha['tamanho'],
+                    genero=linha['genero'],
+                    preco=linha['preco'],
+                    estoque=linha['estoque'],
+                    sku=linha['sku'],
+                )
+            DetalheProduto.objects.bulk_create(
+                variantes.values(),
+                update_conflicts=True,
+                unique_fields=['produto', 'tamanho', 'cor', 'genero'],
+                update_fields=['preco', 'estoque', 'sku', 'atualizado_em'],
+            )
+        self.produto_ids.update(produtos.values())
+        self.estatisticas['variantes'] += len(variantes)
+
+    def finalizar(self):
+        """Atualiza o que os sinais manteriam: resumos, busca e versões"""
+        from menu import busca, autocompletar
+        from menu.signals import variantes_alteradas
+        from menu.versao import incrementar_versao
+
+        if not self.produto_ids:
+            return
+        variantes_alteradas(self.produto_ids)
+        busca.indexar_produtos(self.produto_ids)
+        if self.nomes_novos:
+            incrementar_versao(autocompletar.CHAVE_VERSAO)
@@ -0,0 +1,28 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from menu.exportacao import COLUNAS, linhas_catalogo
+from utils.exportacao import FORMATOS, DataInvalida, gravar_exportacao, interpretar_desde
+
+
+class Command(BaseCommand):
+    help = 'Exporta o catálogo (uma linha por variante) em JSONL ou CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=list(FORMATOS), default='jsonl')
+        parser.add_argument('--desde', help='Só variantes alteradas a partir desta data/hora (ISO 8601)')
+        parser.add_argument('--saida', help='Arquivo de saída (padrão: saída padrão)')
+
+    def handle(self, *args, **options):
+        try:
+            desde = interpretar_desde(options['desde'])
+        except DataInvalida as erro:
+            raise CommandError(str(erro))
+
+        exportado_em = timezone.now()
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8', newline='') as saida:
+                total = gravar_exportacao(saida, options['formato'], COLUNAS, linhas_catalogo(desde))
+        else:
+            total = gravar_exportacao(sys.stdout, options['formato'], COLUNAS, linhas_catalogo(desde))
+        self.stderr.write(f'✓ {total} variantes exportadas; próxima exportação incremental: --desde {exportado_em.isoformat()}')
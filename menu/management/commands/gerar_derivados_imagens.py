@@ -0,0 +1,50 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connections
+from menu.imagens import processar_arquivo
+from menu.models import Produto
+from menu.versao import incrementar_versao_catalogo
+
+
+class Command(BaseCommand):
+    help = 'Gera miniaturas e variantes WebP/AVIF de Produto.imagem usando vários processos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processos', type=int, default=os.cpu_count() or 1,
+                            help='Quantidade de processos (padrão: número de CPUs)')
+        parser.add_argument('--forcar', action='store_true',
+                            help='Reprocessa também produtos que já têm derivados registrados')
+
+    def handle(self, *args, **options):
+        produtos = Produto.objects.exclude(imagem='').exclude(imagem__isnull=True)
+        if not options['forcar']:
+            produtos = produtos.filter(imagem_derivados={})
+        tarefas = [
+            (pk, imagem, derivados or {})
+            for pk, imagem, derivados in produtos.values_list('id', 'imagem', 'imagem_derivados')
+        ]
+        if not tarefas:
+            self.stdout.write('Nenhuma imagem para processar')
+            return
+
+        # As conexões não podem ser herdadas pelos processos filhos
+        connections.close_all()
+
+        registros = {}
+        with ProcessPoolExecutor(max_workers=max(1, options['processos'])) as executor:
+            for i, (produto_id, registro, erro) in enumerate(
+                executor.map(processar_arquivo, tarefas, chunksize=8), start=1
+            ):
+                if erro:
+                    self.stderr.write(f'  Produto {produto_id}: {erro}')
+                else:
+                    registros[produto_id] = registro
+                if i % 50 == 0:
+                    self.stdout.write(f'  {i}/{len(tarefas)} imagens processadas...')
+
+        objetos = [Produto(id=pk, imagem_derivados=registro) for pk, registro in registros.items()]
+        Produto.objects.bulk_update(objetos, ['imagem_derivados'], batch_size=500)
+        if objetos:
+            incrementar_versao_catalogo()
+        self.stdout.write(self.style.SUCCESS(f'✓ {len(objetos)} de {len(tarefas)} imagens processadas'))
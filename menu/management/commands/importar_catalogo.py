@@ -0,0 +1,75 @@
+import io
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from menu.importacao import ImportadorCatalogo, ler_linhas, TAMANHO_LOTE
+
+
+class _Simulacao(Exception):
+    """Desfaz a transação do --dry-run"""
+
+
+class Command(BaseCommand):
+    help = 'Importa (ou atualiza) o catálogo a partir de um arquivo CSV ou JSONL, em lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="Caminho do arquivo ou '-' para ler da entrada padrão")
+        parser.add_argument('--formato', choices=['csv', 'jsonl'],
+                            help='Formato do arquivo (padrão: pela extensão)')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE,
+                            help=f'Variantes gravadas por lote (padrão: {TAMANHO_LOTE})')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Valida e grava tudo numa transação que é desfeita no final')
+
+    def handle(self, *args, **options):
+        caminho = options['arquivo']
+        formato = options['formato'] or ('jsonl' if caminho.endswith(('.jsonl', '.ndjson')) else 'csv')
+
+        inicio = time.monotonic()
+
+        def progresso(estatisticas):
+            decorrido = time.monotonic() - inicio
+            self.stdout.write(
+                f"  {estatisticas['linhas']} linhas lidas, {estatisticas['variantes']} variantes gravadas "
+                f"({estatisticas['linhas'] / max(decorrido, 1e-6):.0f} linhas/s)"
+            )
+
+        if caminho == '-':
+            arquivo = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig')
+        else:
+            try:
+                arquivo = open(caminho, encoding='utf-8-sig', newline='')
+            except OSError as erro:
+                raise CommandError(f'Não foi possível abrir {caminho}: {erro}')
+
+        importador = ImportadorCatalogo(tamanho_lote=max(1, options['lote']))
+        linhas = ler_linhas(arquivo, formato)
+        with arquivo:
+            if options['dry_run']:
+                try:
+                    with transaction.atomic():
+                        importador.processar(linhas, progresso)
+                        raise _Simulacao
+                except _Simulacao:
+                    pass
+            else:
+                # Cada lote é gravado na sua própria transação
+                importador.processar(linhas, progresso)
+                importador.finalizar()
+
+        for erro in importador.erros:
+            self.stderr.write(f'  {erro}')
+        estatisticas = importador.estatisticas
+        resumo = (
+            f"{estatisticas['linhas']} linhas, {estatisticas['variantes']} variantes, "
+            f"{estatisticas['produtos_criados']} produtos novos, "
+            f"{estatisticas['produtos_atualizados']} produtos atualizados, "
+            f"{estatisticas['marcas_criadas']} marcas e {estatisticas['cores_criadas']} cores novas, "
+            f"{estatisticas['erros']} linhas com erro "
+            f"em {time.monotonic() - inicio:.1f}s"
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Simulação (nada foi gravado): {resumo}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ {resumo}'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from menu.busca import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Recria o índice de busca textual (FTS5/tsvector) a partir de Produto'
+
+    def handle(self, *args, **options):
+        total = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} produtos indexados'))
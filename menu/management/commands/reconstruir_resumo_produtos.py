@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from menu.resumo import reconstruir_resumos
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói do zero a tabela ResumoProduto a partir de DetalheProduto'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = reconstruir_resumos()
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} resumos de produto reconstruídos'))
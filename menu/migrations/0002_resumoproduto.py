@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min, Sum, Count
+
+
+def popular_resumos(apps, schema_editor):
+    Produto = apps.get_model('menu', 'Produto')
+    ResumoProduto = apps.get_model('menu', 'ResumoProduto')
+    agregados = Produto.objects.annotate(
+        preco_minimo=Min('detalhes__preco'),
+        estoque_total=Sum('detalhes__estoque'),
+        qtd_variantes=Count('detalhes'),
+    ).values_list('id', 'preco_minimo', 'estoque_total', 'qtd_variantes')
+    ResumoProduto.objects.bulk_create(
+        (
+            ResumoProduto(
+                produto_id=produto_id,
+                preco_minimo=preco_minimo,
+                estoque_total=estoque_total or 0,
+                qtd_variantes=qtd_variantes,
+            )
+            for produto_id, preco_minimo, estoque_total, qtd_variantes in agregados.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoProduto',
+            fields=[
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumo', serialize=False, to='menu.produto')),
+                ('preco_minimo', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('estoque_total', models.PositiveIntegerField(default=0)),
+                ('qtd_variantes', models.PositiveIntegerField(db_index=True, default=0)),
+            ],
+            options={
+                'verbose_name': 'Resumo do Produto',
+                'verbose_name_plural': 'Resumos dos Produtos',
+            },
+        ),
+        migrations.RunPython(popular_resumos, migrations.RunPython.noop),
+    ]
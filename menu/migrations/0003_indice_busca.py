@@ -0,0 +1,23 @@
+from django.db import migrations
+from menu import busca
+
+
+def criar_indice(apps, schema_editor):
+    Produto = apps.get_model('menu', 'Produto')
+    linhas = Produto.objects.values_list('id', 'nome', 'descricao', 'marca__nome')
+    busca.criar_estrutura(schema_editor.connection, linhas.iterator())
+
+
+def remover_indice(apps, schema_editor):
+    busca.remover_estrutura(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_resumoproduto'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
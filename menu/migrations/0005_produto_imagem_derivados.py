@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0004_produto_nome_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='imagem_derivados',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -39,6 +39,16 @@ class Produto(models.Model):
     descricao = models.TextField(blank=True)
     marca = models.ForeignKey(Marca, on_delete=models.PROTECT, related_name="produtos")
     imagem = models.ImageField(upload_to="sneakers/", blank=True, null=True)
+    # {'hash', 'larguras', 'formatos'} das miniaturas geradas por menu/imagens.py
+    imagem_derivados = models.JSONField(default=dict, blank=True, editable=False)
+    # Exportações incrementais (?desde=)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Paginação por cursor do catálogo
+            models.Index(fields=["nome", "id"], name="produto_nome_id_idx"),
+        ]
 
     def __str__(self):
         return f"{self.marca} {self.nome}"
@@ -52,6 +62,7 @@ class DetalheProduto(models.Model):
     estoque = models.PositiveIntegerField(default=0)
     preco = models.DecimalField(max_digits=10, decimal_places=2)
     sku = models.CharField(max_length=50, blank=True, null=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ("produto", "tamanho", "cor", "genero")
@@ -59,3 +70,22 @@ class DetalheProduto(models.Model):
 
     def __str__(self):
         return f"{self.produto.nome} - Tam {self.tamanho} - {self.cor} ({self.get_genero_display()})"
+
+
+class ResumoProduto(models.Model):
+    """
+    Resumo desnormalizado das variantes de um Produto.
+    Mantido incrementalmente pelos sinais de DetalheProduto (menu/signals.py)
+    e reconstruído pelo comando `reconstruir_resumo_produtos`.
+    """
+    produto = models.OneToOneField(Produto, on_delete=models.CASCADE, primary_key=True, related_name="resumo")
+    preco_minimo = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    estoque_total = models.PositiveIntegerField(default=0)
+    qtd_variantes = models.PositiveIntegerField(default=0, db_index=True)
+
+    class Meta:
+        verbose_name = "Resumo do Produto"
+        verbose_name_plural = "Resumos dos Produtos"
+
+    def __str__(self):
+        return f"Resumo de {self.produto_id}"
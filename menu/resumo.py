@@ -0,0 +1,78 @@
+from django.db.models import Min, Sum, Count, F
+from menu.models import Produto, DetalheProduto, ResumoProduto
+
+TAMANHO_LOTE = 500
+
+
+def produtos_do_catalogo():
+    """
+    Produtos com variantes cadastradas, já com os agregados lidos
+    do ResumoProduto (sem GROUP BY sobre DetalheProduto).
+    """
+    return Produto.objects.filter(
+        resumo__qtd_variantes__gt=0
+    ).select_related('marca').annotate(
+        preco_minimo=F('resumo__preco_minimo'),
+        estoque_total=F('resumo__estoque_total'),
+        qtd_variantes=F('resumo__qtd_variantes'),
+    )
+
+
+def atualizar_resumos(produto_ids):
+    """
+    Recalcula o ResumoProduto apenas dos produtos informados.
+    Usa uma agregação restrita aos ids e um upsert em lote.
+    """
+    ids = list(set(produto_ids))
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        _atualizar_lote(ids[inicio:inicio + TAMANHO_LOTE])
+
+
+def reconstruir_resumos():
+    """Reconstrói o resumo de todos os produtos do catálogo"""
+    ids = Produto.objects.order_by('id').values_list('id', flat=True)
+    total = 0
+    lote = []
+    for produto_id in ids.iterator(chunk_size=TAMANHO_LOTE):
+        lote.append(produto_id)
+        if len(lote) == TAMANHO_LOTE:
+            _atualizar_lote(lote)
+            total += len(lote)
+            lote = []
+    if lote:
+        _atualizar_lote(lote)
+        total += len(lote)
+    ResumoProduto.objects.exclude(produto__in=Produto.objects.all()).delete()
+    return total
+
+
+def _atualizar_lote(ids):
+    agregados = {
+        linha['produto_id']: linha
+        for linha in DetalheProduto.objects.filter(produto_id__in=ids)
+        .values('produto_id')
+        .annotate(
+            preco_minimo=Min('preco'),
+            estoque_total=Sum('estoque'),
+            qtd_variantes=Count('id'),
+        )
+        .order_by()
+    }
+    existentes = Produto.objects.filter(id__in=ids).values_list('id', flat=True)
+
+    resumos = []
+    for produto_id in existentes:
+        linha = agregados.get(produto_id, {})
+        resumos.append(ResumoProduto(
+            produto_id=produto_id,
+            preco_minimo=linha.get('preco_minimo'),
+            estoque_total=linha.get('estoque_total') or 0,
+            qtd_variantes=linha.get('qtd_variantes') or 0,
+        ))
+
+    ResumoProduto.objects.bulk_create(
+        resumos,
+        update_conflicts=True,
+        unique_fields=['produto'],
+        update_fields=['preco_minimo', 'estoque_total', 'qtd_variantes'],
+    )
@@ -0,0 +1,140 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import Signal, receiver
+from menu.models import Produto, DetalheProduto, Marca, Cor
+from menu.resumo import atualizar_resumos
+from menu.versao import incrementar_versao_catalogo, registrar_estoque_alterado
+from menu.variantes import invalidar_matrizes
+from menu.imagens import derivados_desatualizados
+from menu import busca, autocompletar
+from tarefas.fila import enfileirar
+
+
+# Enviado após o commit quando muda o que se mostra das variantes (preço,
+# tamanho, nomes de produto, marca ou cor). `variantes` é um queryset de
+# DetalheProduto; quem guarda dados das variantes (ex.: o resumo do
+# carrinho, pedidos/signals.py) invalida só o que as contém.
+variantes_modificadas = Signal()
+
+
+def _enviar_variantes_modificadas(**filtro):
+    variantes_modificadas.send(DetalheProduto, variantes=DetalheProduto.objects.filter(**filtro))
+
+
+def variantes_alteradas(produto_ids):
+    """
+    Ponto único de atualização para escritas que não disparam sinais
+    (queryset.update, bulk_create, bulk_update).
+    Deve ser chamado com os ids dos produtos cujas variantes mudaram.
+    """
+    atualizar_resumos(produto_ids)
+    invalidar_matrizes(produto_ids)
+    autocompletar.produtos_alterados(produto_ids)
+    _enviar_variantes_modificadas(produto_id__in=produto_ids)
+    incrementar_versao_catalogo()
+
+
+def estoque_alterado(produto_ids):
+    """
+    Para escritas que só mudam o estoque (a baixa da finalização do pedido):
+    atualiza resumos e matrizes dos produtos e a versão do estoque, sem a
+    versão do catálogo, que refaria os índices e caches do catálogo inteiro.
+    """
+    atualizar_resumos(produto_ids)
+    invalidar_matrizes(produto_ids)
+    registrar_estoque_alterado(produto_ids)
+
+
+def _agendar(produto_ids):
+    # Executa após o commit: numa exclusão em cascata o Produto já
+    # não existe mais e o resumo não é recriado
+    transaction.on_commit(partial(variantes_alteradas, produto_ids))
+
+
+@receiver(post_init, sender=DetalheProduto)
+def guardar_produto_original(sender, instance, **kwargs):
+    # Permite atualizar o resumo do produto antigo se a variante for movida
+    instance._produto_id_original = instance.produto_id
+
+
+@receiver(post_save, sender=DetalheProduto)
+def detalhe_produto_salvo(sender, instance, **kwargs):
+    produto_ids = {instance.produto_id, instance._produto_id_original}
+    produto_ids.discard(None)
+    _agendar(produto_ids)
+    instance._produto_id_original = instance.produto_id
+
+
+@receiver(post_delete, sender=DetalheProduto)
+def detalhe_produto_excluido(sender, instance, **kwargs):
+    _agendar({instance.produto_id})
+
+
+@receiver(post_save, sender=Produto)
+def produto_salvo(sender, instance, update_fields=None, **kwargs):
+    transaction.on_commit(partial(busca.indexar_produtos, [instance.id]))
+    # Só a troca da imagem gera derivados, e na fila: a requisição não espera
+    if (update_fields is None or 'imagem' in update_fields) and derivados_desatualizados(instance):
+        enfileirar('menu.gerar_derivados_imagem', produto_id=instance.id)
+
+
+@receiver(post_delete, sender=Produto)
+def produto_excluido(sender, instance, **kwargs):
+    transaction.on_commit(partial(busca.remover_produtos, [instance.id]))
+
+
+@receiver(post_save, sender=Marca)
+def marca_salva(sender, instance, created, **kwargs):
+    if created:
+        return
+    produto_ids = list(instance.produtos.values_list('id', flat=True))
+    transaction.on_commit(partial(busca.indexar_produtos, produto_ids))
+
+
+@receiver([post_save, post_delete], sender=Produto)
+@receiver([post_save, post_delete], sender=Marca)
+@receiver([post_save, post_delete], sender=Cor)
+def catalogo_alterado(sender, **kwargs):
+    # Invalida os índices em memória derivados do catálogo (facetas)
+    transaction.on_commit(incrementar_versao_catalogo)
+
+
+_VARIANTES_DE = {Produto: 'produto_id', Marca: 'produto__marca_id', Cor: 'cor_id'}
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_save, sender=Marca)
+@receiver(post_save, sender=Cor)
+def nome_exibido_alterado(sender, instance, created, update_fields=None, **kwargs):
+    # Nomes de produto, marca e cor aparecem nas linhas do carrinho
+    if created or (update_fields is not None and 'nome' not in update_fields):
+        return
+    transaction.on_commit(partial(_enviar_variantes_modificadas, **{_VARIANTES_DE[sender]: instance.id}))
+
+
+@receiver(post_save, sender=Cor)
+def cor_salva(sender, instance, created, **kwargs):
+    if created:
+        return
+    produto_ids = list(instance.detalhes.values_list('produto_id', flat=True).distinct())
+    transaction.on_commit(partial(invalidar_matrizes, produto_ids))
+
+
+_TIPOS_AUTOCOMPLETAR = {
+    Produto: autocompletar.PRODUTO,
+    Marca: autocompletar.MARCA,
+    Cor: autocompletar.COR,
+}
+
+
+@receiver([post_save, post_delete], sender=Produto)
+@receiver([post_save, post_delete], sender=Marca)
+@receiver([post_save, post_delete], sender=Cor)
+def nome_alterado(sender, instance, update_fields=None, **kwargs):
+    # Só o nome entra nas sugestões do autocompletar
+    if update_fields is not None and 'nome' not in update_fields:
+        return
+    transaction.on_commit(
+        partial(autocompletar.entidade_alterada, _TIPOS_AUTOCOMPLETAR[sender], instance.id)
+    )
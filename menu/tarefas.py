@@ -0,0 +1,9 @@
+"""Tarefas da fila (tarefas/fila.py) do catálogo"""
+from tarefas.fila import tarefa
+
+
+@tarefa('menu.gerar_derivados_imagem')
+def gerar_derivados_imagem(produto_id):
+    from menu.imagens import atualizar_derivados_produto
+
+    atualizar_derivados_produto(produto_id)
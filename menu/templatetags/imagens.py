@@ -0,0 +1,45 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+from menu.imagens import derivados_desatualizados, nome_derivado, TIPOS_MIME
+
+register = template.Library()
+
+
+def _srcset(original, registro, formato):
+    return ', '.join(
+        f"{default_storage.url(nome_derivado(original, registro['hash'], largura, formato))} {largura}w"
+        for largura in registro['larguras']
+    )
+
+
+@register.simple_tag
+def imagem_responsiva(produto, classe='', sizes='100vw'):
+    """
+    <picture> com srcset dos derivados de Produto.imagem (AVIF/WebP/JPEG).
+    Enquanto os derivados da imagem atual não existem (produto novo ou
+    imagem trocada e a fila ainda não rodou), usa a imagem original.
+    """
+    registro = produto.imagem_derivados or {}
+    if not registro.get('hash') or derivados_desatualizados(produto):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy">',
+            produto.imagem.url, produto.nome, classe,
+        )
+
+    original = registro['original']
+    fontes = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (TIPOS_MIME[formato], _srcset(original, registro, formato), sizes)
+            for formato in registro['formatos'] if formato != 'jpeg'
+        ),
+    )
+    menor = registro['larguras'][0]
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy"></picture>',
+        fontes,
+        default_storage.url(nome_derivado(original, registro['hash'], menor, 'jpeg')),
+        _srcset(original, registro, 'jpeg'),
+        sizes, produto.nome, classe,
+    )
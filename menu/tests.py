@@ -1,3 +1,738 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from clientes.models import CustomUser
+from menu import busca
+from menu.busca import buscar_produtos, reconstruir_indice
+from menu.facetas import obter_indice
+from menu.imagens import FORMATOS, nome_derivado
+from menu.models import Cor, DetalheProduto, Marca, Produto, ResumoProduto
+from menu.resumo import produtos_do_catalogo, reconstruir_resumos
+from menu.signals import estoque_alterado
+from menu.templatetags.imagens import imagem_responsiva
+from menu.variantes import matriz_variantes
+from menu.versao import incrementar_versao_catalogo
+from utils.paginacao import codificar_cursor
+from pedidos.models import Carrinho, ItemCarrinho
+from tarefas import fila
+from tarefas.models import Tarefa
 
-# Create your tests here.
+
+class ConcorrenciaCarrinhoTests(TransactionTestCase):
+    """
+    Dispara várias requisições simultâneas nos endpoints do carrinho e
+    confere as quantidades finais: nenhuma atualização perdida, nenhuma
+    linha duplicada e nunca mais unidades do que o estoque.
+    """
+    REQUISICOES = 16
+
+    def setUp(self):
+        self.usuario = CustomUser.objects.create_user(
+            username='concorrente', password='senha', email='concorrente@example.com', cpf='1',
+        )
+        self.carrinho = Carrinho.objects.create(cliente=self.usuario)
+        produto = Produto.objects.create(nome='Runner', marca=Marca.objects.create(nome='Marca'))
+        self.variante = DetalheProduto.objects.create(
+            produto=produto, cor=Cor.objects.create(nome='Preto'),
+            tamanho='40', genero='M', preco=100, estoque=100,
+        )
+        cliente = Client()
+        cliente.force_login(self.usuario)
+        self.cookies = cliente.cookies
+
+    def disparar(self, url, vezes=REQUISICOES, corpo=None):
+        """Faz `vezes` GETs (ou POSTs JSON, com `corpo`) em paralelo em `url`; retorna os status HTTP"""
+        barreira = threading.Barrier(vezes)
+        status = []
+
+        def requisitar():
+            cliente = Client()
+            cliente.cookies = self.cookies
+            try:
+                barreira.wait()
+                if corpo is None:
+                    resposta = cliente.get(url)
+                else:
+                    resposta = cliente.post(url, corpo, content_type='application/json')
+                status.append(resposta.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=requisitar) for _ in range(vezes)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return status
+
+    def itens(self):
+        return ItemCarrinho.objects.filter(carrinho=self.carrinho, detalhe_produto=self.variante)
+
+    def test_adicoes_simultaneas_somam_na_mesma_linha(self):
+        status = self.disparar(f'/adicionar_ao_carrinho/{self.variante.id}/')
+
+        self.assertEqual(status.count(200), self.REQUISICOES)
+        self.assertEqual(self.itens().count(), 1)
+        self.assertEqual(self.itens().get().quantidade, self.REQUISICOES)
+
+    def test_adicoes_simultaneas_respeitam_o_estoque(self):
+        DetalheProduto.objects.filter(id=self.variante.id).update(estoque=5)
+
+        status = self.disparar(f'/adicionar_ao_carrinho/{self.variante.id}/')
+
+        self.assertEqual(status.count(200), 5)
+        self.assertEqual(status.count(400), self.REQUISICOES - 5)
+        self.assertEqual(self.itens().get().quantidade, 5)
+
+    def test_remocoes_simultaneas_nao_ficam_negativas(self):
+        ItemCarrinho.objects.create(carrinho=self.carrinho, detalhe_produto=self.variante, quantidade=10)
+
+        status = self.disparar(f'/remover_do_carrinho/{self.variante.id}/')
+
+        self.assertEqual(status.count(200), 10)
+        self.assertEqual(status.count(400), self.REQUISICOES - 10)
+        self.assertFalse(self.itens().exists())
+
+    def test_adicoes_e_remocoes_simultaneas(self):
+        ItemCarrinho.objects.create(carrinho=self.carrinho, detalhe_produto=self.variante, quantidade=20)
+        adicionar = f'/adicionar_ao_carrinho/{self.variante.id}/'
+        remover = f'/remover_do_carrinho/{self.variante.id}/'
+
+        resultados = {}
+        threads = [
+            threading.Thread(target=lambda: resultados.update(adicoes=self.disparar(adicionar))),
+            threading.Thread(target=lambda: resultados.update(remocoes=self.disparar(remover))),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(resultados['adicoes'].count(200), self.REQUISICOES)
+        self.assertEqual(resultados['remocoes'].count(200), self.REQUISICOES)
+        self.assertEqual(self.itens().get().quantidade, 20)
+
+    def test_lotes_e_adicoes_simultaneos_na_linha_nova(self):
+        # A linha ainda não existe: o lote e as adições disputam a criação
+        adicionar = f'/adicionar_ao_carrinho/{self.variante.id}/'
+        lote = {'operacoes': [{'variante': self.variante.id, 'delta': 2}]}
+
+        resultados = {}
+        threads = [
+            threading.Thread(target=lambda: resultados.update(adicoes=self.disparar(adicionar))),
+            threading.Thread(target=lambda: resultados.update(
+                lotes=self.disparar('/atualizar_carrinho/', corpo=lote)
+            )),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(resultados['adicoes'].count(200), self.REQUISICOES)
+        self.assertEqual(resultados['lotes'].count(200), self.REQUISICOES)
+        self.assertEqual(self.itens().get().quantidade, 3 * self.REQUISICOES)
+
+
+class CatalogoTestCase(TestCase):
+    """Base dos testes do catálogo: cliente logado e cache limpo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = CustomUser.objects.create_user(
+            username='cliente', password='senha', email='cliente@example.com', cpf='1',
+        )
+        cls.marca = Marca.objects.create(nome='Olympikus')
+        cls.cor = Cor.objects.create(nome='Preto')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def criar_produtos(self, nomes, descricao='', **variante):
+        """Cria os produtos com uma variante cada, sem sinais, e atualiza resumo e índice de busca"""
+        produtos = Produto.objects.bulk_create([
+            Produto(nome=nome, descricao=descricao, marca=self.marca) for nome in nomes
+        ])
+        DetalheProduto.objects.bulk_create([
+            DetalheProduto(
+                produto=produto, cor=variante.get('cor', self.cor), tamanho=variante.get('tamanho', '40'),
+                genero=variante.get('genero', 'M'), preco=variante.get('preco', 100),
+                estoque=variante.get('estoque', 10),
+            )
+            for produto in produtos
+        ])
+        reconstruir_resumos()
+        reconstruir_indice()
+        return produtos
+
+
+class BuscaTests(CatalogoTestCase):
+    def test_relevancia_e_acentos(self):
+        na_descricao, = self.criar_produtos(['Corrida leve'], descricao='Um tênis macio')
+        no_nome, = self.criar_produtos(['Tênis Corrida'])
+
+        self.assertEqual(buscar_produtos('tenis'), [no_nome.id, na_descricao.id])
+        self.assertEqual(buscar_produtos('TÊN'), [no_nome.id, na_descricao.id])
+        self.assertEqual(buscar_produtos('sandalia'), [])
+
+    def test_todos_os_resultados_sao_alcancaveis(self):
+        produtos = self.criar_produtos([f'Tênis {n:03d}' for n in range(300)])
+
+        vistos = []
+        cursor = ''
+        while True:
+            resposta = self.client.get('/buscar/', {'q': 'tenis', 'cursor': cursor})
+            pagina = resposta.context['page_obj']
+            vistos += [produto.id for produto in pagina]
+            if not pagina.has_next():
+                break
+            cursor = pagina.next_cursor
+
+        self.assertEqual(sorted(vistos), sorted(produto.id for produto in produtos))
+        self.assertEqual(vistos, buscar_produtos('tenis'))
+
+    @mock.patch.object(busca, 'TAMANHO_LOTE', 5)
+    def test_paginas_filtradas_por_facetas_saem_do_banco_em_lotes(self):
+        # Os de tamanho 40 vêm antes na ordem: os primeiros lotes são descartados inteiros
+        produtos = self.criar_produtos([f'Tênis {n:02d}' for n in range(30)], tamanho='40')
+        produtos += self.criar_produtos([f'Tênis {n:02d}' for n in range(30, 60)], tamanho='42')
+        esperados = [pk for pk in buscar_produtos('tenis') if pk in {p.id for p in produtos[30:]}]
+
+        with mock.patch.object(busca, 'buscar_produtos', wraps=buscar_produtos) as conjunto:
+            vistos, cursor, anterior = [], '', None
+            while True:
+                resposta = self.client.get('/buscar/', {'q': 'tenis', 'tamanho': '42', 'cursor': cursor})
+                pagina = resposta.context['page_obj']
+                vistos.append([produto.id for produto in pagina])
+                if not pagina.has_next():
+                    break
+                anterior, cursor = cursor, pagina.next_cursor
+        # O conjunto das facetas é montado uma vez e reaproveitado nas outras páginas
+        self.assertEqual(conjunto.call_count, 1)
+
+        self.assertEqual([len(ids) for ids in vistos], [12, 12, 6])
+        self.assertEqual(sum(vistos, []), esperados)
+        resposta = self.client.get('/buscar/', {'q': 'tenis', 'tamanho': '42', 'cursor': pagina.previous_cursor})
+        self.assertEqual([produto.id for produto in resposta.context['page_obj']], vistos[1])
+        tamanhos = next(f for f in resposta.context['facetas'] if f['nome'] == 'tamanho')
+        self.assertEqual({o['valor']: o['quantidade'] for o in tamanhos['opcoes']}, {'40': 30, '42': 30})
+
+    def test_conjunto_das_facetas_acompanha_o_indice(self):
+        produto, = self.criar_produtos(['Tênis Corrida'])
+        self.assertEqual(busca.conjunto_da_busca('tenis', obter_indice()).bit_count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            produto.nome = 'Sandália'
+            produto.save(update_fields=['nome'])
+        self.assertEqual(busca.conjunto_da_busca('tenis', obter_indice()), 0)
+
+
+class PaginacaoTests(CatalogoTestCase):
+    def paginas(self, url, **parametros):
+        """Segue os cursores a partir da primeira página; retorna os nomes de cada página"""
+        paginas = []
+        cursor = ''
+        while True:
+            pagina = self.client.get(url, {**parametros, 'cursor': cursor}).context['page_obj']
+            paginas.append([produto.nome for produto in pagina])
+            if not pagina.has_next():
+                return paginas, pagina
+            cursor = pagina.next_cursor
+
+    def test_catalogo_em_ordem_de_nome_nos_dois_sentidos(self):
+        nomes = [f'Modelo {n:02d}' for n in range(30)]
+        self.criar_produtos(reversed(nomes))
+
+        paginas, ultima = self.paginas('/')
+        self.assertEqual([len(pagina) for pagina in paginas], [12, 12, 6])
+        self.assertEqual(sum(paginas, []), nomes)
+
+        anterior = self.client.get('/', {'cursor': ultima.previous_cursor}).context['page_obj']
+        self.assertEqual([produto.nome for produto in anterior], nomes[12:24])
+
+    def test_cursor_de_outro_modo_volta_ao_inicio(self):
+        self.criar_produtos([f'Modelo {n:02d}' for n in range(15)])
+
+        # Cursor de lista (chave int) numa listagem por QuerySet, e o contrário
+        resposta = self.client.get('/', {'cursor': codificar_cursor('n', 11)})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context['page_obj'][0].nome, 'Modelo 00')
+
+        resposta = self.client.get('/buscar/', {'q': 'modelo', 'cursor': codificar_cursor('n', ['Modelo 05', 1])})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.context['page_obj']), 12)
+
+    def test_cursor_adulterado_e_ignorado(self):
+        self.criar_produtos(['Modelo'])
+        resposta = self.client.get('/', {'cursor': 'nao-assinado'})
+        self.assertEqual([produto.nome for produto in resposta.context['page_obj']], ['Modelo'])
+
+
+class FacetasTests(CatalogoTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.branco = Cor.objects.create(nome='Branco')
+
+    def setUp(self):
+        super().setUp()
+        # Misto: Preto/42 e Branco/40 em estoque. Esgotado: só Branco/42, sem estoque
+        self.misto, = self.criar_produtos(['Misto'], tamanho='42')
+        self.esgotado, = self.criar_produtos(['Esgotado'], tamanho='42', cor=self.branco, estoque=0)
+        DetalheProduto.objects.create(
+            produto=self.misto, cor=self.branco, tamanho='40', genero='M', preco=100, estoque=3,
+        )
+        reconstruir_resumos()
+
+    def filtrar(self, **selecao):
+        return obter_indice().filtrar({faceta: set(valores) for faceta, valores in selecao.items()})
+
+    def test_facetas_de_variante_casam_na_mesma_variante(self):
+        preto, branco = str(self.cor.id), str(self.branco.id)
+
+        self.assertEqual(self.filtrar(tamanho=['42']), [self.misto.id])
+        self.assertEqual(self.filtrar(cor=[branco]), [self.misto.id])
+        self.assertEqual(self.filtrar(tamanho=['42'], cor=[preto]), [self.misto.id])
+        # O produto tem um 42 (preto) e um branco (40), mas nenhum branco 42
+        self.assertEqual(self.filtrar(tamanho=['42'], cor=[branco]), [])
+        self.assertEqual(self.filtrar(tamanho=['40', '42'], cor=[branco]), [self.misto.id])
+
+    def test_contagens_cruzam_por_variante(self):
+        preto, branco = str(self.cor.id), str(self.branco.id)
+
+        contagens = obter_indice().contagens({'tamanho': {'42'}})
+        self.assertEqual(contagens['cor'][preto], 1)
+        self.assertEqual(contagens['cor'].get(branco, 0), 0)
+        self.assertEqual(contagens['tamanho'], {'40': 1, '42': 1})
+        self.assertEqual(contagens['marca'][str(self.marca.id)], 1)
+
+    def test_listagem_filtrada_pela_url(self):
+        resposta = self.client.get('/', {'tamanho': '42', 'cor': str(self.branco.id)})
+        self.assertEqual(list(resposta.context['page_obj']), [])
+
+        resposta = self.client.get('/', {'tamanho': '40'})
+        self.assertEqual([produto.nome for produto in resposta.context['page_obj']], ['Misto'])
+
+
+
+class AutocompletarTests(CatalogoTestCase):
+    def sugestoes(self, texto):
+        resposta = self.client.get(reverse('menu:autocompletar'), {'q': texto})
+        return [(sugestao['tipo'], sugestao['rotulo']) for sugestao in resposta.json()['sugestoes']]
+
+    def test_exige_login(self):
+        self.client.logout()
+        resposta = self.client.get(reverse('menu:autocompletar'), {'q': 'run'})
+        self.assertEqual(resposta.status_code, 302)
+        self.assertIn(reverse('clientes:login_cliente'), resposta.url)
+
+    def test_url_vem_do_template(self):
+        self.assertContains(self.client.get(reverse('menu:index')), f'data-url="{reverse("menu:autocompletar")}"')
+
+    def test_sugere_so_produtos_do_catalogo(self):
+        self.criar_produtos(['Runner Pro'])
+        sem_variantes = Produto.objects.create(nome='Runner Lite', marca=self.marca)
+        self.assertEqual(self.sugestoes('runner'), [('produto', 'Runner Pro')])
+        self.assertEqual(self.sugestoes('olymp'), [('marca', 'Olympikus')])
+
+        # A primeira variante põe o produto no catálogo, e nas sugestões
+        with self.captureOnCommitCallbacks(execute=True):
+            DetalheProduto.objects.create(
+                produto=sem_variantes, cor=self.cor, tamanho='41', genero='M', preco=100, estoque=1,
+            )
+        self.assertEqual(self.sugestoes('runner'), [('produto', 'Runner Lite'), ('produto', 'Runner Pro')])
+
+class DerivadosImagemTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        configuracao = override_settings(MEDIA_ROOT=self.media)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.produto = Produto.objects.create(
+            nome='Runner', marca=Marca.objects.create(nome='Marca'), imagem=self.imagem(200, 'a.png'),
+        )
+
+    def imagem(self, largura, nome):
+        saida = io.BytesIO()
+        Image.new('RGB', (largura, largura // 2), (200, 30, 30)).save(saida, format='PNG')
+        return SimpleUploadedFile(nome, saida.getvalue(), content_type='image/png')
+
+    def processar_fila(self):
+        concluidas, falhas = fila.processar('teste')
+        self.assertEqual(falhas, 0)
+        self.produto.refresh_from_db()
+        return concluidas
+
+    def derivados(self):
+        registro = self.produto.imagem_derivados
+        return [
+            nome_derivado(registro['original'], registro['hash'], largura, formato)
+            for largura in registro['larguras'] for formato in FORMATOS
+        ]
+
+    def test_geracao_roda_na_fila_e_so_quando_a_imagem_muda(self):
+        self.assertEqual(Tarefa.objects.filter(nome='menu.gerar_derivados_imagem').count(), 1)
+        self.assertEqual(self.produto.imagem_derivados, {})
+        self.assertEqual(self.processar_fila(), 1)
+        # Imagem mais estreita que a menor largura: um derivado na própria largura
+        self.assertEqual(self.produto.imagem_derivados['larguras'], [200])
+        self.assertTrue(all(default_storage.exists(nome) for nome in self.derivados()))
+
+        self.produto.nome = 'Runner 2'
+        self.produto.save()
+        self.assertEqual(self.processar_fila(), 0)
+
+    def test_trocar_a_imagem_remove_os_derivados_antigos(self):
+        self.processar_fila()
+        antigos = self.derivados()
+
+        self.produto.imagem = self.imagem(700, 'b.png')
+        self.produto.save()
+        self.processar_fila()
+        self.assertEqual(self.produto.imagem_derivados['larguras'], [320, 640])
+        self.assertTrue(all(default_storage.exists(nome) for nome in self.derivados()))
+        self.assertFalse(any(default_storage.exists(nome) for nome in antigos))
+
+        self.produto.imagem = None
+        self.produto.save()
+        atuais = self.derivados()
+        self.processar_fila()
+        self.assertEqual(self.produto.imagem_derivados, {})
+        self.assertFalse(any(default_storage.exists(nome) for nome in atuais))
+
+    def test_imagem_trocada_usa_o_original_ate_a_fila_rodar(self):
+        self.processar_fila()
+        html = imagem_responsiva(self.produto)
+        self.assertIn('<picture>', html)
+        self.assertTrue(all(default_storage.url(nome) in html for nome in self.derivados() if nome.endswith('.jpg')))
+
+        self.produto.imagem = self.imagem(700, 'b.png')
+        self.produto.save()
+        self.assertEqual(
+            imagem_responsiva(self.produto),
+            f'<img src="{self.produto.imagem.url}" alt="Runner" class="" loading="lazy">',
+        )
+
+        self.processar_fila()
+        novo = nome_derivado(self.produto.imagem.name, self.produto.imagem_derivados['hash'], 640, 'jpeg')
+        self.assertIn(default_storage.url(novo), imagem_responsiva(self.produto))
+
+
+class ResumoProdutoTests(CatalogoTestCase):
+    def resumo(self, produto):
+        return ResumoProduto.objects.values_list('preco_minimo', 'estoque_total', 'qtd_variantes').get(produto=produto)
+
+    def variante(self, produto, tamanho='40', preco=100, estoque=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            return DetalheProduto.objects.create(
+                produto=produto, cor=self.cor, tamanho=tamanho, genero='M', preco=preco, estoque=estoque,
+            )
+
+    def test_acompanha_as_escritas_nas_variantes(self):
+        runner = Produto.objects.create(nome='Runner', marca=self.marca)
+        trail = Produto.objects.create(nome='Trail', marca=self.marca)
+        self.variante(runner, preco=120, estoque=2)
+        barata = self.variante(runner, tamanho='42', preco=90, estoque=3)
+        self.assertEqual(self.resumo(runner), (90, 5, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            barata.estoque = 7
+            barata.save()
+        self.assertEqual(self.resumo(runner), (90, 9, 2))
+
+        # Mover a variante atualiza os dois produtos
+        with self.captureOnCommitCallbacks(execute=True):
+            barata.produto = trail
+            barata.save()
+        self.assertEqual(self.resumo(runner), (120, 2, 1))
+        self.assertEqual(self.resumo(trail), (90, 7, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            barata.delete()
+        self.assertEqual(self.resumo(trail), (None, 0, 0))
+
+    def test_catalogo_le_o_resumo(self):
+        runner, = self.criar_produtos(['Runner'], preco=80, estoque=4)
+        Produto.objects.create(nome='Sem variantes', marca=self.marca)
+
+        produtos = list(produtos_do_catalogo())
+        self.assertEqual(
+            [(p.id, p.preco_minimo, p.estoque_total, p.qtd_variantes) for p in produtos], [(runner.id, 80, 4, 1)]
+        )
+        # Escrita sem sinais: só aparece depois de reconstruir_resumos
+        DetalheProduto.objects.filter(produto=runner).update(estoque=0)
+        self.assertEqual(produtos_do_catalogo().get().estoque_total, 4)
+        reconstruir_resumos()
+        self.assertEqual(produtos_do_catalogo().get().estoque_total, 0)
+
+
+class MatrizVariantesTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.branco = Cor.objects.create(nome='Branco')
+        self.produto, = self.criar_produtos(['Runner'], tamanho='42', preco=120, estoque=2)
+        self.branca = DetalheProduto.objects.create(
+            produto=self.produto, cor=self.branco, tamanho='40', genero='F', preco=90, estoque=5,
+        )
+        self.preta = self.produto.detalhes.get(cor=self.cor)
+
+    def test_grade_e_agregados_numa_consulta(self):
+        with self.assertNumQueries(1):
+            matriz = matriz_variantes(self.produto.id)
+        self.assertEqual(matriz['tamanhos'], ['40', '42'])
+        self.assertEqual(matriz['cores'], [[self.branco.id, 'Branco'], [self.cor.id, 'Preto']])
+        self.assertEqual([codigo for codigo, _ in matriz['generos']], ['F', 'M'])
+        self.assertEqual(matriz['variantes'], [
+            [self.branca.id, '40', self.branco.id, 'F', 90, 5],
+            [self.preta.id, '42', self.cor.id, 'M', 120, 2],
+        ])
+        self.assertEqual((matriz['estoque_total'], matriz['preco_minimo'], matriz['preco_maximo']), (7, 90, 120))
+
+        # Do cache, até uma escrita na variante
+        with self.assertNumQueries(0):
+            matriz_variantes(self.produto.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.branca.estoque = 0
+            self.branca.save()
+        self.assertEqual(matriz_variantes(self.produto.id)['estoque_total'], 2)
+
+    def test_renomear_a_cor_refaz_a_matriz(self):
+        matriz_variantes(self.produto.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.branco.nome = 'Gelo'
+            self.branco.save()
+        self.assertIn([self.branco.id, 'Gelo'], matriz_variantes(self.produto.id)['cores'])
+
+    def test_pagina_e_json_usam_a_matriz(self):
+        resposta = self.client.get(reverse('menu:produto_detalhado', args=[self.produto.id]))
+        self.assertEqual(resposta.context['tamanhos_disponiveis'], ['40', '42'])
+        self.assertEqual((resposta.context['preco_minimo'], resposta.context['preco_maximo']), (90, 120))
+
+        resposta = self.client.get(reverse('menu:variantes_produto', args=[self.produto.id]))
+        self.assertEqual(resposta.json()['campos'], ['id', 'tamanho', 'cor', 'genero', 'preco', 'estoque'])
+        self.assertEqual(len(resposta.json()['variantes']), 2)
+        self.assertEqual(self.client.get(reverse('menu:variantes_produto', args=[0])).status_code, 404)
+
+
+class FragmentosTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.produto, = self.criar_produtos(['Runner'])
+
+    def renomear_sem_sinais(self, nome):
+        Produto.objects.filter(id=self.produto.id).update(nome=nome)
+
+    def test_grade_vem_do_cache_ate_mudar_a_versao(self):
+        self.assertContains(self.client.get('/'), 'Runner')
+        self.renomear_sem_sinais('Runner Pro')
+
+        # Só sessão, usuário e carrinho: nenhuma consulta ao catálogo
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertNotContains(self.client.get('/'), 'Runner Pro')
+        self.assertFalse([q for q in consultas.captured_queries if 'menu_produto' in q['sql']])
+        # Outros parâmetros são outro fragmento
+        self.assertContains(self.client.get('/', {'ordem': 'x'}), 'Runner Pro')
+
+        incrementar_versao_catalogo()
+        self.assertContains(self.client.get('/'), 'Runner Pro')
+
+    def test_pagina_do_produto_refeita_a_cada_venda_dele(self):
+        url = reverse('menu:produto_detalhado', args=[self.produto.id])
+        self.assertContains(self.client.get(url), 'Runner')
+        DetalheProduto.objects.filter(produto=self.produto).update(preco=321)
+        self.assertNotContains(self.client.get(url), '321')
+
+        # O que a finalização do pedido chama depois da baixa de estoque
+        estoque_alterado([self.produto.id])
+        self.assertContains(self.client.get(url), '321')
+
+
+class ApiCatalogoTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.logout()
+        self.runner, self.trail = self.criar_produtos(['Runner', 'Trail'])
+
+    def test_lista_com_campos_escolhidos(self):
+        resposta = self.client.get(reverse('menu:api_produtos'), {'campos': 'id,nome,inexistente'})
+        self.assertEqual(resposta.json()['produtos'], [
+            {'id': self.runner.id, 'nome': 'Runner'}, {'id': self.trail.id, 'nome': 'Trail'},
+        ])
+        self.assertIsNone(resposta.json()['proximo'])
+        self.assertEqual(
+            self.client.get(reverse('menu:api_marcas')).json(), {'marcas': [{'id': self.marca.id, 'nome': 'Olympikus'}]}
+        )
+
+    def test_get_condicional_responde_304_sem_consultas(self):
+        url = reverse('menu:api_produtos')
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(0):
+            resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+        # Outros parâmetros, outra ETag
+        self.assertEqual(self.client.get(url, {'q': 'runner'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        incrementar_versao_catalogo()
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_produto_muda_de_etag_com_o_estoque_dele(self):
+        url = reverse('menu:api_produto', args=[self.runner.id])
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.json()['variantes']['estoque_total'], 10)
+        etag = resposta['ETag']
+
+        estoque_alterado([self.trail.id])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        estoque_alterado([self.runner.id])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.assertEqual(self.client.get(reverse('menu:api_produto', args=[0])).status_code, 404)
+
+
+class ImportacaoCatalogoTests(CatalogoTestCase):
+    CSV = (
+        'marca,produto,descricao,cor,tamanho,genero,preco,estoque,sku\n'
+        'Olympikus,Corre 3,Leve,Preto,40,M,"299,90",5,OL-40\n'
+        'Olympikus,Corre 3,,Branco,41,Masculino,299.90,2,\n'
+        'Mizuno,Wave,,Preto,42,F,499,1,MZ-42\n'
+        'Mizuno,Wave,,Preto,99,F,499,1,\n'
+        'Mizuno,Wave,,Preto,42,X,499,1,\n'
+    )
+
+    def importar(self, conteudo, sufixo='.csv', **opcoes):
+        with tempfile.NamedTemporaryFile('w', suffix=sufixo, delete=False, encoding='utf-8') as arquivo:
+            arquivo.write(conteudo)
+        self.addCleanup(os.remove, arquivo.name)
+        saida, erros = io.StringIO(), io.StringIO()
+        call_command('importar_catalogo', arquivo.name, stdout=saida, stderr=erros, lote=2, **opcoes)
+        return saida.getvalue(), erros.getvalue()
+
+    def variantes(self):
+        return set(DetalheProduto.objects.values_list(
+            'produto__marca__nome', 'produto__nome', 'cor__nome', 'tamanho', 'genero', 'preco', 'estoque', 'sku',
+        ))
+
+    def test_importa_em_lotes_e_pula_linhas_invalidas(self):
+        saida, erros = self.importar(self.CSV)
+
+        self.assertIn('5 linhas, 3 variantes, 2 produtos novos', saida)
+        self.assertIn('1 marcas e 1 cores novas, 2 linhas com erro', saida)
+        self.assertIn('tamanho inválido: 99', erros)
+        self.assertIn('gênero inválido: X', erros)
+        self.assertEqual(self.variantes(), {
+            ('Olympikus', 'Corre 3', 'Preto', '40', 'M', Decimal('299.90'), 5, 'OL-40'),
+            ('Olympikus', 'Corre 3', 'Branco', '41', 'M', Decimal('299.90'), 2, None),
+            ('Mizuno', 'Wave', 'Preto', '42', 'F', Decimal('499.00'), 1, 'MZ-42'),
+        })
+        # Resumos e busca atualizados no fim, sem sinais
+        corre = Produto.objects.get(nome='Corre 3')
+        self.assertEqual((corre.descricao, corre.resumo.estoque_total), ('Leve', 7))
+        self.assertEqual(buscar_produtos('wave'), [Produto.objects.get(nome='Wave').id])
+
+    def test_reimportar_atualiza_sem_duplicar(self):
+        self.importar(self.CSV)
+        saida, _ = self.importar(
+            '{"marca": "Olympikus", "produto": "Corre 3", "descricao": "Nova", "cor": "Preto", '
+            '"tamanho": "40", "genero": "M", "preco": 279.9, "estoque": 9}\n'
+            'não é json\n',
+            sufixo='.jsonl',
+        )
+
+        self.assertIn('0 produtos novos, 1 produtos atualizados', saida)
+        self.assertEqual(DetalheProduto.objects.count(), 3)
+        self.assertEqual(
+            DetalheProduto.objects.values_list('preco', 'estoque', 'sku').get(cor__nome='Preto', tamanho='40'),
+            (Decimal('279.90'), 9, None),
+        )
+        self.assertEqual(Produto.objects.get(nome='Corre 3').descricao, 'Nova')
+
+    def test_simulacao_nao_grava(self):
+        saida, _ = self.importar(self.CSV, dry_run=True)
+
+        self.assertIn('Simulação', saida)
+        self.assertFalse(DetalheProduto.objects.exists())
+        self.assertFalse(Marca.objects.filter(nome='Mizuno').exists())
+
+
+class ExportacaoCatalogoTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.runner, self.trail = self.criar_produtos(['Runner', 'Trail'])
+        ontem = timezone.now() - timedelta(days=1)
+        Produto.objects.update(atualizado_em=ontem)
+        DetalheProduto.objects.update(atualizado_em=ontem)
+        self.desde = timezone.now().isoformat()
+        self.usuario.is_staff = True
+        self.usuario.save()
+
+    def exportar(self, **parametros):
+        resposta = self.client.get(reverse('menu:exportar_catalogo'), parametros)
+        return resposta, b''.join(resposta.streaming_content).decode()
+
+    def test_so_para_a_equipe(self):
+        self.usuario.is_staff = False
+        self.usuario.save()
+        self.assertEqual(self.client.get(reverse('menu:exportar_catalogo')).status_code, 302)
+
+    def test_jsonl_e_csv_em_fluxo(self):
+        resposta, corpo = self.exportar()
+        self.assertEqual(resposta['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        linhas = [json.loads(linha) for linha in corpo.splitlines()]
+        self.assertEqual([(linha['produto'], linha['marca'], linha['preco']) for linha in linhas], [
+            ('Runner', 'Olympikus', '100.00'), ('Trail', 'Olympikus', '100.00'),
+        ])
+        self.assertIn('X-Exportado-Em', resposta)
+
+        _, corpo = self.exportar(formato='csv')
+        cabecalho, *linhas = list(csv.reader(io.StringIO(corpo)))
+        self.assertEqual(cabecalho[:4], ['variante_id', 'sku', 'produto_id', 'produto'])
+        self.assertEqual([linha[3] for linha in linhas], ['Runner', 'Trail'])
+
+    def test_incremental_pela_variante_ou_pelo_produto(self):
+        variante = self.trail.detalhes.get()
+        variante.estoque = 3
+        variante.save()
+        _, corpo = self.exportar(desde=self.desde)
+        self.assertEqual([json.loads(linha)['variante_id'] for linha in corpo.splitlines()], [variante.id])
+
+        self.runner.descricao = 'Nova'
+        self.runner.save()
+        _, corpo = self.exportar(desde=self.desde)
+        self.assertEqual([json.loads(linha)['produto'] for linha in corpo.splitlines()], ['Runner', 'Trail'])
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get(reverse('menu:exportar_catalogo'), {'formato': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('menu:exportar_catalogo'), {'desde': 'ontem'}).status_code, 400)
+
+    def test_comando_grava_o_arquivo(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as arquivo:
+            pass
+        self.addCleanup(os.remove, arquivo.name)
+        erros = io.StringIO()
+        call_command('exportar_catalogo', formato='csv', saida=arquivo.name, stderr=erros)
+
+        with open(arquivo.name, encoding='utf-8') as lido:
+            self.assertEqual(len(list(csv.reader(lido))), 3)
+        self.assertIn('2 variantes exportadas', erros.getvalue())
@@ -1,13 +1,20 @@
 from django.urls import path
-from . import views
+from . import views, api, exportacao
 app_name = 'menu'
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('menu/', views.index, name='index_alt'),
     path('buscar/', views.buscar, name='buscar'),
+    path('autocompletar/', views.autocompletar, name='autocompletar'),
     path('produto/<str:id>/', views.produto_detalhado, name='produto_detalhado'),
+    path('produto/<str:id>/variantes/', views.variantes_produto, name='variantes_produto'),
     path('adicionar_ao_carrinho/<str:id>/', views.adicionar_ao_carrinho, name='adicionar_ao_carrinho'),
     path('remover_do_carrinho/<str:id>/', views.remover_do_carrinho, name='remover_do_carrinho'),
     path('excluir_do_carrinho/<str:id>/', views.excluir_do_carrinho, name='excluir_do_carrinho'),
-]
\ No newline at end of file
+    path('atualizar_carrinho/', views.atualizar_carrinho, name='atualizar_carrinho'),
+    path('api/produtos/', api.produtos, name='api_produtos'),
+    path('api/produtos/<int:id>/', api.produto, name='api_produto'),
+    path('api/marcas/', api.marcas, name='api_marcas'),
+    path('exportar/catalogo/', exportacao.exportar_catalogo, name='exportar_catalogo'),
+]
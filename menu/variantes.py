@@ -0,0 +1,60 @@
+"""
+Matriz de variantes de um produto (tamanho × cor × gênero).
+
+Monta em uma única consulta a grade de variantes com estoque e preço por
+célula, as opções disponíveis e os agregados usados em produto_detalhado.
+O resultado fica no cache por produto e é descartado pelos sinais de
+DetalheProduto e Cor (menu/signals.py).
+"""
+from django.core.cache import cache
+from menu.models import DetalheProduto, GENDER_CHOICES
+
+TEMPO_CACHE = 60 * 60
+CAMPOS_VARIANTE = ['id', 'tamanho', 'cor', 'genero', 'preco', 'estoque']
+_ROTULOS_GENERO = dict(GENDER_CHOICES)
+
+
+def _chave(produto_id):
+    return f'menu:variantes:{produto_id}'
+
+
+def montar_matriz(produto_id):
+    linhas = DetalheProduto.objects.filter(produto_id=produto_id).values_list(
+        'id', 'tamanho', 'cor_id', 'cor__nome', 'genero', 'preco', 'estoque'
+    ).order_by('tamanho', 'cor__nome', 'genero')
+
+    tamanhos, cores, generos, variantes = set(), {}, set(), []
+    estoque_total = 0
+    preco_minimo = preco_maximo = None
+    for pk, tamanho, cor_id, cor_nome, genero, preco, estoque in linhas:
+        tamanhos.add(tamanho)
+        cores[cor_id] = cor_nome
+        generos.add(genero)
+        variantes.append([pk, tamanho, cor_id, genero, preco, estoque])
+        estoque_total += estoque
+        preco_minimo = preco if preco_minimo is None else min(preco_minimo, preco)
+        preco_maximo = preco if preco_maximo is None else max(preco_maximo, preco)
+
+    return {
+        'produto': int(produto_id),
+        'tamanhos': sorted(tamanhos),
+        'cores': sorted(([pk, nome] for pk, nome in cores.items()), key=lambda cor: cor[1]),
+        'generos': [[codigo, _ROTULOS_GENERO.get(codigo, codigo)] for codigo in sorted(generos)],
+        'campos': CAMPOS_VARIANTE,
+        'variantes': variantes,
+        'estoque_total': estoque_total,
+        'preco_minimo': preco_minimo or 0,
+        'preco_maximo': preco_maximo or 0,
+    }
+
+
+def matriz_variantes(produto_id):
+    matriz = cache.get(_chave(produto_id))
+    if matriz is None:
+        matriz = montar_matriz(produto_id)
+        cache.set(_chave(produto_id), matriz, TEMPO_CACHE)
+    return matriz
+
+
+def invalidar_matrizes(produto_ids):
+    cache.delete_many([_chave(produto_id) for produto_id in produto_ids])
@@ -0,0 +1,130 @@
+"""
+Versão do catálogo guardada no cache.
+
+Qualquer escrita em Produto, DetalheProduto, Marca ou Cor incrementa a
+versão (ver menu/signals.py), e os índices/caches derivados do catálogo
+comparam a versão com a que foi usada para construí-los.
+Com mais de um processo, o backend de cache precisa ser compartilhado
+(arquivo, Redis, Memcached) para que todos enxerguem a mesma versão.
+
+Vendas mudam só o estoque e não tocam na versão do catálogo: incrementam
+a versão do estoque e a de cada produto vendido (registrar_estoque_alterado).
+O índice de facetas aplica só os produtos alterados; a página do produto e
+a API do produto usam a versão do produto. A grade em cache e a API de
+listagem usam estoque_publicado(), que acompanha a versão do estoque com
+até INTERVALO_ESTOQUE_PUBLICADO segundos de atraso: numa venda movimentada
+eles mostram o estoque de alguns minutos atrás em vez de serem refeitos
+a cada pedido.
+"""
+import time
+from datetime import datetime, timezone
+from django.core.cache import cache
+
+CHAVE_VERSAO = 'menu:catalogo:versao'
+CHAVE_ALTERADO_EM = 'menu:catalogo:alterado_em'
+CHAVE_VERSAO_ESTOQUE = 'menu:estoque:versao'
+CHAVE_ESTOQUE_PUBLICADO = 'menu:estoque:publicado'
+CHAVE_ESTOQUE_CONFERIDO = 'menu:estoque:conferido'
+INTERVALO_ESTOQUE_PUBLICADO = 60 * 10
+TEMPO_REGISTRO_ESTOQUE = 60 * 60
+MAXIMO_REGISTROS_ESTOQUE = 1000
+
+
+def _versao_inicial():
+    # Se o cache for reiniciado a versão recomeça de um valor novo (relógio),
+    # nunca de um número que um índice em memória já tenha visto
+    return time.time_ns() // 1000
+
+
+def versao(chave):
+    """Valor atual de um contador de versão guardado no cache"""
+    valor = cache.get(chave)
+    if valor is None:
+        cache.add(chave, _versao_inicial(), timeout=None)
+        valor = cache.get(chave)
+    return valor
+
+
+def incrementar_versao(chave):
+    try:
+        return cache.incr(chave)
+    except ValueError:
+        cache.add(chave, _versao_inicial(), timeout=None)
+        return cache.get(chave)
+
+
+def versao_catalogo():
+    return versao(CHAVE_VERSAO)
+
+
+def incrementar_versao_catalogo():
+    cache.set(CHAVE_ALTERADO_EM, time.time(), timeout=None)
+    return incrementar_versao(CHAVE_VERSAO)
+
+
+def catalogo_alterado_em():
+    """Momento (UTC) da última escrita no catálogo, usado no Last-Modified"""
+    instante = cache.get(CHAVE_ALTERADO_EM)
+    if instante is None:
+        # Sem registro (cache reiniciado): assume que mudou agora
+        instante = time.time()
+        cache.add(CHAVE_ALTERADO_EM, instante, timeout=None)
+        instante = cache.get(CHAVE_ALTERADO_EM, instante)
+    return datetime.fromtimestamp(int(instante), tz=timezone.utc)
+
+
+def _chave_estoque_produto(produto_id):
+    return f'menu:estoque:produto:{produto_id}'
+
+
+def _chave_estoque_alterado(numero):
+    return f'menu:estoque:alterados:{numero}'
+
+
+def versao_estoque():
+    return versao(CHAVE_VERSAO_ESTOQUE)
+
+
+def versao_estoque_produto(produto_id):
+    return versao(_chave_estoque_produto(produto_id))
+
+
+def registrar_estoque_alterado(produto_ids):
+    """
+    Incrementa a versão do estoque e a dos produtos, e guarda na versão nova
+    quais produtos mudaram (lidos por estoque_alterado_entre).
+    """
+    produto_ids = list(produto_ids)
+    for produto_id in produto_ids:
+        incrementar_versao(_chave_estoque_produto(produto_id))
+    nova = incrementar_versao(CHAVE_VERSAO_ESTOQUE)
+    cache.set(_chave_estoque_alterado(nova), produto_ids, TEMPO_REGISTRO_ESTOQUE)
+    return nova
+
+
+def estoque_alterado_entre(anterior, atual):
+    """
+    Ids dos produtos com estoque alterado depois da versão `anterior` até a
+    `atual`, ou None se algum registro expirou (ou ainda não foi gravado).
+    """
+    if not 0 <= atual - anterior <= MAXIMO_REGISTROS_ESTOQUE:
+        return None
+    chaves = [_chave_estoque_alterado(v) for v in range(anterior + 1, atual + 1)]
+    registros = cache.get_many(chaves)
+    if len(registros) != len(chaves):
+        return None
+    return {produto_id for produto_ids in registros.values() for produto_id in produto_ids}
+
+
+def estoque_publicado():
+    """
+    (versão do estoque, instante em que ela foi vista), conferida com
+    versao_estoque() no máximo a cada INTERVALO_ESTOQUE_PUBLICADO segundos.
+    """
+    publicado = cache.get(CHAVE_ESTOQUE_PUBLICADO)
+    if publicado is None or cache.add(CHAVE_ESTOQUE_CONFERIDO, 1, INTERVALO_ESTOQUE_PUBLICADO):
+        atual = versao_estoque()
+        if publicado is None or publicado[0] != atual:
+            publicado = (atual, time.time())
+            cache.set(CHAVE_ESTOQUE_PUBLICADO, publicado, None)
+    return publicado
@@ -1,13 +1,64 @@
 from django.shortcuts import render, HttpResponse, get_object_or_404, redirect
 from django.contrib import messages
 from menu.models import Produto, DetalheProduto
-from pedidos.models import ItemCarrinho, Carrinho, Pedido
-from clientes.models import CustomUser
-from utils.functions import calcula_valor_total_carrinho
+from pedidos.carrinho import (
+    adicionar_item, remover_item, excluir_item, aplicar_operacoes,
+    EstoqueInsuficiente, OperacaoInvalida,
+)
+from menu.busca import PaginadorBusca, conjunto_da_busca
+from menu.resumo import produtos_do_catalogo
+from menu import facetas, autocompletar as indice_autocompletar
+from menu.variantes import matriz_variantes
+from menu.fragmentos import contexto_fragmento, contexto_preguicoso
+from menu.versao import versao_estoque_produto
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from django.core.paginator import Paginator
+from utils.paginacao import CursorPaginator
 from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from functools import partial
+import json
+
+
+def produtos_na_ordem(produto_ids):
+    """Carrega os produtos do catálogo preservando a ordem dos ids"""
+    por_id = produtos_do_catalogo().in_bulk(produto_ids)
+    return [por_id[pk] for pk in produto_ids if pk in por_id]
+
+
+def grade_do_catalogo(request, query=None):
+    """
+    Página de produtos e facetas da listagem (ou da busca, se `query`).
+    Na vitrine só roda quando o fragmento da grade não está no cache;
+    também é usada pela API do catálogo (menu/api.py).
+    """
+    selecao = facetas.selecao_da_requisicao(request.GET)
+    indice = facetas.obter_indice()
+    cursor = request.GET.get('cursor')
+    base_facetas = None
+
+    if query is not None:
+        # Página cortada no banco, por relevância; os filtros de facetas
+        # descartam ids de cada lote
+        restringir = partial(indice.restringir, selecao=selecao) if selecao else None
+        paginator = PaginadorBusca(query, 12, restringir)  # 12 produtos por pagina
+        page_obj = paginator.get_page(cursor)
+        page_obj.object_list = produtos_na_ordem([pk for pk, _ in page_obj.object_list])
+        base_facetas = conjunto_da_busca(query, indice)
+    elif selecao:
+        # Filtro resolvido pelo índice de facetas, já em ordem de nome
+        paginator = CursorPaginator(indice.filtrar(selecao), 12)  # 12 produtos por pagina
+        page_obj = paginator.get_page(cursor)
+        page_obj.object_list = produtos_na_ordem(page_obj.object_list)
+    else:
+        # 12 produtos por pagina, paginados por cursor (nome, id)
+        paginator = CursorPaginator(produtos_do_catalogo(), 12, ordering=('nome', 'id'))
+        page_obj = paginator.get_page(cursor)
+
+    return {
+        'page_obj': page_obj,
+        'facetas': indice.facetas(selecao, request.GET, base=base_facetas),
+        'filtros_ativos': bool(selecao),
+    }
 
 
 @login_required(login_url='clientes:login_cliente')
@@ -16,40 +67,16 @@ def index(request):
     Primeira tela do site.
     Exibe os produtos com informações agregadas dos detalhes
     """
-    from django.db.models import Min, Sum, Count
-    
-    # Get products with aggregated data from DetalheProduto
-    produtos = Produto.objects.annotate(
-        preco_minimo=Min('detalhes__preco'),
-        estoque_total=Sum('detalhes__estoque'),
-        qtd_variantes=Count('detalhes')
-    ).filter(qtd_variantes__gt=0).order_by('nome')
-    
-    paginator = Paginator(produtos, 12)  # 12 produtos por pagina
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    usuario = get_object_or_404(CustomUser, username=request.user)
-    carrinho_vinculado = get_object_or_404(Carrinho, cliente=usuario)
-
-    # Incorporacao da view carrinho_detalhado
-    item_carrinho = ItemCarrinho.objects.filter(carrinho=carrinho_vinculado)
-    subtotal = ItemCarrinho.objects.filter(carrinho=carrinho_vinculado).first()
-    if subtotal:
-        subtotal = subtotal.get_total()
-    else:
-        subtotal = 0
-    qtd_itens_carrinho = ItemCarrinho.objects.filter(
-        carrinho=carrinho_vinculado
-    ).count()
+    produtos = produtos_do_catalogo()
 
+    # O carrinho (cabeçalho e offcanvas) vem do context processor do app pedidos
     context = {
-        'page_obj': page_obj,
-        'carrinho': carrinho_vinculado,
-        'qtd_item_carrinho': qtd_itens_carrinho,
-        'item_carrinho': item_carrinho,
         'produtos': produtos,
-        'subtotal': subtotal,
+        **contexto_fragmento(request),
+        **contexto_preguicoso(
+            partial(grade_do_catalogo, request),
+            ['page_obj', 'facetas', 'filtros_ativos'],
+        ),
     }
 
     return render(request, 'menu/index.html', context)
@@ -57,116 +84,67 @@ def index(request):
 
 @login_required(login_url='clientes:login_cliente')
 def buscar(request):
-    from django.db.models import Min, Sum, Count
-    
-    usuario = get_object_or_404(CustomUser, username=request.user)
-    carrinho_vinculado = get_object_or_404(Carrinho, cliente=usuario)
-    qtd_itens_carrinho = ItemCarrinho.objects.filter(
-        carrinho=carrinho_vinculado
-    ).count()
-
     query = request.GET.get("q", '').strip()
     if query == "":
         return redirect('menu:index')
 
-    produtos = Produto.objects.filter(
-        Q(nome__icontains=str(query))
-        | Q(descricao__icontains=str(query))
-        | Q(marca__nome__icontains=str(query))
-    ).annotate(
-        preco_minimo=Min('detalhes__preco'),
-        estoque_total=Sum('detalhes__estoque'),
-        qtd_variantes=Count('detalhes')
-    ).filter(qtd_variantes__gt=0).order_by('nome')
-    
-    paginator = Paginator(produtos, 12)  # 12 produtos por pagina
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    item_carrinho = ItemCarrinho.objects.filter(carrinho=carrinho_vinculado)
-    subtotal = calcula_valor_total_carrinho(item_carrinho)
-    qtd_itens_carrinho = ItemCarrinho.objects.filter(
-        carrinho=carrinho_vinculado
-    ).count()
-
     context = {
-        'page_obj': page_obj,
-        'carrinho': carrinho_vinculado,
-        'qtd_item_carrinho': qtd_itens_carrinho,
-        'item_carrinho': item_carrinho,
-        'produtos': produtos,
-        'subtotal': subtotal,
         'query': query,
+        **contexto_fragmento(request),
+        **contexto_preguicoso(
+            partial(grade_do_catalogo, request, query),
+            ['page_obj', 'facetas', 'filtros_ativos'],
+        ),
     }
 
     return render(request, 'menu/index.html', context)
 
 
+@login_required(login_url='clientes:login_cliente')
+def autocompletar(request):
+    """
+    Sugestões para a caixa de busca enquanto o usuário digita.
+    Responde do índice em memória (menu/autocompletar.py), sem consultar o banco.
+    """
+    sugestoes = indice_autocompletar.sugerir(request.GET.get('q', ''))
+    return JsonResponse(
+        {'sugestoes': sugestoes},
+        json_dumps_params={'separators': (',', ':')},
+    )
+
+
 @login_required(login_url='clientes:login_cliente')
 def adicionar_ao_carrinho(request, id):
     """
     Adiciona uma variante específica (DetalheProduto) ao carrinho.
     O 'id' agora se refere ao DetalheProduto (variante com tamanho/cor/gênero específicos)
     """
-    usuario = get_object_or_404(CustomUser, username=request.user)
-    
     # Buscar o detalhe do produto (variante específica)
-    detalhe_produto = get_object_or_404(DetalheProduto, id=id)
-    carrinho_vinculado = get_object_or_404(Carrinho, cliente=usuario)
-    
-    # Verificar se a variante já está no carrinho
-    consulta = ItemCarrinho.objects.filter(
-        detalhe_produto=detalhe_produto, 
-        carrinho=carrinho_vinculado
-    )
+    detalhe_produto = get_object_or_404(DetalheProduto.objects.select_related('produto', 'cor'), id=id)
     
-    if consulta.exists():
-        item = consulta.first()
-        # Verificar se há estoque suficiente
-        if item.quantidade < detalhe_produto.estoque:
-            item.quantidade += 1
-            item.save()
-            message = f"{detalhe_produto.produto.nome} (quantidade atualizada)"
-        else:
-            return JsonResponse(
-                {
-                    "status": "error",
-                    "message": "Estoque insuficiente para este item"
-                },
-                status=400
-            )
+    # Incremento atômico, limitado ao estoque no mesmo comando
+    try:
+        quantidade = adicionar_item(request.carrinho.id, detalhe_produto.id)
+    except EstoqueInsuficiente as erro:
+        return JsonResponse({"status": "error", "message": str(erro)}, status=400)
+
+    if quantidade > 1:
+        message = f"{detalhe_produto.produto.nome} (quantidade atualizada)"
     else:
-        # Verificar se há estoque disponível
-        if detalhe_produto.estoque < 1:
-            return JsonResponse(
-                {
-                    "status": "error",
-                    "message": "Produto sem estoque"
-                },
-                status=400
-            )
-        
-        item = ItemCarrinho.objects.create(
-            detalhe_produto=detalhe_produto,
-            carrinho=carrinho_vinculado,
-            quantidade=1,
-        )
         message = f"{detalhe_produto.produto.nome} adicionado ao carrinho"
     
-    # Calcular totais
-    item_carrinho = ItemCarrinho.objects.filter(carrinho=carrinho_vinculado)
-    subtotal = calcula_valor_total_carrinho(item_carrinho)
-    qtd_itens_carrinho = item_carrinho.count()
+    # Totais já com a alteração; o resumo fica em cache para a próxima página
+    resumo = request.resumo_carrinho
 
     return JsonResponse(
         {
             "status": "success",
             "message": message,
-            "quantidade": item.quantidade,
-            "total": float(item.get_total()),
+            "quantidade": quantidade,
+            "total": float(detalhe_produto.preco * quantidade),
             "variante_id": detalhe_produto.id,
-            'qtd_item_carrinho': qtd_itens_carrinho,
-            "total_price": float(subtotal),
+            'qtd_item_carrinho': resumo.qtd_linhas,
+            "total_price": float(resumo.subtotal),
             "produto_nome": detalhe_produto.produto.nome,
             "variante_info": f"{detalhe_produto.cor.nome} - Tam {detalhe_produto.tamanho}",
         }
@@ -179,43 +157,26 @@ def remover_do_carrinho(request, id):
     Remove uma unidade de uma variante específica do carrinho.
     O 'id' se refere ao DetalheProduto (variante).
     """
-    usuario = get_object_or_404(CustomUser, username=request.user)
-    
-    detalhe_produto = get_object_or_404(DetalheProduto, id=id)
-    carrinho_vinculado = get_object_or_404(Carrinho, cliente=usuario)
-    
-    consulta = ItemCarrinho.objects.filter(
-        detalhe_produto=detalhe_produto, 
-        carrinho=carrinho_vinculado
-    ).first()
+    detalhe_produto = get_object_or_404(DetalheProduto.objects.select_related('produto'), id=id)
     
-    if consulta:
-        if consulta.quantidade > 1:
-            consulta.quantidade -= 1
-            consulta.save()
-            quantidade_atual = consulta.quantidade
-        elif consulta.quantidade == 1:
-            consulta.delete()
-            quantidade_atual = 0
-    else:
+    quantidade_atual = remover_item(request.carrinho.id, detalhe_produto.id)
+    if quantidade_atual is None:
         return JsonResponse(
             {"status": "error", "message": "Produto não encontrado no carrinho"},
             status=400,
         )
 
-    item_carrinho = ItemCarrinho.objects.filter(carrinho=carrinho_vinculado)
-    subtotal = calcula_valor_total_carrinho(item_carrinho)
-    qtd_itens_carrinho = item_carrinho.count()
+    resumo = request.resumo_carrinho
 
     return JsonResponse(
         {
             "status": "success",
             "message": f"{detalhe_produto.produto.nome} removido do carrinho",
             "quantidade": quantidade_atual,
-            "total": float(consulta.get_total()) if quantidade_atual > 0 else 0,
-            'qtd_item_carrinho': qtd_itens_carrinho,
+            "total": float(detalhe_produto.preco * quantidade_atual),
+            'qtd_item_carrinho': resumo.qtd_linhas,
             "variante_id": detalhe_produto.id,
-            "total_price": float(subtotal),
+            "total_price": float(resumo.subtotal),
         }
     )
 
@@ -226,34 +187,63 @@ def excluir_do_carrinho(request, id):
     Exclui completamente uma variante do carrinho.
     O 'id' se refere ao DetalheProduto (variante).
     """
-    usuario = get_object_or_404(CustomUser, username=request.user)
-    
-    detalhe_produto = get_object_or_404(DetalheProduto, id=id)
-    carrinho_vinculado = get_object_or_404(Carrinho, cliente=usuario)
+    detalhe_produto = get_object_or_404(DetalheProduto.objects.select_related('produto'), id=id)
     
-    consulta = ItemCarrinho.objects.filter(
-        detalhe_produto=detalhe_produto, 
-        carrinho=carrinho_vinculado
-    ).first()
-    
-    if consulta:
-        consulta.delete()
+    excluir_item(request.carrinho.id, detalhe_produto.id)
 
-    qtd_itens_carrinho = ItemCarrinho.objects.filter(
-        carrinho=carrinho_vinculado
-    ).count()
-    
-    item_carrinho = ItemCarrinho.objects.filter(carrinho=carrinho_vinculado)
-    subtotal = calcula_valor_total_carrinho(item_carrinho)
+    resumo = request.resumo_carrinho
 
     return JsonResponse(
         {
             "status": "success",
             "message": f"{detalhe_produto.produto.nome} excluído do carrinho",
             "quantidade": 0,
-            'qtd_item_carrinho': qtd_itens_carrinho,
+            'qtd_item_carrinho': resumo.qtd_linhas,
             "variante_id": detalhe_produto.id,
-            "total_price": float(subtotal),
+            "total_price": float(resumo.subtotal),
+        }
+    )
+
+
+@login_required(login_url='clientes:login_cliente')
+@require_POST
+def atualizar_carrinho(request):
+    """
+    Aplica várias alterações no carrinho de uma vez, numa transação.
+    Corpo JSON: {"operacoes": [{"variante": 12, "delta": 2}, {"variante": 7, "quantidade": 0}]}
+    O frontend junta os cliques em +/-/excluir e envia um lote só.
+    """
+    try:
+        operacoes = json.loads(request.body)['operacoes']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"status": "error", "message": "Requisição inválida"}, status=400)
+
+    try:
+        alvos, variantes = aplicar_operacoes(request.carrinho.id, operacoes)
+    except OperacaoInvalida as erro:
+        return JsonResponse({"status": "error", "message": str(erro)}, status=400)
+    except EstoqueInsuficiente as erro:
+        return JsonResponse(
+            {"status": "error", "message": str(erro), "erros": erro.erros},
+            status=400,
+        )
+
+    resumo = request.resumo_carrinho
+
+    return JsonResponse(
+        {
+            "status": "success",
+            "itens": [
+                {
+                    "variante_id": pk,
+                    "quantidade": quantidade,
+                    "total": float(variantes[pk][1] * quantidade),
+                    "produto_nome": variantes[pk][2],
+                }
+                for pk, quantidade in alvos.items()
+            ],
+            'qtd_item_carrinho': resumo.qtd_linhas,
+            "total_price": float(resumo.subtotal),
         }
     )
 
@@ -264,43 +254,37 @@ def produto_detalhado(request, id):
     Exibe detalhes completos de um produto com todas as variações
     de tamanho, cor e gênero disponíveis
     """
-    produto = get_object_or_404(Produto, id=id)
-    usuario = get_object_or_404(CustomUser, username=request.user)
-    carrinho_vinculado = get_object_or_404(Carrinho, cliente=usuario)
-    
-    # Buscar todos os detalhes do produto (variações)
-    detalhes = produto.detalhes.all().select_related('cor')
-    
-    # Agrupar tamanhos, cores e gêneros disponíveis (sem duplicatas)
-    tamanhos_disponiveis = sorted(set(detalhes.values_list('tamanho', flat=True)))
-    cores_disponiveis = list(detalhes.values_list('cor__nome', 'cor__id').distinct())
-    generos_disponiveis = sorted(set(detalhes.values_list('genero', flat=True)))
+    produto = get_object_or_404(Produto.objects.select_related('marca'), id=id)
     
-    # Calcular estoque total e preço (usar o menor preço)
-    estoque_total = sum(d.estoque for d in detalhes)
-    preco_minimo = min(d.preco for d in detalhes) if detalhes else 0
-    preco_maximo = max(d.preco for d in detalhes) if detalhes else 0
-    
-    # Informações do carrinho
-    qtd_itens_carrinho = ItemCarrinho.objects.filter(
-        carrinho=carrinho_vinculado
-    ).count()
-    item_carrinho = ItemCarrinho.objects.filter(carrinho=carrinho_vinculado)
-    subtotal = calcula_valor_total_carrinho(item_carrinho)
+    # Todas as variações em uma consulta (ou direto do cache)
+    matriz = matriz_variantes(produto.id)
 
     context = {
         'produto': produto,
-        'detalhes': detalhes,
-        'tamanhos_disponiveis': tamanhos_disponiveis,
-        'cores_disponiveis': cores_disponiveis,
-        'generos_disponiveis': generos_disponiveis,
-        'estoque_total': estoque_total,
-        'preco_minimo': preco_minimo,
-        'preco_maximo': preco_maximo,
-        'qtd_item_carrinho': qtd_itens_carrinho,
-        'item_carrinho': item_carrinho,
-        'subtotal': subtotal,
-        'carrinho': carrinho_vinculado,
+        'matriz': matriz,
+        'tamanhos_disponiveis': matriz['tamanhos'],
+        'cores_disponiveis': [(nome, pk) for pk, nome in matriz['cores']],
+        'generos_disponiveis': [codigo for codigo, _ in matriz['generos']],
+        'estoque_total': matriz['estoque_total'],
+        'preco_minimo': matriz['preco_minimo'],
+        'preco_maximo': matriz['preco_maximo'],
+        **contexto_fragmento(request),
+        # A página mostra o estoque: é refeita a cada venda do produto
+        'versao_estoque': versao_estoque_produto(produto.id),
     }
 
-    return render(request, 'menu/produto_detalhado.html', context)
\ No newline at end of file
+    return render(request, 'menu/produto_detalhado.html', context)
+
+
+@login_required(login_url='clientes:login_cliente')
+def variantes_produto(request, id):
+    """
+    Matriz de variantes do produto em JSON compacto, para a página
+    trocar de variante (e atualizar o estoque) sem recarregar.
+    """
+    if not Produto.objects.filter(id=id).exists():
+        return JsonResponse({"status": "error", "message": "Produto não encontrado"}, status=404)
+    return JsonResponse(
+        matriz_variantes(id),
+        json_dumps_params={'separators': (',', ':')},
+    )
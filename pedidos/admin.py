@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import *
+from .carrinho import anotar_resumo, carrinho_alterado
 
 
 class ItemCarrinhoInline(admin.TabularInline):
@@ -36,6 +37,24 @@ class ItemCarrinhoAdmin(admin.ModelAdmin):
     list_filter = ('carrinho__cliente',)
     search_fields = ('detalhe_produto__produto__nome', 'carrinho__cliente__username')
     readonly_fields = ('get_total_display',)
+
+    # Edições pelo admin não passam por pedidos/carrinho.py: invalidam o resumo aqui
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        carrinho_alterado(obj.carrinho_id)
+        anterior = form.initial.get('carrinho')
+        if anterior is not None and anterior != obj.carrinho_id:
+            carrinho_alterado(anterior)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        carrinho_alterado(obj.carrinho_id)
+
+    def delete_queryset(self, request, queryset):
+        carrinho_ids = set(queryset.values_list('carrinho_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for carrinho_id in carrinho_ids:
+            carrinho_alterado(carrinho_id)
     
     def get_produto_nome(self, obj):
         return obj.detalhe_produto.produto.nome
@@ -60,16 +79,25 @@ class CarrinhoAdmin(admin.ModelAdmin):
     list_filter = ('cliente',)
     search_fields = ('cliente__username', 'cliente__email')
     inlines = [ItemCarrinhoInline]
-    
+
+    def get_queryset(self, request):
+        # Totais de todos os carrinhos da página numa só consulta
+        return anotar_resumo(super().get_queryset(request).select_related('cliente'))
+
+    def save_related(self, request, form, formsets, change):
+        # Itens editados no inline
+        super().save_related(request, form, formsets, change)
+        carrinho_alterado(form.instance.pk)
+
     def get_total_itens(self, obj):
-        return obj.itens.count()
+        return obj.qtd_linhas
     get_total_itens.short_description = 'Qtd Itens'
-    
+    get_total_itens.admin_order_field = 'qtd_linhas'
+
     def get_valor_total(self, obj):
-        from utils.functions import calcula_valor_total_carrinho
-        total = calcula_valor_total_carrinho(obj.id)
-        return f'R$ {total:.2f}'
+        return f'R$ {obj.subtotal:.2f}'
     get_valor_total.short_description = 'Valor Total'
+    get_valor_total.admin_order_field = 'subtotal'
 
 
 @admin.register(Pedido)
@@ -113,3 +141,20 @@ class ItemPedidoAdmin(admin.ModelAdmin):
     def get_total_display(self, obj):
         return f'R$ {obj.get_total():.2f}'
     get_total_display.short_description = 'Total'
+
+
+@admin.register(ReservaEstoque)
+class ReservaEstoqueAdmin(admin.ModelAdmin):
+    list_display = ('detalhe_produto', 'carrinho', 'quantidade', 'expira_em')
+    list_select_related = ('detalhe_produto__produto', 'detalhe_produto__cor', 'carrinho__cliente')
+    raw_id_fields = ('detalhe_produto', 'carrinho')
+    date_hierarchy = 'expira_em'
+
+
+@admin.register(PedidoArquivado)
+class PedidoArquivadoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'cliente', 'total', 'metodo_pagamento', 'criado_em', 'arquivado_em')
+    list_select_related = ('cliente',)
+    search_fields = ('=id', 'cliente__username')
+    readonly_fields = [campo.name for campo in PedidoArquivado._meta.fields]
+    date_hierarchy = 'criado_em'
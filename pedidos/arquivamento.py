@@ -0,0 +1,103 @@
+"""
+Arquivamento de pedidos antigos.
+
+Pedidos criados antes do horizonte (ARQUIVAR_PEDIDOS_APOS_DIAS) saem de
+Pedido/ItemPedido e vão para PedidoArquivado, um registro por pedido com
+os itens em JSON. Cada lote é uma transação: lê os pedidos mais antigos e
+seus itens, grava os arquivados com bulk_create e apaga as linhas
+originais. Pedido e ItemPedido ficam só com os pedidos recentes.
+
+Os pedidos são sempre arquivados do mais antigo para o mais novo, então
+todo arquivado é anterior a qualquer pedido que continua em Pedido; é
+isso que permite ao histórico paginar as duas tabelas como uma só
+(utils.paginacao.CursorPaginatorEncadeado, ver historico()).
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from pedidos.carrinho import CAMPOS_LINHA, LinhaCarrinho
+from pedidos.models import ItemPedido, Pedido, PedidoArquivado
+from utils.paginacao import CursorPaginatorEncadeado
+
+TAMANHO_LOTE = 500
+CAMPOS_ITEM = (
+    'quantidade', 'detalhe_produto_id', 'preco_unitario',
+    *(f'detalhe_produto__{campo}' for campo in CAMPOS_LINHA[2:]),
+)
+
+
+def horizonte(dias=None):
+    """Instante antes do qual os pedidos são arquivados"""
+    if dias is None:
+        dias = getattr(settings, 'ARQUIVAR_PEDIDOS_APOS_DIAS', 365)
+    return timezone.now() - timedelta(days=dias)
+
+
+def _itens_por_pedido(pedido_ids):
+    itens = defaultdict(list)
+    linhas = ItemPedido.objects.filter(pedido_id__in=pedido_ids).order_by('id').values_list(
+        'pedido_id', *CAMPOS_ITEM
+    )
+    for pedido_id, *linha in linhas:
+        item = dict(zip(LinhaCarrinho.__slots__, linha))
+        item['preco'] = str(item['preco'])
+        itens[pedido_id].append(item)
+    return itens
+
+
+def arquivar_lote(antes_de, tamanho_lote=TAMANHO_LOTE):
+    """Arquiva os `tamanho_lote` pedidos mais antigos criados antes de `antes_de`; retorna quantos"""
+    with transaction.atomic():
+        pedidos = list(
+            Pedido.objects.filter(criado_em__lt=antes_de)
+            .order_by('criado_em', 'id')
+            .values_list('id', 'cliente_id', 'total', 'endereco_envio', 'metodo_pagamento', 'criado_em')
+            [:tamanho_lote]
+        )
+        if not pedidos:
+            return 0
+        ids = [pedido[0] for pedido in pedidos]
+        itens = _itens_por_pedido(ids)
+        PedidoArquivado.objects.bulk_create([
+            PedidoArquivado(
+                id=pk,
+                cliente_id=cliente_id,
+                total=total,
+                endereco_envio=endereco,
+                metodo_pagamento=metodo,
+                criado_em=criado_em,
+                itens=itens[pk],
+            )
+            for pk, cliente_id, total, endereco, metodo, criado_em in pedidos
+        ])
+        ItemPedido.objects.filter(pedido_id__in=ids).delete()
+        Pedido.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def arquivar(antes_de, tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """Arquiva em lotes todos os pedidos anteriores a `antes_de`; retorna o total"""
+    total = 0
+    while arquivados := arquivar_lote(antes_de, tamanho_lote):
+        total += arquivados
+        if progresso:
+            progresso(total)
+    return total
+
+
+def historico(cliente, por_pagina):
+    """Paginador dos pedidos do cliente, recentes e arquivados, do mais novo ao mais antigo"""
+    recentes = Pedido.objects.filter(cliente=cliente).prefetch_related(
+        # Itens só dos pedidos da página, numa consulta, já com produto, marca e cor
+        Prefetch(
+            'itens',
+            queryset=ItemPedido.objects.select_related(
+                'detalhe_produto__produto__marca', 'detalhe_produto__cor'
+            ).order_by('id'),
+        )
+    )
+    arquivados = PedidoArquivado.objects.filter(cliente=cliente)
+    return CursorPaginatorEncadeado([recentes, arquivados], por_pagina, ordering=('-criado_em', '-id'))
@@ -0,0 +1,478 @@
+"""
+Teste de carga de venda relâmpago: muitos clientes disputando pouco estoque.
+
+Semeia um produto isolado (marca, cor e variantes só do teste, com estoque
+conhecido) e N clientes com carrinho e sessão. Cada cliente faz o caminho
+da compra: adicionar_ao_carrinho → GET finalizar_pedido (reserva o estoque
+e traz a chave de idempotência) → POST finalizar_pedido, opcionalmente
+reenviando o mesmo formulário. As threads começam juntas (Barrier); no fim
+a venda é conferida no banco e o resultado sai num dicionário pronto para
+JSON, comparável entre commits (comando `testar_carga`).
+
+Dois modos:
+  - no processo (padrão): django.test.Client em cada thread, cada uma com a
+    própria conexão. Além da latência, mede consultas por requisição e o
+    tempo esperando travas (BEGIN IMMEDIATE no SQLite, SELECT ... FOR
+    UPDATE nos demais bancos). As threads dividem o GIL, então a vazão
+    medida aqui é um limite inferior.
+  - servidor (`url`): HTTP de verdade contra um servidor local (runserver,
+    gunicorn com vários processos etc.) usando o mesmo banco. Do lado do
+    cliente só dá para medir latência e códigos de resposta.
+
+A carga grava no banco configurado (e apaga o que criou, salvo com `manter`).
+Fora do banco de testes, o modo no processo só roda com
+`permitir_banco_local`: sem `url`, nada indica que o banco é descartável.
+"""
+import logging
+import math
+import re
+import secrets
+import subprocess
+import threading
+import time
+from collections import Counter, defaultdict
+from decimal import Decimal
+from http.cookies import SimpleCookie
+from importlib import import_module
+from urllib import error, parse, request as urlrequest
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.db.models import Count, F, Sum
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from clientes.models import CustomUser
+from dashboard.models import PedidoContabilizado, VendaDiaria
+from menu.models import SIZE_CHOICES, Cor, DetalheProduto, Marca, Produto
+from pedidos.models import Carrinho, ItemPedido, Pedido, ReservaEstoque
+from tarefas.models import Tarefa
+
+FORMATO = 1
+ENDERECO = 'Rua do Teste de Carga, 1'
+METODO_PAGAMENTO = 'pix'
+PRECO = Decimal('199.90')
+HOST = 'localhost'
+ETAPAS = ('adicionar', 'abrir_finalizacao', 'finalizar')
+
+_RE_CHAVE = re.compile(r'name="chave_idempotencia" value="([^"]+)"')
+_RE_CSRF = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class BancoNaoPermitido(Exception):
+    """Carga no processo contra um banco que não é o de testes, sem permissão explícita"""
+
+
+class Cenario:
+    """O que foi semeado para uma execução e precisa ser conferido e apagado depois"""
+
+    def __init__(self, rotulo, usuarios, sessoes, estoque_inicial):
+        self.rotulo = rotulo
+        self.usuarios = usuarios
+        self.sessoes = sessoes
+        self.estoque_inicial = estoque_inicial
+
+    @property
+    def variantes(self):
+        return list(self.estoque_inicial)
+
+
+class Resposta:
+    __slots__ = ('status', 'corpo', 'duracao', 'consultas', 'espera_trava', 'erro_trava', 'excecao')
+
+    def __init__(self, status, corpo, duracao, consultas=None, espera_trava=None, erro_trava=False, excecao=None):
+        self.status = status
+        self.corpo = corpo
+        self.duracao = duracao
+        self.consultas = consultas
+        self.espera_trava = espera_trava
+        self.erro_trava = erro_trava
+        self.excecao = excecao  # "Tipo: mensagem" da exceção que a requisição levantou
+
+
+def semear(usuarios, variantes=1, estoque=50):
+    """Cria o produto disputado e `usuarios` clientes já logados, cada um com carrinho"""
+    rotulo = secrets.token_hex(3)
+    marca = Marca.objects.create(nome=f'Carga {rotulo}')
+    cor = Cor.objects.create(nome=f'Carga {rotulo}')
+    produto = Produto.objects.create(nome=f'Venda relâmpago {rotulo}', marca=marca)
+    DetalheProduto.objects.bulk_create([
+        DetalheProduto(produto=produto, cor=cor, tamanho=tamanho, genero='U', estoque=estoque, preco=PRECO)
+        for tamanho, _ in SIZE_CHOICES[:variantes]
+    ])
+    variante_ids = produto.detalhes.order_by('id').values_list('id', flat=True)
+
+    prefixo = f'carga_{rotulo}_'
+    CustomUser.objects.bulk_create([
+        CustomUser(
+            username=f'{prefixo}{i:05d}',
+            email=f'{prefixo}{i:05d}@example.com',
+            cpf=f'c{rotulo}{i:05d}',
+            password='!',  # Sem senha utilizável: só entram pela sessão criada aqui
+        )
+        for i in range(usuarios)
+    ])
+    clientes = list(CustomUser.objects.filter(username__startswith=prefixo).order_by('id'))
+    Carrinho.objects.bulk_create([Carrinho(cliente=cliente) for cliente in clientes])
+
+    # Sessão autenticada de cada cliente, usada pelos dois modos
+    sessoes = []
+    for cliente in clientes:
+        navegador = Client(HTTP_HOST=HOST)
+        navegador.force_login(cliente)
+        sessoes.append(navegador.cookies[settings.SESSION_COOKIE_NAME].value)
+
+    return Cenario(rotulo, [cliente.id for cliente in clientes], sessoes, {pk: estoque for pk in variante_ids})
+
+
+def limpar(cenario):
+    """
+    Apaga o que a execução criou: clientes (com carrinhos e pedidos),
+    sessões, tarefas, vendas diárias e produto
+    """
+    pedido_ids = list(Pedido.objects.filter(cliente_id__in=cenario.usuarios).values_list('id', flat=True))
+    Tarefa.objects.filter(argumentos__pedido_id__in=pedido_ids).delete()
+    PedidoContabilizado.objects.filter(pedido_id__in=pedido_ids).delete()
+    VendaDiaria.objects.filter(detalhe_produto_id__in=cenario.variantes).delete()
+    CustomUser.objects.filter(id__in=cenario.usuarios).delete()
+    SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+    for chave in cenario.sessoes:
+        SessionStore(session_key=chave).delete()
+    produto = Produto.objects.filter(detalhes__id__in=cenario.variantes).select_related('marca').first()
+    if produto:
+        cor_ids = set(produto.detalhes.values_list('cor_id', flat=True))
+        produto.delete()
+        produto.marca.delete()
+        Cor.objects.filter(id__in=cor_ids).delete()
+
+
+def _descrever(erro):
+    return f'{type(erro).__name__}: {erro}'
+
+
+def _espera_trava(sql):
+    sql = sql.lstrip().upper()
+    return sql.startswith('BEGIN') or 'FOR UPDATE' in sql
+
+
+class NavegadorLocal:
+    """Cliente de teste do Django; mede as consultas da thread em cada requisição"""
+
+    def __init__(self, sessao):
+        self.cliente = Client(HTTP_HOST=HOST)
+        self.cliente.cookies[settings.SESSION_COOKIE_NAME] = sessao
+
+    def get(self, caminho):
+        return self._requisitar(self.cliente.get, caminho)
+
+    def post(self, caminho, dados):
+        return self._requisitar(self.cliente.post, caminho, dados)
+
+    def _requisitar(self, metodo, caminho, *args):
+        status, corpo, erro_trava, excecao = 500, '', False, None
+        inicio = time.perf_counter()
+        with CaptureQueriesContext(connection) as consultas:
+            try:
+                resposta = metodo(caminho, *args)
+                status, corpo = resposta.status_code, resposta.content.decode()
+            except Exception as erro:
+                # O cliente de teste repassa a exceção da view; conta como 500 no relatório
+                excecao = _descrever(erro)
+                # "database is locked" no SQLite, lock timeout nos demais
+                erro_trava = isinstance(erro, OperationalError) and 'lock' in str(erro).lower()
+        duracao = time.perf_counter() - inicio
+        espera = sum(float(q['time']) for q in consultas.captured_queries if _espera_trava(q['sql']))
+        return Resposta(status, corpo, duracao, len(consultas), espera, erro_trava, excecao)
+
+
+class NavegadorHTTP:
+    """Requisições HTTP de verdade contra `url`, guardando os cookies da sessão"""
+
+    def __init__(self, url, sessao):
+        self.url = url.rstrip('/')
+        self.cookies = {settings.SESSION_COOKIE_NAME: sessao}
+
+    def get(self, caminho):
+        return self._requisitar(caminho)
+
+    def post(self, caminho, dados):
+        return self._requisitar(caminho, parse.urlencode(dados).encode())
+
+    def _requisitar(self, caminho, dados=None):
+        pedido = urlrequest.Request(
+            self.url + caminho,
+            data=dados,
+            headers={
+                'Cookie': '; '.join(f'{nome}={valor}' for nome, valor in self.cookies.items()),
+                'Referer': self.url + caminho,
+            },
+        )
+        inicio = time.perf_counter()
+        try:
+            with urlrequest.urlopen(pedido, timeout=60) as resposta:
+                status, corpo, cabecalhos = resposta.status, resposta.read().decode(), resposta.headers
+        except error.HTTPError as erro:
+            status, corpo, cabecalhos = erro.code, erro.read().decode(errors='replace'), erro.headers
+        except (error.URLError, OSError) as erro:
+            # Conexão recusada ou tempo esgotado: conta como status 0
+            return Resposta(0, '', time.perf_counter() - inicio, excecao=_descrever(erro))
+        duracao = time.perf_counter() - inicio
+        for valor in cabecalhos.get_all('Set-Cookie') or []:
+            for nome, morsel in SimpleCookie(valor).items():
+                self.cookies[nome] = morsel.value
+        return Resposta(status, corpo, duracao)
+
+
+class Medidas:
+    """Respostas de todas as threads, por etapa"""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.respostas = defaultdict(list)
+        self.resultados = Counter()
+
+    def registrar(self, etapa, resposta):
+        with self._trava:
+            self.respostas[etapa].append(resposta)
+
+    def contar(self, resultado):
+        with self._trava:
+            self.resultados[resultado] += 1
+
+
+def comprar(navegador, variante_id, quantidade, reenvios, medidas):
+    """O caminho de um cliente: adiciona, abre a finalização e envia o formulário"""
+    for _ in range(quantidade):
+        medidas.registrar('adicionar', navegador.get(
+            reverse('menu:adicionar_ao_carrinho', args=[variante_id])
+        ))
+
+    caminho = reverse('pedidos:finalizar_pedido')
+    pagina = navegador.get(caminho)
+    medidas.registrar('abrir_finalizacao', pagina)
+    chave = _RE_CHAVE.search(pagina.corpo)
+    if pagina.status != 200 or not chave:
+        # Carrinho vazio (nenhuma adição passou) ou erro: não há o que finalizar
+        medidas.contar('sem_carrinho' if pagina.status in (200, 302) else 'erro')
+        return
+
+    csrf = _RE_CSRF.search(pagina.corpo)
+    dados = {
+        'endereco': ENDERECO,
+        'metodo_pagamento': METODO_PAGAMENTO,
+        'chave_idempotencia': chave.group(1),
+        'csrfmiddlewaretoken': csrf.group(1) if csrf else '',
+    }
+    for _ in range(1 + reenvios):
+        resposta = navegador.post(caminho, dados)
+        medidas.registrar('finalizar', resposta)
+    if resposta.status != 200:
+        medidas.contar('erro')
+    elif _RE_CHAVE.search(resposta.corpo):
+        # O formulário voltou com as mensagens de estoque
+        medidas.contar('sem_estoque')
+    else:
+        medidas.contar('pedido')
+
+
+def _rodar(cenario, threads, quantidade, reenvios, url, medidas):
+    variantes = cenario.variantes
+    fila = iter(enumerate(cenario.sessoes))
+    proximo = threading.Lock()
+    largada = threading.Barrier(threads + 1)
+
+    def trabalhar():
+        try:
+            largada.wait()
+            while True:
+                with proximo:
+                    item = next(fila, None)
+                if item is None:
+                    return
+                indice, sessao = item
+                navegador = NavegadorHTTP(url, sessao) if url else NavegadorLocal(sessao)
+                comprar(navegador, variantes[indice % len(variantes)], quantidade, reenvios, medidas)
+        finally:
+            connections.close_all()
+
+    # Sem estoque, adicionar_ao_carrinho responde 400 e o Django registra cada um
+    registro = logging.getLogger('django.request')
+    nivel = registro.level
+    registro.setLevel(logging.ERROR)
+    trabalhadores = [threading.Thread(target=trabalhar, daemon=True) for _ in range(threads)]
+    try:
+        for trabalhador in trabalhadores:
+            trabalhador.start()
+        largada.wait()
+        inicio = time.perf_counter()
+        for trabalhador in trabalhadores:
+            trabalhador.join()
+        return time.perf_counter() - inicio
+    finally:
+        registro.setLevel(nivel)
+
+
+def percentil(valores, p):
+    """Percentil por posição mais próxima; valores já ordenados"""
+    if not valores:
+        return None
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+def _ms(segundos):
+    return None if segundos is None else round(segundos * 1000, 2)
+
+
+def _resumo_etapa(respostas, mede_banco):
+    duracoes = sorted(resposta.duracao for resposta in respostas)
+    resumo = {
+        'requisicoes': len(respostas),
+        'por_status': dict(sorted(Counter(str(resposta.status) for resposta in respostas).items())),
+        'latencia_ms': {
+            'media': _ms(sum(duracoes) / len(duracoes)) if duracoes else None,
+            'p50': _ms(percentil(duracoes, 50)),
+            'p95': _ms(percentil(duracoes, 95)),
+            'p99': _ms(percentil(duracoes, 99)),
+            'max': _ms(duracoes[-1]) if duracoes else None,
+        },
+        'consultas': None,
+        'travas': None,
+        # Exceções levantadas em vez de uma resposta, pela mensagem
+        'excecoes': dict(Counter(resposta.excecao for resposta in respostas if resposta.excecao).most_common()),
+    }
+    if mede_banco and respostas:
+        consultas = sorted(resposta.consultas for resposta in respostas)
+        esperas = sorted(resposta.espera_trava for resposta in respostas)
+        resumo['consultas'] = {
+            'media': round(sum(consultas) / len(consultas), 2),
+            'p95': percentil(consultas, 95),
+            'max': consultas[-1],
+        }
+        resumo['travas'] = {
+            'espera_total_ms': _ms(sum(esperas)),
+            'espera_p99_ms': _ms(percentil(esperas, 99)),
+            'erros': sum(resposta.erro_trava for resposta in respostas),
+        }
+    return resumo
+
+
+def conferir(cenario):
+    """Violações de consistência da venda, lidas do banco depois da carga"""
+    variantes = cenario.variantes
+    vendidas = dict(
+        ItemPedido.objects.filter(detalhe_produto_id__in=variantes)
+        .values('detalhe_produto_id').annotate(total=Sum('quantidade'))
+        .values_list('detalhe_produto_id', 'total')
+    )
+    finais = dict(DetalheProduto.objects.filter(id__in=variantes).values_list('id', 'estoque'))
+    pedidos = Pedido.objects.filter(cliente_id__in=cenario.usuarios)
+    totais = pedidos.annotate(
+        soma=Sum(F('itens__quantidade') * F('itens__preco_unitario')),
+        itens_count=Count('itens'),
+    ).values_list('id', 'total', 'soma', 'itens_count')
+    com_tarefa = set(
+        Tarefa.objects.filter(nome='pedidos.pedido_criado')
+        .filter(argumentos__pedido_id__in=pedidos.values_list('id', flat=True))
+        .values_list('argumentos__pedido_id', flat=True)
+    )
+
+    violacoes = {
+        # Mais unidades vendidas do que havia
+        'vendas_alem_do_estoque': sum(
+            max(0, vendidas.get(pk, 0) - inicial) for pk, inicial in cenario.estoque_inicial.items()
+        ),
+        'estoque_negativo': sum(1 for estoque in finais.values() if estoque < 0),
+        # Baixa de estoque diferente do que os pedidos registram
+        'divergencias_estoque': sum(
+            1 for pk, inicial in cenario.estoque_inicial.items()
+            if inicial - finais[pk] != vendidas.get(pk, 0)
+        ),
+        # Cada cliente envia um formulário (com reenvios da mesma chave): no máximo um pedido
+        'pedidos_duplicados': sum(
+            total - 1 for total in
+            pedidos.values('cliente_id').annotate(total=Count('id')).filter(total__gt=1).values_list('total', flat=True)
+        ),
+        'pedidos_sem_itens': sum(1 for *_, itens in totais if not itens),
+        'totais_divergentes': sum(1 for _, total, soma, itens in totais if itens and total != soma),
+        'pedidos_sem_tarefa': sum(1 for pk, *_ in totais if pk not in com_tarefa),
+        # Reservas que deveriam ter sido consumidas pelo pedido
+        'reservas_restantes': ReservaEstoque.objects.filter(
+            carrinho__cliente_id__in=pedidos.values('cliente_id')
+        ).count(),
+    }
+    violacoes['ok'] = not any(violacoes.values())
+    return violacoes, sum(vendidas.values()), len(totais)
+
+
+def _commit():
+    try:
+        saida = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return saida.stdout.strip() or None
+
+
+def banco_de_teste():
+    """Se a conexão padrão aponta para o banco que o runner de testes cria"""
+    return connection.settings_dict['NAME'] == connection.creation._get_test_db_name()
+
+
+def executar(usuarios, threads, variantes=1, estoque=50, quantidade=1, reenvios=0, url=None, manter=False,
+             permitir_banco_local=False):
+    """Semeia, roda a carga, confere e (sem `manter`) apaga os dados; retorna o relatório"""
+    if not url and not permitir_banco_local and not banco_de_teste():
+        raise BancoNaoPermitido(
+            f"a carga no processo gravaria em {connection.settings_dict['NAME']}, que não é o banco de testes"
+        )
+    iniciado_em = timezone.now()
+    cenario = semear(usuarios, variantes, estoque)
+    medidas = Medidas()
+    try:
+        duracao = _rodar(cenario, threads, quantidade, reenvios, url, medidas)
+        consistencia, unidades_vendidas, pedidos = conferir(cenario)
+    finally:
+        if not manter:
+            limpar(cenario)
+
+    mede_banco = not url
+    requisicoes = sum(len(respostas) for respostas in medidas.respostas.values())
+    estoque_total = sum(cenario.estoque_inicial.values())
+    demanda = usuarios * quantidade
+    return {
+        'formato': FORMATO,
+        'commit': _commit(),
+        'iniciado_em': iniciado_em.isoformat(),
+        'modo': 'servidor' if url else 'processo',
+        'url': url,
+        'banco': connection.vendor,
+        'rotulo': cenario.rotulo,
+        'configuracao': {
+            'usuarios': usuarios,
+            'threads': threads,
+            'variantes': variantes,
+            'estoque_por_variante': estoque,
+            'quantidade': quantidade,
+            'reenvios': reenvios,
+        },
+        'duracao_s': round(duracao, 3),
+        'vazao': {
+            'requisicoes_por_s': round(requisicoes / duracao, 2) if duracao else None,
+            'pedidos_por_s': round(pedidos / duracao, 2) if duracao else None,
+        },
+        'etapas': {
+            etapa: _resumo_etapa(medidas.respostas.get(etapa, []), mede_banco) for etapa in ETAPAS
+        },
+        'resultados': dict(medidas.resultados),
+        'venda': {
+            'pedidos': pedidos,
+            'unidades_vendidas': unidades_vendidas,
+            'estoque_inicial': estoque_total,
+            'demanda': demanda,
+            # Unidades que havia e alguém queria, mas não foram vendidas (erros, disputa de reservas)
+            'nao_vendidas': max(0, min(estoque_total, demanda) - unidades_vendidas),
+        },
+        'consistencia': consistencia,
+    }
@@ -0,0 +1,394 @@
+"""
+Resumo do carrinho: subtotal, quantidade de linhas, quantidade de
+unidades e os itens já com variante, produto, marca e cor carregados.
+
+Os itens são LinhaCarrinho: objetos leves (com __slots__) montados de
+uma projeção com os campos que os templates mostram. O resumo completo é
+uma consulta só, qualquer que seja o tamanho do carrinho; sem os itens,
+é uma agregação.
+
+As alterações de quantidade são atômicas no banco: o incremento é um
+UPDATE com F() condicionado ao estoque da variante no mesmo comando, e a
+linha nova é inserida contando com a restrição única (carrinho, variante).
+Dois cliques simultâneos somam na mesma linha em vez de perder um deles
+ou criar uma linha duplicada.
+
+Com CARRINHO_ARMAZENAMENTO = 'cache' as mesmas funções operam sobre o
+carrinho guardado no cache (pedidos/carrinho_cache.py).
+
+resumo_em_cache guarda o resumo entre requisições. A chave leva só a
+versão do carrinho, incrementada por toda função daqui que altera o
+carrinho, pelo admin de ItemCarrinho e, quando preço ou nomes das
+variantes mudam, para os carrinhos que as contêm (pedidos/signals.py).
+Vendas e outras escritas no catálogo não invalidam os resumos. Um resumo
+desatualizado nunca é lido, só expira.
+"""
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import partial, wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, OuterRef, Sum, Value
+from django.db.models.functions import Coalesce
+from menu.models import GENDER_CHOICES
+from menu.versao import incrementar_versao, versao
+from pedidos.models import Carrinho, ItemCarrinho
+
+TEMPO_RESUMO = 60 * 10
+TENTATIVAS = 3
+MAXIMO_OPERACOES = 100
+
+_ZERO = Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+_GENEROS = dict(GENDER_CHOICES)
+
+# Campos de DetalheProduto lidos para cada linha, na ordem de LinhaCarrinho
+CAMPOS_LINHA = ('id', 'preco', 'produto__nome', 'produto__marca__nome', 'tamanho', 'cor__nome', 'genero')
+
+
+class LinhaCarrinho:
+    """Linha do carrinho como os templates a usam, sem instâncias de modelo"""
+    __slots__ = (
+        'quantidade', 'variante_id', 'preco', 'produto_nome', 'marca_nome', 'tamanho', 'cor_nome', 'genero',
+    )
+
+    def __init__(self, quantidade, variante_id, preco, produto_nome, marca_nome, tamanho, cor_nome, genero):
+        self.quantidade = quantidade
+        self.variante_id = variante_id
+        self.preco = preco
+        self.produto_nome = produto_nome
+        self.marca_nome = marca_nome
+        self.tamanho = tamanho
+        self.cor_nome = cor_nome
+        self.genero = genero
+
+    @property
+    def total(self):
+        return self.preco * self.quantidade
+
+    @property
+    def genero_display(self):
+        return _GENEROS.get(self.genero, self.genero)
+
+
+class ResumoCarrinho:
+    def __init__(self, carrinho_id, subtotal, qtd_linhas, qtd_unidades, itens):
+        self.carrinho_id = carrinho_id
+        self.subtotal = subtotal
+        self.qtd_linhas = qtd_linhas
+        self.qtd_unidades = qtd_unidades
+        self.itens = itens
+
+    def contexto(self):
+        """Variáveis que os templates do carrinho já usam"""
+        return {
+            'item_carrinho': self.itens,
+            'qtd_item_carrinho': self.qtd_linhas,
+            'subtotal': self.subtotal,
+        }
+
+
+def agregados(itens):
+    """Expressões de subtotal/linhas/unidades sobre um caminho de ItemCarrinho"""
+    prefixo = f'{itens}__' if itens else ''
+    return {
+        'subtotal': Coalesce(
+            Sum(F(f'{prefixo}quantidade') * F(f'{prefixo}detalhe_produto__preco')), _ZERO
+        ),
+        'qtd_linhas': Count(f'{prefixo}id'),
+        'qtd_unidades': Coalesce(Sum(f'{prefixo}quantidade'), 0),
+    }
+
+
+def linhas_do_carrinho(carrinho_id):
+    """LinhaCarrinho de cada item, na ordem em que entraram, numa consulta"""
+    campos = ['quantidade', *(f'detalhe_produto__{campo}' for campo in CAMPOS_LINHA)]
+    itens = ItemCarrinho.objects.filter(carrinho_id=carrinho_id).order_by('id')
+    return [LinhaCarrinho(*linha) for linha in itens.values_list(*campos)]
+
+
+def resumo_das_linhas(carrinho_id, linhas):
+    return ResumoCarrinho(
+        carrinho_id,
+        subtotal=sum((linha.total for linha in linhas), Decimal(0)),
+        qtd_linhas=len(linhas),
+        qtd_unidades=sum(linha.quantidade for linha in linhas),
+        itens=linhas,
+    )
+
+
+def _em_cache():
+    """Módulo do carrinho em cache, se CARRINHO_ARMAZENAMENTO = 'cache'"""
+    if getattr(settings, 'CARRINHO_ARMAZENAMENTO', 'banco') != 'cache':
+        return None
+    from pedidos import carrinho_cache
+    return carrinho_cache
+
+
+def resumo_carrinho(carrinho, com_itens=True):
+    """`carrinho` pode ser a instância de Carrinho ou o id"""
+    carrinho_id = getattr(carrinho, 'pk', carrinho)
+    if armazenamento := _em_cache():
+        return armazenamento.resumo(carrinho_id, com_itens)
+    if com_itens:
+        return resumo_das_linhas(carrinho_id, linhas_do_carrinho(carrinho_id))
+    totais = ItemCarrinho.objects.filter(carrinho_id=carrinho_id).aggregate(**agregados(None))
+    return ResumoCarrinho(carrinho_id, itens=[], **totais)
+
+
+def anotar_resumo(carrinhos):
+    """Anota subtotal, qtd_linhas e qtd_unidades num queryset de Carrinho (ex.: admin)"""
+    return carrinhos.annotate(**agregados('itens'))
+
+
+def _chave_versao(carrinho_id):
+    return f'pedidos:resumo:{carrinho_id}:versao'
+
+
+def resumo_em_cache(carrinho):
+    """resumo_carrinho com os itens, reaproveitado enquanto o carrinho não mudar"""
+    carrinho_id = getattr(carrinho, 'pk', carrinho)
+    chave = f'pedidos:resumo:{carrinho_id}:{versao(_chave_versao(carrinho_id))}'
+    resumo = cache.get(chave)
+    if resumo is None:
+        resumo = resumo_carrinho(carrinho_id)
+        cache.set(chave, resumo, TEMPO_RESUMO)
+    return resumo
+
+
+def carrinho_alterado(carrinho_id):
+    """Invalida o resumo em cache do carrinho, depois do commit"""
+    transaction.on_commit(partial(incrementar_versao, _chave_versao(carrinho_id)))
+
+
+def carrinhos_com_variantes(variantes):
+    """Ids dos carrinhos com alguma das `variantes` (queryset de DetalheProduto)"""
+    carrinho_ids = set(
+        ItemCarrinho.objects.filter(detalhe_produto__in=variantes).values_list('carrinho_id', flat=True)
+    )
+    if armazenamento := _em_cache():
+        # Os ainda não persistidos só têm os itens no cache
+        carrinho_ids.update(armazenamento.carrinhos_pendentes())
+    return carrinho_ids
+
+
+def invalidar_resumos(carrinho_ids):
+    for carrinho_id in carrinho_ids:
+        incrementar_versao(_chave_versao(carrinho_id))
+
+
+def _altera_carrinho(funcao):
+    @wraps(funcao)
+    def alterar(carrinho_id, *args, **kwargs):
+        resultado = funcao(carrinho_id, *args, **kwargs)
+        carrinho_alterado(carrinho_id)
+        return resultado
+    return alterar
+
+
+class EstoqueInsuficiente(Exception):
+    def __init__(self, mensagem='Estoque insuficiente para este item', disponivel=0, erros=None):
+        super().__init__(mensagem)
+        self.disponivel = disponivel
+        # Em operações com várias variantes: [{'variante_id', 'disponivel'}]
+        self.erros = erros or []
+
+
+class OperacaoInvalida(ValueError):
+    pass
+
+
+def _quantidade(itens):
+    return itens.values_list('quantidade', flat=True).first() or 0
+
+
+@_altera_carrinho
+def adicionar_item(carrinho_id, detalhe_id, quantidade=1):
+    """
+    Soma `quantidade` unidades da variante ao carrinho e retorna a nova
+    quantidade da linha. Levanta EstoqueInsuficiente se o total passaria
+    do estoque livre (pedidos/reservas.py) e DetalheProduto.DoesNotExist
+    se a variante não existe.
+    """
+    if armazenamento := _em_cache():
+        return armazenamento.adicionar(carrinho_id, detalhe_id, quantidade)
+    from pedidos.reservas import disponivel, reservado_por_outros
+
+    itens = ItemCarrinho.objects.filter(carrinho_id=carrinho_id, detalhe_produto_id=detalhe_id)
+    for _ in range(TENTATIVAS):
+        # Incremento e checagem do estoque livre (sem as reservas de outros carrinhos) no mesmo UPDATE
+        reservado = reservado_por_outros(carrinho_id, OuterRef('detalhe_produto_id'))
+        if itens.filter(
+            detalhe_produto__estoque__gte=F('quantidade') + quantidade + reservado
+        ).update(quantidade=F('quantidade') + quantidade):
+            return _quantidade(itens)
+
+        estoque = disponivel(carrinho_id, detalhe_id)
+        atual = itens.values_list('quantidade', flat=True).first()
+        if atual is not None:
+            if atual + quantidade > estoque:
+                raise EstoqueInsuficiente(disponivel=estoque)
+            # A linha acabou de ser criada por outra requisição
+            continue
+        if estoque < quantidade:
+            raise EstoqueInsuficiente('Produto sem estoque', disponivel=estoque)
+        try:
+            with transaction.atomic():
+                ItemCarrinho.objects.create(
+                    carrinho_id=carrinho_id, detalhe_produto_id=detalhe_id, quantidade=quantidade,
+                )
+            return quantidade
+        except IntegrityError:
+            # Outra requisição criou a linha agora: volta ao incremento
+            continue
+    raise EstoqueInsuficiente('Não foi possível atualizar o carrinho, tente novamente')
+
+
+@_altera_carrinho
+def remover_item(carrinho_id, detalhe_id, quantidade=1):
+    """
+    Tira `quantidade` unidades da linha (apagando-a se chegar a zero) e
+    retorna a quantidade restante, ou None se a variante não está no carrinho.
+    """
+    if armazenamento := _em_cache():
+        return armazenamento.remover(carrinho_id, detalhe_id, quantidade)
+    itens = ItemCarrinho.objects.filter(carrinho_id=carrinho_id, detalhe_produto_id=detalhe_id)
+    for _ in range(TENTATIVAS):
+        if itens.filter(quantidade__gt=quantidade).update(quantidade=F('quantidade') - quantidade):
+            return _quantidade(itens)
+        apagados, _ = itens.filter(quantidade__lte=quantidade).delete()
+        if apagados:
+            return 0
+        if not itens.exists():
+            return None
+    return _quantidade(itens)
+
+
+@_altera_carrinho
+def excluir_item(carrinho_id, detalhe_id):
+    """Apaga a linha da variante; retorna se havia alguma"""
+    if armazenamento := _em_cache():
+        return armazenamento.excluir(carrinho_id, detalhe_id)
+    apagados, _ = ItemCarrinho.objects.filter(
+        carrinho_id=carrinho_id, detalhe_produto_id=detalhe_id
+    ).delete()
+    return bool(apagados)
+
+
+def normalizar_operacoes(operacoes):
+    """
+    Valida e junta as operações por variante, na ordem recebida.
+    Cada operação é {'variante': id, 'delta': n} ou {'variante': id, 'quantidade': n};
+    retorna {variante_id: ('delta' | 'quantidade', valor)}.
+    """
+    if not isinstance(operacoes, list) or not operacoes:
+        raise OperacaoInvalida('Nenhuma operação informada')
+    if len(operacoes) > MAXIMO_OPERACOES:
+        raise OperacaoInvalida(f'No máximo {MAXIMO_OPERACOES} operações por requisição')
+
+    juntas = {}
+    for operacao in operacoes:
+        if not isinstance(operacao, dict) or len({'delta', 'quantidade'} & operacao.keys()) != 1:
+            raise OperacaoInvalida('Cada operação precisa de "variante" e de "delta" ou "quantidade"')
+        variante, valor = operacao.get('variante'), operacao.get('delta', operacao.get('quantidade'))
+        if type(variante) is not int or type(valor) is not int:
+            raise OperacaoInvalida('"variante", "delta" e "quantidade" devem ser inteiros')
+        anterior = juntas.get(variante)
+        if 'quantidade' in operacao:
+            if valor < 0:
+                raise OperacaoInvalida('"quantidade" não pode ser negativa')
+            juntas[variante] = ('quantidade', valor)
+        elif anterior is None:
+            juntas[variante] = ('delta', valor)
+        else:
+            juntas[variante] = (anterior[0], anterior[1] + valor)
+    return juntas
+
+
+def variantes_das_operacoes(carrinho_id, operacoes):
+    """Estoque livre para o carrinho, preço e nome das variantes envolvidas, numa consulta só"""
+    from pedidos.reservas import disponiveis
+
+    linhas = disponiveis(carrinho_id).filter(id__in=list(operacoes)).values_list(
+        'id', 'disponivel', 'preco', 'produto__nome'
+    )
+    variantes = {pk: (estoque, preco, nome) for pk, estoque, preco, nome in linhas}
+    faltando = [pk for pk in operacoes if pk not in variantes]
+    if faltando:
+        raise OperacaoInvalida(f'Variante não encontrada: {faltando[0]}')
+    return variantes
+
+
+def calcular_alvos(atuais, operacoes, variantes):
+    """
+    Quantidade final de cada variante a partir das atuais; levanta
+    EstoqueInsuficiente listando todas as variantes que passariam do estoque.
+    Diminuir nunca é recusado, mesmo que o estoque tenha caído.
+    """
+    alvos, erros = {}, []
+    for pk, (tipo, valor) in operacoes.items():
+        atual = atuais.get(pk, 0)
+        alvo = max(0, valor if tipo == 'quantidade' else atual + valor)
+        estoque = variantes[pk][0]
+        if alvo > atual and alvo > estoque:
+            erros.append({'variante_id': pk, 'disponivel': estoque})
+        alvos[pk] = alvo
+    if erros:
+        raise EstoqueInsuficiente(erros=erros)
+    return alvos
+
+
+@_altera_carrinho
+def aplicar_operacoes(carrinho_id, operacoes):
+    """
+    Aplica várias operações numa transação e retorna (alvos, variantes):
+    as quantidades finais por variante e os dados lidos de cada variante.
+    Tudo ou nada: se alguma variante não tiver estoque nada é alterado.
+    """
+    operacoes = normalizar_operacoes(operacoes)
+    variantes = variantes_das_operacoes(carrinho_id, operacoes)
+    if armazenamento := _em_cache():
+        return armazenamento.aplicar(carrinho_id, operacoes, variantes), variantes
+
+    with transaction.atomic():
+        # Trava o carrinho antes de ler as linhas. As existentes ficariam
+        # travadas pelo FOR UPDATE abaixo, mas uma linha nova não: no
+        # PostgreSQL o INSERT de adicionar_item precisa de FOR KEY SHARE no
+        # Carrinho (chave estrangeira) e espera esta transação, em vez de
+        # ser sobrescrito pelo bulk_create com a quantidade lida antes dele.
+        list(Carrinho.objects.select_for_update().filter(id=carrinho_id).values_list('id', flat=True))
+        atuais = dict(
+            ItemCarrinho.objects.select_for_update()
+            .filter(carrinho_id=carrinho_id, detalhe_produto_id__in=list(operacoes))
+            .values_list('detalhe_produto_id', 'quantidade')
+        )
+        alvos = calcular_alvos(atuais, operacoes, variantes)
+        zerados = [pk for pk, alvo in alvos.items() if alvo == 0 and pk in atuais]
+        alterados = [
+            ItemCarrinho(carrinho_id=carrinho_id, detalhe_produto_id=pk, quantidade=alvo)
+            for pk, alvo in alvos.items() if alvo > 0 and alvo != atuais.get(pk)
+        ]
+        if zerados:
+            ItemCarrinho.objects.filter(carrinho_id=carrinho_id, detalhe_produto_id__in=zerados).delete()
+        if alterados:
+            ItemCarrinho.objects.bulk_create(
+                alterados,
+                update_conflicts=True,
+                unique_fields=['carrinho', 'detalhe_produto'],
+                update_fields=['quantidade'],
+            )
+    return alvos, variantes
+
+
+@contextmanager
+def carrinho_para_pedido(carrinho_id):
+    """
+    Garante que ItemCarrinho tem o conteúdo atual do carrinho enquanto o
+    pedido é montado (no modo cache, persiste e trava o carrinho).
+    """
+    if armazenamento := _em_cache():
+        with armazenamento.congelado(carrinho_id):
+            yield
+    else:
+        yield
+    carrinho_alterado(carrinho_id)
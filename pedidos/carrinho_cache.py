@@ -0,0 +1,260 @@
+"""
+Carrinho guardado no cache, com gravação adiada em ItemCarrinho.
+
+Ativado com CARRINHO_ARMAZENAMENTO = 'cache' (henger/settings.py). O
+carrinho vivo fica no cache como {'itens': {variante_id: quantidade},
+'sujo_desde': timestamp ou None}; cliques em +/- só leem o estoque da
+variante e regravam essa estrutura, sem escrever no banco.
+
+O conteúdo vai para ItemCarrinho (persistir):
+  - antes de criar o pedido (congelado, usado em pedidos/finalizacao.py);
+  - na própria requisição, quando o carrinho está sujo há mais de
+    CARRINHO_INTERVALO_PERSISTENCIA segundos;
+  - pelo comando `persistir_carrinhos`, a ser agendado (cron) no mesmo
+    intervalo, que grava todos os carrinhos pendentes.
+Os carrinhos pendentes ficam em FATIAS_SUJOS conjuntos no cache, escolhidos
+por carrinho_id, cada um com a sua trava: só carrinhos da mesma fatia
+disputam a trava ao ficarem sujos ou limpos, e o comando percorre todas.
+O cache do Django não avisa quando descarta uma chave; se a entrada sumir
+o carrinho é recarregado do banco, perdendo no máximo o que ainda não foi
+persistido. Por isso o intervalo deve ser curto e o backend, compartilhado
+entre os processos (Redis, Memcached).
+"""
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from menu.models import DetalheProduto
+from pedidos.carrinho import (
+    CAMPOS_LINHA, EstoqueInsuficiente, LinhaCarrinho, ResumoCarrinho, calcular_alvos, resumo_das_linhas,
+)
+from pedidos.models import ItemCarrinho
+
+TEMPO_CACHE = 60 * 60 * 24
+CHAVE_SUJOS = 'pedidos:carrinhos_sujos'
+FATIAS_SUJOS = 64
+TEMPO_TRAVA = 30
+ESPERA_TRAVA = 10
+
+
+def _intervalo():
+    return getattr(settings, 'CARRINHO_INTERVALO_PERSISTENCIA', 60)
+
+
+def _chave(carrinho_id):
+    return f'pedidos:carrinho:{carrinho_id}'
+
+
+class CarrinhoOcupado(Exception):
+    pass
+
+
+@contextmanager
+def _trava(chave):
+    """Exclusão mútua entre processos usando cache.add"""
+    nome = f'{chave}:trava'
+    limite = time.monotonic() + ESPERA_TRAVA
+    while not cache.add(nome, 1, TEMPO_TRAVA):
+        if time.monotonic() > limite:
+            raise CarrinhoOcupado(chave)
+        time.sleep(0.002)
+    try:
+        yield
+    finally:
+        cache.delete(nome)
+
+
+def _chave_sujos(carrinho_id):
+    return f'{CHAVE_SUJOS}:{carrinho_id % FATIAS_SUJOS}'
+
+
+def _alterar_sujos(carrinho_id, alterar):
+    """Aplica `alterar(sujos)` ao conjunto da fatia do carrinho, sob a trava da fatia"""
+    chave = _chave_sujos(carrinho_id)
+    with _trava(chave):
+        sujos = cache.get(chave) or set()
+        alterar(sujos)
+        cache.set(chave, sujos, None)
+
+
+def _carregar(carrinho_id):
+    estado = cache.get(_chave(carrinho_id))
+    if estado is None:
+        itens = ItemCarrinho.objects.filter(carrinho_id=carrinho_id).order_by('id')
+        estado = {
+            'itens': dict(itens.values_list('detalhe_produto_id', 'quantidade')),
+            'sujo_desde': None,
+        }
+        cache.set(_chave(carrinho_id), estado, TEMPO_CACHE)
+    return estado
+
+
+def _marcar_sujo(carrinho_id, estado):
+    if estado['sujo_desde'] is None:
+        estado['sujo_desde'] = time.time()
+        _alterar_sujos(carrinho_id, lambda sujos: sujos.add(carrinho_id))
+    cache.set(_chave(carrinho_id), estado, TEMPO_CACHE)
+    return time.time() - estado['sujo_desde'] > _intervalo()
+
+
+def _alterar(carrinho_id, alterar):
+    """Aplica `alterar(itens)` sob a trava do carrinho e persiste se estiver vencido"""
+    with _trava(_chave(carrinho_id)):
+        estado = _carregar(carrinho_id)
+        resultado = alterar(estado['itens'])
+        vencido = _marcar_sujo(carrinho_id, estado)
+    if vencido:
+        persistir(carrinho_id)
+    return resultado
+
+
+def adicionar(carrinho_id, detalhe_id, quantidade=1):
+    from pedidos.reservas import disponivel
+
+    estoque = disponivel(carrinho_id, detalhe_id)
+
+    def alterar(itens):
+        atual = itens.get(detalhe_id, 0)
+        if atual + quantidade > estoque:
+            if atual == 0:
+                raise EstoqueInsuficiente('Produto sem estoque', disponivel=estoque)
+            raise EstoqueInsuficiente(disponivel=estoque)
+        itens[detalhe_id] = atual + quantidade
+        return itens[detalhe_id]
+
+    return _alterar(carrinho_id, alterar)
+
+
+def remover(carrinho_id, detalhe_id, quantidade=1):
+    def alterar(itens):
+        if detalhe_id not in itens:
+            return None
+        restante = itens[detalhe_id] - quantidade
+        if restante > 0:
+            itens[detalhe_id] = restante
+            return restante
+        del itens[detalhe_id]
+        return 0
+
+    return _alterar(carrinho_id, alterar)
+
+
+def excluir(carrinho_id, detalhe_id):
+    return _alterar(carrinho_id, lambda itens: itens.pop(detalhe_id, None) is not None)
+
+
+def aplicar(carrinho_id, operacoes, variantes):
+    """Versão em cache de aplicar_operacoes; `variantes` já foram lidas do banco"""
+    def alterar(itens):
+        alvos = calcular_alvos(itens, operacoes, variantes)
+        for pk, alvo in alvos.items():
+            if alvo:
+                itens[pk] = alvo
+            else:
+                itens.pop(pk, None)
+        return alvos
+
+    return _alterar(carrinho_id, alterar)
+
+
+def resumo(carrinho_id, com_itens=True):
+    """Mesmo resultado de resumo_carrinho, montado a partir do cache"""
+    quantidades = _carregar(carrinho_id)['itens']
+    variantes = DetalheProduto.objects.filter(id__in=list(quantidades))
+    if com_itens:
+        por_id = {linha[0]: linha for linha in variantes.values_list(*CAMPOS_LINHA)}
+        linhas = [
+            LinhaCarrinho(quantidade, *por_id[pk])
+            for pk, quantidade in quantidades.items() if pk in por_id
+        ]
+        return resumo_das_linhas(carrinho_id, linhas)
+
+    precos = dict(variantes.values_list('id', 'preco'))
+    presentes = {pk: quantidade for pk, quantidade in quantidades.items() if pk in precos}
+    return ResumoCarrinho(
+        carrinho_id,
+        subtotal=sum((precos[pk] * quantidade for pk, quantidade in presentes.items()), 0),
+        qtd_linhas=len(presentes),
+        qtd_unidades=sum(presentes.values()),
+        itens=[],
+    )
+
+
+def _gravar_no_banco(carrinho_id, quantidades):
+    existentes = set(
+        DetalheProduto.objects.filter(id__in=list(quantidades)).values_list('id', flat=True)
+    )
+    with transaction.atomic():
+        ItemCarrinho.objects.filter(carrinho_id=carrinho_id).exclude(
+            detalhe_produto_id__in=existentes
+        ).delete()
+        ItemCarrinho.objects.bulk_create(
+            [
+                ItemCarrinho(carrinho_id=carrinho_id, detalhe_produto_id=pk, quantidade=quantidade)
+                for pk, quantidade in quantidades.items() if pk in existentes
+            ],
+            update_conflicts=True,
+            unique_fields=['carrinho', 'detalhe_produto'],
+            update_fields=['quantidade'],
+        )
+
+
+def _limpar_sujo(carrinho_id):
+    _alterar_sujos(carrinho_id, lambda sujos: sujos.discard(carrinho_id))
+
+
+def _persistir(carrinho_id):
+    estado = cache.get(_chave(carrinho_id))
+    if estado is None or estado['sujo_desde'] is None:
+        return False
+    _gravar_no_banco(carrinho_id, estado['itens'])
+    estado['sujo_desde'] = None
+    cache.set(_chave(carrinho_id), estado, TEMPO_CACHE)
+    _limpar_sujo(carrinho_id)
+    return True
+
+
+def persistir(carrinho_id):
+    """Grava o carrinho em ItemCarrinho se houver alterações pendentes"""
+    with _trava(_chave(carrinho_id)):
+        return _persistir(carrinho_id)
+
+
+def carrinhos_pendentes():
+    """Ids dos carrinhos com alterações ainda não gravadas em ItemCarrinho"""
+    fatias = cache.get_many([f'{CHAVE_SUJOS}:{fatia}' for fatia in range(FATIAS_SUJOS)])
+    return [pk for sujos in fatias.values() for pk in sujos]
+
+
+def persistir_pendentes():
+    """
+    Grava todos os carrinhos com alterações pendentes e retorna
+    (gravados, ocupados). Um carrinho cuja trava não sai a tempo fica
+    pendente para a próxima rodada sem interromper os demais.
+    """
+    gravados = ocupados = 0
+    for carrinho_id in carrinhos_pendentes():
+        try:
+            gravado = persistir(carrinho_id)
+        except CarrinhoOcupado:
+            ocupados += 1
+            continue
+        if gravado:
+            gravados += 1
+        else:
+            _limpar_sujo(carrinho_id)
+    return gravados, ocupados
+
+
+@contextmanager
+def congelado(carrinho_id):
+    """
+    Persiste o carrinho e o mantém travado enquanto o pedido é criado a
+    partir de ItemCarrinho. Se o bloco terminar sem erro o carrinho foi
+    esvaziado pelo pedido, e a cópia do cache é descartada.
+    """
+    with _trava(_chave(carrinho_id)):
+        _persistir(carrinho_id)
+        yield
+        cache.delete(_chave(carrinho_id))
@@ -0,0 +1,20 @@
+from django.utils.functional import SimpleLazyObject
+
+
+def carrinho(request):
+    """
+    Variáveis do carrinho usadas pelo cabeçalho e pelo offcanvas em todas
+    as páginas, tiradas de request.resumo_carrinho (pedidos/middleware.py).
+    Continuam preguiçosas: páginas que não mostram o carrinho não o consultam.
+    Uma view pode sobrescrevê-las passando as mesmas chaves no contexto.
+    """
+    resumo = getattr(request, 'resumo_carrinho', None)
+    if resumo is None:
+        return {}
+    return {
+        'carrinho': request.carrinho,
+        'resumo_carrinho': resumo,
+        'item_carrinho': SimpleLazyObject(lambda: resumo.itens),
+        'qtd_item_carrinho': SimpleLazyObject(lambda: resumo.qtd_linhas),
+        'subtotal': SimpleLazyObject(lambda: resumo.subtotal),
+    }
@@ -0,0 +1,70 @@
+"""
+Exportação dos pedidos (uma linha por item, com os dados do pedido)
+para o BI. Pedidos não são alterados depois de criados, então `desde`
+filtra pela data de criação.
+
+Vêm primeiro os pedidos arquivados (PedidoArquivado, itens em JSON), que
+são todos anteriores aos que continuam em Pedido/ItemPedido. Os itens
+arquivados não têm item_id, e o sku é o atual da variante, se ela existir.
+"""
+from decimal import Decimal
+from itertools import chain
+from django.contrib.admin.views.decorators import staff_member_required
+from menu.models import DetalheProduto
+from pedidos.models import ItemPedido, PedidoArquivado
+from utils.exportacao import TAMANHO_BLOCO, exportar
+
+COLUNAS = (
+    'pedido_id', 'criado_em', 'cliente_id', 'metodo_pagamento', 'total_pedido',
+    'item_id', 'variante_id', 'sku', 'produto', 'marca', 'cor', 'tamanho',
+    'genero', 'quantidade', 'preco_unitario',
+)
+
+
+def _linhas_arquivadas(desde=None):
+    pedidos = PedidoArquivado.objects.order_by('id')
+    if desde is not None:
+        pedidos = pedidos.filter(criado_em__gte=desde)
+    ultimo = None
+    while True:
+        lote = pedidos if ultimo is None else pedidos.filter(id__gt=ultimo)
+        lote = list(lote.values_list(
+            'id', 'criado_em', 'cliente_id', 'metodo_pagamento', 'total', 'itens'
+        )[:TAMANHO_BLOCO])
+        if not lote:
+            return
+        ultimo = lote[-1][0]
+        variante_ids = {item['variante_id'] for *_, itens in lote for item in itens}
+        skus = dict(DetalheProduto.objects.filter(id__in=variante_ids).values_list('id', 'sku'))
+        for pk, criado_em, cliente_id, metodo, total, itens in lote:
+            for item in itens:
+                yield (
+                    pk, criado_em, cliente_id, metodo, total, None, item['variante_id'],
+                    skus.get(item['variante_id']), item['produto_nome'], item['marca_nome'],
+                    item['cor_nome'], item['tamanho'], item['genero'], item['quantidade'],
+                    Decimal(item['preco']),
+                )
+
+
+def _linhas_recentes(desde=None):
+    itens = ItemPedido.objects.order_by('pedido_id', 'id')
+    if desde is not None:
+        itens = itens.filter(pedido__criado_em__gte=desde)
+    return itens.values_list(
+        'pedido_id', 'pedido__criado_em', 'pedido__cliente_id',
+        'pedido__metodo_pagamento', 'pedido__total', 'id', 'detalhe_produto_id',
+        'detalhe_produto__sku', 'detalhe_produto__produto__nome',
+        'detalhe_produto__produto__marca__nome', 'detalhe_produto__cor__nome',
+        'detalhe_produto__tamanho', 'detalhe_produto__genero', 'quantidade',
+        'preco_unitario',
+    ).iterator(chunk_size=TAMANHO_BLOCO)
+
+
+def linhas_pedidos(desde=None):
+    return chain(_linhas_arquivadas(desde), _linhas_recentes(desde))
+
+
+@staff_member_required
+def exportar_pedidos(request):
+    """GET ?formato=jsonl|csv&desde=2025-01-31"""
+    return exportar(request, 'pedidos', COLUNAS, linhas_pedidos)
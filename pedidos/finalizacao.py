@@ -0,0 +1,143 @@
+"""
+Finalização do pedido a partir do carrinho.
+
+Tudo numa transação: as linhas do carrinho são lidas junto com o preço e
+o estoque das variantes (select_for_update), o estoque de todas as linhas
+é baixado num único UPDATE condicionado a `estoque >= quantidade`, os
+ItemPedido entram com bulk_create e o total do pedido é calculado aqui,
+com os preços lidos na mesma transação. Se alguma linha não tiver estoque
+nada é gravado e EstoqueInsuficiente traz uma entrada por linha.
+
+O estoque considerado é o disponível: descontadas as reservas válidas
+de outros carrinhos (pedidos/reservas.py). As reservas do próprio carrinho
+são consumidas pelo pedido.
+"""
+from functools import partial
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Value, When
+from django.utils import timezone
+from menu.models import DetalheProduto
+from pedidos.carrinho import CAMPOS_LINHA, EstoqueInsuficiente, LinhaCarrinho, OperacaoInvalida, carrinho_para_pedido
+from pedidos.idempotencia import registrar_chave
+from tarefas.fila import enfileirar
+from pedidos.models import ItemCarrinho, ItemPedido, Pedido
+from pedidos.reservas import liberar, reservado_por_outros
+
+
+def _linhas_para_pedido(carrinho_id):
+    """[(variante_id, quantidade, preco, disponivel, produto_id, produto_nome)] com as linhas travadas"""
+    # Só as linhas do carrinho: sem `of`, o PostgreSQL travaria também as
+    # variantes e produtos do JOIN, e a baixa já é um UPDATE condicionado
+    linhas = (
+        ItemCarrinho.objects.select_for_update(of=('self',))
+        .filter(carrinho_id=carrinho_id)
+        .annotate(reservado=reservado_por_outros(carrinho_id, OuterRef('detalhe_produto_id')))
+        .order_by('id')
+        .values_list(
+            'detalhe_produto_id', 'quantidade', 'detalhe_produto__preco', 'detalhe_produto__estoque',
+            'reservado', 'detalhe_produto__produto_id', 'detalhe_produto__produto__nome',
+        )
+    )
+    return [
+        (pk, quantidade, preco, estoque - reservado, produto_id, nome)
+        for pk, quantidade, preco, estoque, reservado, produto_id, nome in linhas
+    ]
+
+
+def baixar_estoque(quantidades, carrinho_id=None):
+    """
+    Tira {variante_id: quantidade} do estoque num único UPDATE, só nas
+    variantes que têm o suficiente; retorna se todas foram baixadas.
+    Com `carrinho_id`, as reservas válidas dos outros carrinhos não contam
+    como estoque. Deve rodar dentro de uma transação, que o chamador
+    desfaz se não.
+    """
+    pedida = Case(
+        *(When(id=pk, then=Value(quantidade)) for pk, quantidade in quantidades.items()),
+        output_field=IntegerField(),
+    )
+    necessario = pedida if carrinho_id is None else pedida + reservado_por_outros(carrinho_id)
+    baixadas = DetalheProduto.objects.filter(id__in=list(quantidades), estoque__gte=necessario).update(
+        estoque=F('estoque') - pedida, atualizado_em=timezone.now()
+    )
+    return baixadas == len(quantidades)
+
+
+def registrar_itens(pedido):
+    """
+    Transforma o carrinho do pedido em ItemPedido, baixando o estoque e
+    gravando o total. Roda dentro da transação (e, no carrinho em cache,
+    da trava) aberta pelo chamador.
+    """
+    from menu.signals import estoque_alterado
+
+    linhas = _linhas_para_pedido(pedido.carrinho_id)
+    if not linhas:
+        raise OperacaoInvalida('O carrinho está vazio')
+
+    faltando = [
+        {'variante_id': pk, 'produto_nome': nome, 'solicitado': quantidade, 'disponivel': max(0, disponivel)}
+        for pk, quantidade, _, disponivel, _, nome in linhas
+        if disponivel < quantidade
+    ]
+    if faltando:
+        raise EstoqueInsuficiente(erros=faltando)
+    if not baixar_estoque({pk: quantidade for pk, quantidade, *_ in linhas}, pedido.carrinho_id):
+        # Estoque ou reservas mudaram entre a leitura e o UPDATE (banco sem travas de linha)
+        raise EstoqueInsuficiente('O estoque mudou durante a finalização, tente novamente')
+
+    ItemPedido.objects.bulk_create([
+        ItemPedido(
+            pedido=pedido,
+            cliente_id=pedido.cliente_id,
+            detalhe_produto_id=pk,
+            quantidade=quantidade,
+            preco_unitario=preco,  # Salva o preço no momento da compra
+        )
+        for pk, quantidade, preco, *_ in linhas
+    ])
+    pedido.total = sum(preco * quantidade for _, quantidade, preco, *_ in linhas)
+    pedido.save(update_fields=['total'])
+    ItemCarrinho.objects.filter(carrinho_id=pedido.carrinho_id).delete()
+    liberar(pedido.carrinho_id)
+
+    # E-mail e demais trabalhos pós-venda ficam para o worker, gravados
+    # na mesma transação do pedido
+    enfileirar('pedidos.pedido_criado', prioridade=10, pedido_id=pedido.id)
+
+    # Estoque alterado por UPDATE: sem sinais, atualiza resumos e a versão do estoque
+    produto_ids = {produto_id for *_, produto_id, _ in linhas}
+    transaction.on_commit(partial(estoque_alterado, produto_ids))
+
+
+def fechar_pedido(cliente, carrinho_id, endereco_envio, metodo_pagamento, chave=None):
+    """
+    Cria o pedido com os itens do carrinho e o retorna. Levanta
+    EstoqueInsuficiente (com `erros` por linha) ou OperacaoInvalida se o
+    carrinho estiver vazio; nesses casos nenhum pedido é criado. Com
+    `chave`, levanta ChaveRepetida se ela já criou um pedido.
+    """
+    with carrinho_para_pedido(carrinho_id), transaction.atomic():
+        registro = registrar_chave(cliente, chave) if chave else None
+        pedido = Pedido.objects.create(
+            cliente=cliente,
+            carrinho_id=carrinho_id,
+            total=0,
+            endereco_envio=endereco_envio,
+            metodo_pagamento=metodo_pagamento,
+        )
+        registrar_itens(pedido)
+        if registro:
+            registro.pedido = pedido
+            registro.save(update_fields=['pedido'])
+    return pedido
+
+
+def linhas_do_pedido(pedido_id):
+    """Itens do pedido como LinhaCarrinho, com o preço pago, para a página de status"""
+    campos = [
+        'quantidade', 'detalhe_produto_id', 'preco_unitario',
+        *(f'detalhe_produto__{campo}' for campo in CAMPOS_LINHA[2:]),
+    ]
+    itens = ItemPedido.objects.filter(pedido_id=pedido_id).order_by('id')
+    return [LinhaCarrinho(*linha) for linha in itens.values_list(*campos)]
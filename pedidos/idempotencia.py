@@ -0,0 +1,72 @@
+"""
+Chaves de idempotência da finalização do pedido.
+
+O formulário leva uma chave gerada ao exibir a página. A chave é gravada
+na transação que cria o pedido, antes de qualquer outra escrita, e é única
+por cliente: um segundo POST com a mesma chave (reenvio, clique duplo)
+falha na restrição única, espera a primeira transação terminar e recebe o
+pedido criado por ela, sem tocar no carrinho. Se a primeira falhar (sem
+estoque, por exemplo) a chave volta junto com o resto e o reenvio roda
+normalmente.
+
+As chaves valem IDEMPOTENCIA_HORAS; vencidas são ignoradas e o comando
+`expirar_chaves_idempotencia` as apaga em lote.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from pedidos.models import ChaveIdempotencia
+
+TAMANHO_MAXIMO = 64
+TAMANHO_LOTE_EXPIRAR = 5000
+
+
+class ChaveRepetida(Exception):
+    def __init__(self, pedido_id):
+        super().__init__(f'Chave já usada no pedido {pedido_id}')
+        self.pedido_id = pedido_id
+
+
+def _duracao():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCIA_HORAS', 24))
+
+
+def chave_valida(valor):
+    """A chave enviada, ou None se ausente ou fora do formato"""
+    valor = (valor or '').strip()
+    if not valor or len(valor) > TAMANHO_MAXIMO:
+        return None
+    return valor
+
+
+def registrar_chave(cliente, chave):
+    """
+    Grava a chave para o pedido que está sendo criado e a retorna.
+    Levanta ChaveRepetida se ela já levou a um pedido. Deve rodar dentro
+    da transação do pedido.
+    """
+    agora = timezone.now()
+    chaves = ChaveIdempotencia.objects.filter(cliente=cliente, chave=chave)
+    chaves.filter(expira_em__lte=agora).delete()
+    try:
+        with transaction.atomic():
+            return ChaveIdempotencia.objects.create(
+                cliente=cliente, chave=chave, expira_em=agora + _duracao()
+            )
+    except IntegrityError:
+        raise ChaveRepetida(chaves.values_list('pedido_id', flat=True).first())
+
+
+def expirar(tamanho_lote=TAMANHO_LOTE_EXPIRAR):
+    """Apaga as chaves vencidas em lotes; retorna quantas foram apagadas"""
+    agora = timezone.now()
+    apagadas = 0
+    while True:
+        ids = list(
+            ChaveIdempotencia.objects.filter(expira_em__lte=agora)
+            .values_list('id', flat=True)[:tamanho_lote]
+        )
+        if not ids:
+            return apagadas
+        apagadas += ChaveIdempotencia.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from pedidos import arquivamento
+from pedidos.models import Pedido
+
+
+class Command(BaseCommand):
+    help = 'Move os pedidos antigos para PedidoArquivado, em lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int,
+                            help='Arquiva pedidos com mais de N dias (padrão: ARQUIVAR_PEDIDOS_APOS_DIAS)')
+        parser.add_argument('--lote', type=int, default=arquivamento.TAMANHO_LOTE,
+                            help='Pedidos por transação')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Só conta os pedidos que seriam arquivados')
+
+    def handle(self, *args, **options):
+        antes_de = arquivamento.horizonte(options['dias'])
+        if options['dry_run']:
+            total = Pedido.objects.filter(criado_em__lt=antes_de).count()
+            self.stdout.write(f'{total} pedidos criados antes de {antes_de:%d/%m/%Y %H:%M} seriam arquivados')
+            return
+
+        total = arquivamento.arquivar(
+            antes_de,
+            options['lote'],
+            progresso=lambda arquivados: self.stdout.write(f'  {arquivados} pedidos arquivados...'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} pedidos arquivados'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from pedidos import idempotencia
+
+
+class Command(BaseCommand):
+    help = 'Apaga em lote as chaves de idempotência vencidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=idempotencia.TAMANHO_LOTE_EXPIRAR,
+                            help='Chaves apagadas por comando DELETE')
+
+    def handle(self, *args, **options):
+        apagadas = idempotencia.expirar(options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'✓ {apagadas} chaves expiradas'))
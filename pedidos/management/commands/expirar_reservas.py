@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from pedidos import reservas
+
+
+class Command(BaseCommand):
+    help = 'Apaga em lote as reservas de estoque vencidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=reservas.TAMANHO_LOTE_EXPIRAR,
+                            help='Reservas apagadas por comando DELETE')
+        parser.add_argument('--intervalo', type=int,
+                            help='Repete a cada N segundos em vez de rodar uma vez só')
+
+    def handle(self, *args, **options):
+        while True:
+            apagadas = reservas.expirar(options['lote'])
+            self.stdout.write(self.style.SUCCESS(f'✓ {apagadas} reservas expiradas'))
+            if not options['intervalo']:
+                return
+            time.sleep(options['intervalo'])
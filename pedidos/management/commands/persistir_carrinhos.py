@@ -0,0 +1,25 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pedidos import carrinho_cache
+
+
+class Command(BaseCommand):
+    help = "Grava em ItemCarrinho os carrinhos com alterações pendentes no cache (CARRINHO_ARMAZENAMENTO = 'cache')"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=int,
+                            help='Repete a cada N segundos em vez de rodar uma vez só')
+
+    def handle(self, *args, **options):
+        if getattr(settings, 'CARRINHO_ARMAZENAMENTO', 'banco') != 'cache':
+            self.stdout.write('CARRINHO_ARMAZENAMENTO não é "cache"; nada a fazer')
+            return
+        while True:
+            gravados, ocupados = carrinho_cache.persistir_pendentes()
+            self.stdout.write(self.style.SUCCESS(f'✓ {gravados} carrinhos gravados'))
+            if ocupados:
+                self.stdout.write(self.style.WARNING(f'{ocupados} carrinhos ocupados ficam para a próxima rodada'))
+            if not options['intervalo']:
+                return
+            time.sleep(options['intervalo'])
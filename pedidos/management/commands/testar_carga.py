@@ -0,0 +1,72 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from pedidos import carga
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga de venda relâmpago: N clientes adicionam ao carrinho e finalizam o pedido '
+        'ao mesmo tempo; gera um relatório JSON com vazão, latência, consultas, travas e consistência'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=200,
+                            help='Clientes semeados, cada um faz uma compra')
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Clientes simultâneos')
+        parser.add_argument('--variantes', type=int, default=1,
+                            help='Variantes disputadas (os clientes se dividem entre elas)')
+        parser.add_argument('--estoque', type=int, default=50,
+                            help='Estoque inicial de cada variante')
+        parser.add_argument('--quantidade', type=int, default=1,
+                            help='Unidades que cada cliente adiciona ao carrinho')
+        parser.add_argument('--reenvios', type=int, default=0,
+                            help='Reenvios do formulário de finalização com a mesma chave')
+        parser.add_argument('--url',
+                            help='Servidor local (ex.: http://localhost:8000) com o mesmo banco; '
+                                 'sem ele as requisições rodam no processo, com o cliente de teste')
+        parser.add_argument('--permitir-banco-local', action='store_true',
+                            help='Roda no processo mesmo que o banco configurado não seja o de testes '
+                                 '(grava clientes, pedidos e produto nele)')
+        parser.add_argument('--saida',
+                            help='Arquivo para o relatório JSON (padrão: saída do comando)')
+        parser.add_argument('--manter', action='store_true',
+                            help='Não apaga clientes, pedidos e produto criados pelo teste')
+
+    def handle(self, *args, **options):
+        if options['usuarios'] < 1 or options['threads'] < 1 or options['quantidade'] < 1:
+            raise CommandError('--usuarios, --threads e --quantidade precisam ser positivos')
+        if not 1 <= options['variantes'] <= len(carga.SIZE_CHOICES):
+            raise CommandError(f'--variantes vai de 1 a {len(carga.SIZE_CHOICES)}')
+
+        try:
+            relatorio = carga.executar(
+                options['usuarios'],
+                options['threads'],
+                variantes=options['variantes'],
+                estoque=options['estoque'],
+                quantidade=options['quantidade'],
+                reenvios=options['reenvios'],
+                url=options['url'],
+                manter=options['manter'],
+                permitir_banco_local=options['permitir_banco_local'],
+            )
+        except carga.BancoNaoPermitido as erro:
+            raise CommandError(f'{erro}. Passe --url ou --permitir-banco-local') from None
+        texto = json.dumps(relatorio, ensure_ascii=False, indent=2)
+        if not options['saida']:
+            self.stdout.write(texto)
+        else:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(texto + '\n')
+
+        venda, etapas = relatorio['venda'], relatorio['etapas']
+        resumo = (
+            f"{venda['pedidos']} pedidos, {venda['unidades_vendidas']}/{venda['estoque_inicial']} unidades "
+            f"em {relatorio['duracao_s']}s; finalizar p95 {etapas['finalizar']['latencia_ms']['p95']} ms"
+        )
+        if relatorio['consistencia']['ok']:
+            self.stderr.write(self.style.SUCCESS(f'✓ {resumo}'))
+        else:
+            falhas = [nome for nome, total in relatorio['consistencia'].items() if total and nome != 'ok']
+            raise CommandError(f"{resumo}; violações de consistência: {', '.join(falhas)}")
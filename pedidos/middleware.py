@@ -0,0 +1,48 @@
+"""
+Carrinho do usuário logado disponível em toda requisição.
+
+request.carrinho e request.resumo_carrinho são preguiçosos: nada é
+consultado se a view e os templates não os usarem, e cada um é montado no
+máximo uma vez por requisição. O id do carrinho fica na sessão, então
+request.carrinho não custa consulta; o resumo vem de resumo_em_cache
+(pedidos/carrinho.py) e é o mesmo para o cabeçalho, o offcanvas e a página.
+Para usuários anônimos request.carrinho é None e o resumo é vazio.
+"""
+from functools import partial
+from django.utils.functional import SimpleLazyObject
+from pedidos.carrinho import ResumoCarrinho, resumo_em_cache
+from pedidos.models import Carrinho
+
+CHAVE_SESSAO = 'carrinho'
+
+
+def carrinho_da_requisicao(request):
+    usuario = request.user
+    if not usuario.is_authenticated:
+        return None
+    # Sessão guarda [id do usuário, id do carrinho]
+    guardado = request.session.get(CHAVE_SESSAO)
+    if guardado and guardado[0] == usuario.pk:
+        carrinho = Carrinho.from_db(Carrinho.objects.db, ['id', 'cliente_id'], [guardado[1], usuario.pk])
+    else:
+        carrinho, _ = Carrinho.objects.get_or_create(cliente=usuario)
+        request.session[CHAVE_SESSAO] = [carrinho.cliente_id, carrinho.pk]
+    carrinho.cliente = usuario
+    return carrinho
+
+
+def resumo_da_requisicao(request):
+    carrinho = request.carrinho
+    if not carrinho:
+        return ResumoCarrinho(None, subtotal=0, qtd_linhas=0, qtd_unidades=0, itens=[])
+    return resumo_em_cache(carrinho.pk)
+
+
+class CarrinhoMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.carrinho = SimpleLazyObject(partial(carrinho_da_requisicao, request))
+        request.resumo_carrinho = SimpleLazyObject(partial(resumo_da_requisicao, request))
+        return self.get_response(request)
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:05
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def juntar_duplicados(apps, schema_editor):
+    """Soma as linhas repetidas de uma variante no mesmo carrinho na mais antiga"""
+    ItemCarrinho = apps.get_model('pedidos', 'ItemCarrinho')
+    repetidos = ItemCarrinho.objects.values('carrinho_id', 'detalhe_produto_id').annotate(
+        linhas=Count('id'), primeiro=Min('id'), total=Sum('quantidade'),
+    ).filter(linhas__gt=1)
+    for grupo in repetidos:
+        itens = ItemCarrinho.objects.filter(
+            carrinho_id=grupo['carrinho_id'], detalhe_produto_id=grupo['detalhe_produto_id'],
+        )
+        itens.filter(id=grupo['primeiro']).update(quantidade=grupo['total'])
+        itens.exclude(id=grupo['primeiro']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(juntar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='itemcarrinho',
+            constraint=models.UniqueConstraint(fields=('carrinho', 'detalhe_produto'), name='item_carrinho_unico'),
+        ),
+    ]
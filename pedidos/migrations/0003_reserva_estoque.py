@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0006_atualizado_em'),
+        ('pedidos', '0002_item_carrinho_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.PositiveIntegerField()),
+                ('expira_em', models.DateTimeField(db_index=True)),
+                ('carrinho', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='pedidos.carrinho')),
+                ('detalhe_produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='menu.detalheproduto')),
+            ],
+            options={
+                'verbose_name': 'Reserva de Estoque',
+                'verbose_name_plural': 'Reservas de Estoque',
+                'indexes': [models.Index(fields=['detalhe_produto', 'expira_em'], name='reserva_variante_expira')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0006_pedido_arquivado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='confirmacao_enviada_em',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='tarefas_enfileiradas_em',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
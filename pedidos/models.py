@@ -30,6 +30,33 @@ class ItemCarrinho(models.Model):
     class Meta:
         verbose_name = 'Item do Carrinho'
         verbose_name_plural = 'Itens do Carrinho'
+        constraints = [
+            # Uma linha por variante: cliques simultâneos somam na mesma linha
+            models.UniqueConstraint(fields=['carrinho', 'detalhe_produto'], name='item_carrinho_unico'),
+        ]
+
+
+class ReservaEstoque(models.Model):
+    """
+    Unidades de uma variante separadas para um carrinho durante o checkout.
+    Vale até `expira_em`; o estoque disponível é o estoque menos as
+    reservas ainda válidas de outros carrinhos (pedidos/reservas.py).
+    """
+    detalhe_produto = models.ForeignKey(DetalheProduto, on_delete=models.CASCADE, related_name='reservas')
+    carrinho = models.ForeignKey(Carrinho, on_delete=models.CASCADE, related_name='reservas')
+    quantidade = models.PositiveIntegerField()
+    expira_em = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.quantidade}x {self.detalhe_produto_id} até {self.expira_em:%H:%M:%S}"
+
+    class Meta:
+        verbose_name = 'Reserva de Estoque'
+        verbose_name_plural = 'Reservas de Estoque'
+        indexes = [
+            # Soma das reservas válidas de uma variante
+            models.Index(fields=['detalhe_produto', 'expira_em'], name='reserva_variante_expira'),
+        ]
 
 
 class Pedido(models.Model):
@@ -49,23 +76,41 @@ class Pedido(models.Model):
         ],
     )
     criado_em = models.DateTimeField(auto_now_add=True)
+    # Marcas das etapas pós-venda já feitas pela fila (pedidos/tarefas.py)
+    tarefas_enfileiradas_em = models.DateTimeField(null=True, blank=True, editable=False)
+    confirmacao_enviada_em = models.DateTimeField(null=True, blank=True, editable=False)
 
     def finalizar_pedido(self):
-        """Finaliza o pedido criando ItemPedido para cada item do carrinho"""
-        if self.carrinho:
-            with transaction.atomic():
-                itens_carrinho = ItemCarrinho.objects.filter(carrinho=self.carrinho)
-
-                for item in itens_carrinho:
-                    ItemPedido.objects.create(
-                        pedido=self,
-                        detalhe_produto=item.detalhe_produto,
-                        quantidade=item.quantidade,
-                        preco_unitario=item.detalhe_produto.preco,  # Salva o preço no momento da compra
-                        cliente=self.cliente,
-                    )
-
-                itens_carrinho.delete()
+        """
+        Finaliza o pedido criando ItemPedido para cada item do carrinho,
+        baixando o estoque e recalculando o total (pedidos/finalizacao.py)
+        """
+        from pedidos.carrinho import carrinho_para_pedido
+        from pedidos.finalizacao import registrar_itens
+
+        if self.carrinho_id:
+            # No carrinho em cache, grava os itens pendentes antes de ler ItemCarrinho
+            with carrinho_para_pedido(self.carrinho_id), transaction.atomic():
+                registrar_itens(self)
+
+    @property
+    def linhas(self):
+        """Itens como LinhaCarrinho, o mesmo formato de PedidoArquivado.linhas"""
+        from pedidos.carrinho import LinhaCarrinho
+
+        return [
+            LinhaCarrinho(
+                item.quantidade,
+                item.detalhe_produto_id,
+                item.preco_unitario,
+                item.detalhe_produto.produto.nome,
+                item.detalhe_produto.produto.marca.nome,
+                item.detalhe_produto.tamanho,
+                item.detalhe_produto.cor.nome,
+                item.detalhe_produto.genero,
+            )
+            for item in self.itens.all()
+        ]
 
     def __str__(self):
         return f"Pedido #{self.id} - {self.cliente.username}"
@@ -74,6 +119,10 @@ class Pedido(models.Model):
         ordering = ['-criado_em']
         verbose_name = 'Pedido'
         verbose_name_plural = 'Pedidos'
+        indexes = [
+            # Histórico do cliente, paginado por (criado_em, id)
+            models.Index(fields=['cliente', 'criado_em', 'id'], name='pedido_cliente_criado'),
+        ]
 
 
 class ItemPedido(models.Model):
@@ -99,3 +148,62 @@ class ItemPedido(models.Model):
         verbose_name = 'Item do Pedido'
         verbose_name_plural = 'Itens dos Pedidos'
         ordering = ['-data']
+
+
+class ChaveIdempotencia(models.Model):
+    """
+    Chave enviada pelo formulário de finalização. Gravada na mesma
+    transação do pedido: um reenvio com a mesma chave devolve o pedido já
+    criado em vez de finalizar de novo (pedidos/idempotencia.py).
+    """
+    cliente = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='chaves_idempotencia')
+    chave = models.CharField(max_length=64)
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, null=True, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    expira_em = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.chave} -> Pedido #{self.pedido_id}"
+
+    class Meta:
+        verbose_name = 'Chave de Idempotência'
+        verbose_name_plural = 'Chaves de Idempotência'
+        constraints = [
+            # Também é o índice da busca pela chave
+            models.UniqueConstraint(fields=['cliente', 'chave'], name='chave_idempotencia_unica'),
+        ]
+
+
+class PedidoArquivado(models.Model):
+    """
+    Pedido antigo tirado de Pedido/ItemPedido pelo comando `arquivar_pedidos`
+    (pedidos/arquivamento.py). Mantém o mesmo id; os itens ficam em `itens`
+    como uma lista JSON com os campos de LinhaCarrinho, com nomes e preços
+    do momento do arquivamento.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    cliente = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='pedidos_arquivados')
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+    endereco_envio = models.TextField()
+    metodo_pagamento = models.CharField(max_length=20)
+    criado_em = models.DateTimeField()
+    arquivado_em = models.DateTimeField(auto_now_add=True)
+    itens = models.JSONField(default=list)
+
+    @property
+    def linhas(self):
+        from decimal import Decimal
+        from pedidos.carrinho import LinhaCarrinho
+
+        return [LinhaCarrinho(**{**item, 'preco': Decimal(item['preco'])}) for item in self.itens]
+
+    def __str__(self):
+        return f"Pedido #{self.id} (arquivado)"
+
+    class Meta:
+        ordering = ['-criado_em']
+        verbose_name = 'Pedido Arquivado'
+        verbose_name_plural = 'Pedidos Arquivados'
+        indexes = [
+            models.Index(fields=['cliente', 'criado_em', 'id'], name='arquivado_cliente_criado'),
+        ]
@@ -0,0 +1,160 @@
+"""
+Reservas de estoque durante o checkout.
+
+Ao abrir a finalização do pedido, as unidades do carrinho ficam separadas
+por RESERVA_ESTOQUE_MINUTOS (ReservaEstoque); a reserva some ao expirar,
+quando o cliente cancela ou quando o pedido é criado. Disponível é
+`estoque` menos as reservas válidas dos outros carrinhos, e é o que o
+carrinho (pedidos/carrinho.py) deixa adicionar.
+
+Abrir a finalização de novo não renova nada: só as linhas do carrinho
+ainda sem reserva (ou que aumentaram) ganham uma, que vence junto com a
+primeira reserva do carrinho. Recarregar a página não segura o estoque
+além de RESERVA_ESTOQUE_MINUTOS.
+
+Reservar não trava nem altera a linha de DetalheProduto, que numa
+variante disputada seria um ponto único de espera: cada carrinho insere
+as próprias linhas e depois confere se, somando as reservas válidas
+criadas antes da sua (id menor), ainda cabe no estoque. Quem não coube
+apaga a própria reserva. A garantia contra vender além do estoque
+continua sendo o UPDATE condicional da finalização (pedidos/finalizacao.py),
+que também desconta as reservas dos outros carrinhos.
+
+Reservas vencidas já são ignoradas nas consultas; o comando
+`expirar_reservas` só as apaga em lote.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Min, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from menu.models import DetalheProduto
+from pedidos.carrinho import EstoqueInsuficiente
+from pedidos.models import ReservaEstoque
+
+TAMANHO_LOTE_EXPIRAR = 5000
+
+
+def _duracao():
+    return timedelta(minutes=getattr(settings, 'RESERVA_ESTOQUE_MINUTOS', 10))
+
+
+def validas(agora=None):
+    return ReservaEstoque.objects.filter(expira_em__gt=agora or timezone.now())
+
+
+def reservado_por_outros(carrinho_id, variante=OuterRef('pk'), agora=None):
+    """Expressão com a soma das reservas válidas de outros carrinhos na variante"""
+    reservas = (
+        validas(agora)
+        .filter(detalhe_produto=variante)
+        .exclude(carrinho_id=carrinho_id)
+        .values('detalhe_produto')
+        .annotate(total=Sum('quantidade'))
+        .values('total')
+    )
+    return Coalesce(Subquery(reservas), 0)
+
+
+def disponiveis(carrinho_id):
+    """DetalheProduto anotado com `disponivel`: o estoque livre para o carrinho"""
+    return DetalheProduto.objects.annotate(disponivel=F('estoque') - reservado_por_outros(carrinho_id))
+
+
+def disponivel(carrinho_id, variante_id):
+    """Estoque livre da variante para o carrinho; levanta DetalheProduto.DoesNotExist"""
+    return disponiveis(carrinho_id).values_list('disponivel', flat=True).get(id=variante_id)
+
+
+def reservar(carrinho_id, quantidades):
+    """
+    Reserva {variante_id: quantidade} para o carrinho. Reservas válidas que
+    ainda cobrem a linha ficam como estão (menores, são reduzidas); as que
+    faltam são criadas com a validade da primeira reserva válida do carrinho,
+    ou uma nova se não houver. Variantes sem estoque livre ficam sem reserva
+    e são informadas em EstoqueInsuficiente.erros.
+    """
+    agora = timezone.now()
+    with transaction.atomic():
+        atuais = validas(agora).filter(carrinho_id=carrinho_id)
+        existentes = {
+            pk: (reserva_id, quantidade)
+            for reserva_id, pk, quantidade in atuais.values_list('id', 'detalhe_produto_id', 'quantidade')
+        }
+        expira_em = atuais.aggregate(primeira=Min('expira_em'))['primeira'] or agora + _duracao()
+
+        mantidas, reduzidas = set(), {}
+        for pk, (reserva_id, reservada) in existentes.items():
+            quantidade = quantidades.get(pk, 0)
+            if 0 < quantidade <= reservada:
+                mantidas.add(reserva_id)
+                if quantidade < reservada:
+                    reduzidas[reserva_id] = quantidade
+        # Vencidas, de linhas que saíram do carrinho ou que aumentaram
+        ReservaEstoque.objects.filter(carrinho_id=carrinho_id).exclude(id__in=mantidas).delete()
+        for reserva_id, quantidade in reduzidas.items():
+            ReservaEstoque.objects.filter(id=reserva_id).update(quantidade=quantidade)
+
+        cobertas = {pk for pk, (reserva_id, _) in existentes.items() if reserva_id in mantidas}
+        criadas = ReservaEstoque.objects.bulk_create([
+            ReservaEstoque(
+                carrinho_id=carrinho_id,
+                detalhe_produto_id=pk,
+                quantidade=quantidade,
+                expira_em=expira_em,
+            )
+            for pk, quantidade in quantidades.items() if quantidade > 0 and pk not in cobertas
+        ])
+    if not criadas:
+        return
+    quantidades = {reserva.detalhe_produto_id: reserva.quantidade for reserva in criadas}
+
+    # Reservas válidas até a nossa, inclusive, em cada variante
+    ate_a_nossa = Case(
+        *(When(detalhe_produto_id=reserva.detalhe_produto_id, then=Value(reserva.id)) for reserva in criadas)
+    )
+    somas = dict(
+        validas(agora)
+        .filter(detalhe_produto_id__in=list(quantidades), id__lte=ate_a_nossa)
+        .values('detalhe_produto_id')
+        .annotate(total=Sum('quantidade'))
+        .values_list('detalhe_produto_id', 'total')
+    )
+    variantes = DetalheProduto.objects.filter(id__in=list(quantidades)).values_list(
+        'id', 'estoque', 'produto__nome'
+    )
+    faltando = [
+        {
+            'variante_id': pk,
+            'produto_nome': nome,
+            'solicitado': quantidades[pk],
+            'disponivel': max(0, estoque - (somas.get(pk, 0) - quantidades[pk])),
+        }
+        for pk, estoque, nome in variantes
+        if somas.get(pk, 0) > estoque
+    ]
+    if faltando:
+        ReservaEstoque.objects.filter(
+            carrinho_id=carrinho_id, detalhe_produto_id__in=[linha['variante_id'] for linha in faltando]
+        ).delete()
+        raise EstoqueInsuficiente(erros=faltando)
+
+
+def liberar(carrinho_id):
+    """Cancela as reservas do carrinho"""
+    ReservaEstoque.objects.filter(carrinho_id=carrinho_id).delete()
+
+
+def expirar(tamanho_lote=TAMANHO_LOTE_EXPIRAR):
+    """Apaga as reservas vencidas em lotes; retorna quantas foram apagadas"""
+    agora = timezone.now()
+    apagadas = 0
+    while True:
+        ids = list(
+            ReservaEstoque.objects.filter(expira_em__lte=agora)
+            .values_list('id', flat=True)[:tamanho_lote]
+        )
+        if not ids:
+            return apagadas
+        apagadas += ReservaEstoque.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,23 @@
+"""
+Invalida o resumo em cache dos carrinhos (pedidos/carrinho.py) quando
+mudam as variantes que eles contêm.
+"""
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from menu.models import DetalheProduto
+from menu.signals import variantes_modificadas
+from pedidos.carrinho import carrinhos_com_variantes, invalidar_resumos
+
+
+@receiver(variantes_modificadas)
+def variantes_dos_carrinhos_modificadas(sender, variantes, **kwargs):
+    invalidar_resumos(carrinhos_com_variantes(variantes))
+
+
+@receiver(pre_delete, sender=DetalheProduto)
+def variante_excluida(sender, instance, **kwargs):
+    # Os itens saem em cascata junto com a variante: os carrinhos são lidos antes
+    carrinho_ids = carrinhos_com_variantes(DetalheProduto.objects.filter(id=instance.id))
+    transaction.on_commit(partial(invalidar_resumos, carrinho_ids))
@@ -0,0 +1,84 @@
+"""
+Trabalho feito depois da finalização, pelo worker da fila (tarefas/fila.py).
+O evento pedidos.pedido_criado é enfileirado na transação do pedido e se
+desdobra em tarefas independentes, cada uma com suas próprias tentativas.
+
+Uma tarefa pode rodar de novo depois de ter feito o seu trabalho (o worker
+morreu antes de marcá-la concluída e recuperar_travadas a devolveu). As
+etapas que não podem se repetir marcam o pedido na mesma transação em que
+são feitas e não fazem nada se a marca já existe.
+"""
+from django.conf import settings
+from django.core.mail import mail_admins, send_mail
+from django.utils import timezone
+from tarefas.fila import enfileirar, tarefa
+
+
+def _marcar(pedido_id, campo):
+    """Marca a etapa no pedido; retorna False se ela já tinha sido feita"""
+    from pedidos.models import Pedido
+
+    return bool(
+        Pedido.objects.filter(id=pedido_id, **{f'{campo}__isnull': True}).update(**{campo: timezone.now()})
+    )
+
+
+@tarefa('pedidos.pedido_criado')
+def pedido_criado(pedido_id):
+    if not _marcar(pedido_id, 'tarefas_enfileiradas_em'):
+        return
+    enfileirar('pedidos.enviar_confirmacao', prioridade=10, pedido_id=pedido_id)
+    enfileirar('pedidos.alertar_estoque', prioridade=50, pedido_id=pedido_id)
+    enfileirar('dashboard.contabilizar_pedido', prioridade=50, pedido_id=pedido_id)
+
+
+@tarefa('pedidos.enviar_confirmacao')
+def enviar_confirmacao(pedido_id):
+    from pedidos.finalizacao import linhas_do_pedido
+    from pedidos.models import Pedido
+
+    pedido = Pedido.objects.select_related('cliente').get(id=pedido_id)
+    if not pedido.cliente.email:
+        return
+    # Se o envio falhar a transação da tarefa desfaz a marca
+    if not _marcar(pedido_id, 'confirmacao_enviada_em'):
+        return
+    linhas = [
+        f'{linha.quantidade}x {linha.marca_nome} {linha.produto_nome} '
+        f'(Tam. {linha.tamanho} - {linha.cor_nome}): R$ {linha.total:.2f}'
+        for linha in linhas_do_pedido(pedido_id)
+    ]
+    send_mail(
+        f'Pedido #{pedido.id} confirmado',
+        '\n'.join([
+            f'Olá, {pedido.cliente.first_name or pedido.cliente.username}!',
+            '',
+            'Recebemos o seu pedido:',
+            *linhas,
+            '',
+            f'Total: R$ {pedido.total:.2f}',
+            f'Entrega em: {pedido.endereco_envio}',
+        ]),
+        None,
+        [pedido.cliente.email],
+    )
+
+
+@tarefa('pedidos.alertar_estoque')
+def alertar_estoque(pedido_id):
+    """Avisa os administradores das variantes do pedido que ficaram com pouco estoque"""
+    from menu.models import DetalheProduto
+
+    minimo = getattr(settings, 'ESTOQUE_MINIMO_ALERTA', 5)
+    baixas = DetalheProduto.objects.filter(
+        itens_pedidos__pedido_id=pedido_id, estoque__lte=minimo
+    ).values_list('id', 'produto__nome', 'tamanho', 'cor__nome', 'estoque')
+    if not baixas:
+        return
+    mail_admins(
+        f'Estoque baixo após o pedido #{pedido_id}',
+        '\n'.join(
+            f'Variante {pk}: {nome} Tam. {tamanho} - {cor}: {estoque} em estoque'
+            for pk, nome, tamanho, cor, estoque in baixas
+        ),
+    )
@@ -1,3 +1,622 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from clientes.models import CustomUser
+from menu.models import Cor, DetalheProduto, Marca, Produto
+from pedidos import carga, carrinho_cache, reservas
+from pedidos.arquivamento import arquivar, historico
+from pedidos.exportacao import COLUNAS, linhas_pedidos
+from pedidos.carrinho import (
+    EstoqueInsuficiente, _chave_versao, anotar_resumo, invalidar_resumos, resumo_carrinho,
+)
+from pedidos.finalizacao import fechar_pedido
+from pedidos.middleware import CarrinhoMiddleware
+from menu import facetas
+from menu.models import ResumoProduto
+from menu.resumo import reconstruir_resumos
+from menu.versao import versao, versao_catalogo, versao_estoque_produto
+from utils.functions import calcula_valor_total_carrinho
+from pedidos.models import (
+    Carrinho, ChaveIdempotencia, ItemCarrinho, ItemPedido, Pedido, PedidoArquivado, ReservaEstoque,
+)
 
-# Create your tests here.
+
+class LinhasCarrinhoTests(TestCase):
+    """O carrinho é lido numa consulta, qualquer que seja o número de linhas"""
+    LINHAS = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = CustomUser.objects.create_user(
+            username='comprador', password='senha', email='comprador@example.com', cpf='1',
+        )
+        cls.carrinho = Carrinho.objects.create(cliente=cls.usuario)
+        cor = Cor.objects.create(nome='Preto')
+        cls.variantes = [
+            DetalheProduto.objects.create(
+                produto=Produto.objects.create(nome=f'Tênis {n}', marca=Marca.objects.create(nome=f'Marca {n}')),
+                cor=cor, tamanho='40', genero='M', preco=100 + n, estoque=10,
+            )
+            for n in range(cls.LINHAS)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def encher(self, linhas):
+        ItemCarrinho.objects.bulk_create([
+            ItemCarrinho(carrinho=self.carrinho, detalhe_produto=variante, quantidade=2)
+            for variante in self.variantes[:linhas]
+        ])
+
+    def test_resumo_e_offcanvas_numa_consulta(self):
+        self.encher(self.LINHAS)
+
+        with self.assertNumQueries(1):
+            resumo = resumo_carrinho(self.carrinho)
+            html = render_to_string('menu/carrinho.html', resumo.contexto())
+
+        self.assertEqual(html.count('class="cart-item"'), self.LINHAS)
+        self.assertIn('Marca 19 Tênis 19', html)
+        self.assertEqual(resumo.qtd_linhas, self.LINHAS)
+        self.assertEqual(resumo.qtd_unidades, 2 * self.LINHAS)
+        self.assertEqual(resumo.subtotal, sum(2 * (100 + n) for n in range(self.LINHAS)))
+
+    def test_pagina_nao_consulta_por_linha(self):
+        self.client.force_login(self.usuario)
+        self.client.get('/')
+
+        def consultas():
+            cache.clear()
+            with CaptureQueriesContext(connection) as capturadas:
+                resposta = self.client.get('/')
+            self.assertEqual(resposta.status_code, 200)
+            return len(capturadas)
+
+        self.encher(1)
+        com_uma_linha = consultas()
+        ItemCarrinho.objects.all().delete()
+        self.encher(self.LINHAS)
+
+        self.assertEqual(consultas(), com_uma_linha)
+
+    def test_totais_sem_itens_e_por_carrinho(self):
+        self.encher(3)
+        subtotal = Decimal(2 * (100 + 101 + 102))
+
+        with self.assertNumQueries(1):
+            resumo = resumo_carrinho(self.carrinho.id, com_itens=False)
+        self.assertEqual((resumo.subtotal, resumo.qtd_linhas, resumo.qtd_unidades, resumo.itens), (subtotal, 3, 6, []))
+
+        vazio = Carrinho.objects.create(cliente=CustomUser.objects.create_user(
+            username='outro', password='senha', email='outro@example.com', cpf='2',
+        ))
+        totais = anotar_resumo(Carrinho.objects.order_by('id')).values_list('id', 'subtotal', 'qtd_linhas', 'qtd_unidades')
+        self.assertEqual(list(totais), [(self.carrinho.id, subtotal, 3, 6), (vazio.id, 0, 0, 0)])
+
+        itens = ItemCarrinho.objects.filter(carrinho=self.carrinho)
+        self.assertEqual(calcula_valor_total_carrinho(self.carrinho.id), subtotal)
+        self.assertEqual(calcula_valor_total_carrinho(itens), subtotal)
+        self.assertEqual(calcula_valor_total_carrinho(list(itens)), subtotal)
+
+    def test_views_do_carrinho_somam_todas_as_linhas(self):
+        self.client.force_login(self.usuario)
+        for variante in self.variantes[:3]:
+            # O resumo em cache é invalidado depois do commit
+            with self.captureOnCommitCallbacks(execute=True):
+                resposta = self.client.get(reverse('menu:adicionar_ao_carrinho', args=[variante.id]))
+        self.assertEqual(resposta.json()['qtd_item_carrinho'], 3)
+        self.assertEqual(resposta.json()['total_price'], 100 + 101 + 102)
+
+
+class CarrinhoCacheTests(TestCase):
+    """Carrinho no cache (CARRINHO_ARMAZENAMENTO = 'cache') e a gravação adiada"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.carrinhos = [
+            Carrinho.objects.create(cliente=CustomUser.objects.create_user(
+                username=f'cliente{n}', password='senha', email=f'cliente{n}@example.com', cpf=str(n),
+            ))
+            for n in range(2)
+        ]
+        cls.variante = DetalheProduto.objects.create(
+            produto=Produto.objects.create(nome='Runner', marca=Marca.objects.create(nome='Marca')),
+            cor=Cor.objects.create(nome='Preto'), tamanho='40', genero='M', preco=100, estoque=10,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch.object(carrinho_cache, 'ESPERA_TRAVA', 0.05)
+    def test_carrinhos_de_fatias_diferentes_nao_disputam_a_trava(self):
+        primeiro, segundo = (carrinho.id for carrinho in self.carrinhos)
+        self.assertNotEqual(carrinho_cache._chave_sujos(primeiro), carrinho_cache._chave_sujos(segundo))
+
+        trava = f'{carrinho_cache._chave_sujos(primeiro)}:trava'
+        cache.add(trava, 1)
+        with self.assertRaises(carrinho_cache.CarrinhoOcupado):
+            carrinho_cache.adicionar(primeiro, self.variante.id)
+        self.assertEqual(carrinho_cache.adicionar(segundo, self.variante.id), 1)
+        cache.delete(trava)
+
+        self.assertEqual(carrinho_cache.adicionar(primeiro, self.variante.id, 3), 3)
+        self.assertFalse(ItemCarrinho.objects.exists())
+        self.assertEqual(carrinho_cache.persistir_pendentes(), (2, 0))
+        self.assertEqual(
+            dict(ItemCarrinho.objects.values_list('carrinho_id', 'quantidade')), {primeiro: 3, segundo: 1}
+        )
+        self.assertEqual(carrinho_cache.persistir_pendentes(), (0, 0))
+
+    @override_settings(CARRINHO_ARMAZENAMENTO='cache')
+    @mock.patch.object(carrinho_cache, 'ESPERA_TRAVA', 0.05)
+    def test_carrinho_ocupado_fica_para_a_proxima_rodada(self):
+        primeiro, segundo = (carrinho.id for carrinho in self.carrinhos)
+        carrinho_cache.adicionar(primeiro, self.variante.id, 2)
+        carrinho_cache.adicionar(segundo, self.variante.id)
+
+        trava = f'{carrinho_cache._chave(primeiro)}:trava'
+        cache.add(trava, 1)
+        saida = StringIO()
+        call_command('persistir_carrinhos', stdout=saida)
+        self.assertIn('1 carrinhos gravados', saida.getvalue())
+        self.assertIn('1 carrinhos ocupados', saida.getvalue())
+        self.assertEqual(dict(ItemCarrinho.objects.values_list('carrinho_id', 'quantidade')), {segundo: 1})
+        self.assertEqual(carrinho_cache.carrinhos_pendentes(), [primeiro])
+        cache.delete(trava)
+
+        self.assertEqual(carrinho_cache.persistir_pendentes(), (1, 0))
+        self.assertEqual(
+            dict(ItemCarrinho.objects.values_list('carrinho_id', 'quantidade')), {primeiro: 2, segundo: 1}
+        )
+
+
+class ResumoEmCacheTests(TestCase):
+    """O resumo do cabeçalho (request.resumo_carrinho) acompanha preço, nomes e edições no admin"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = CustomUser.objects.create_user(
+            username='comprador', password='senha', email='comprador@example.com', cpf='1',
+        )
+        cls.carrinho = Carrinho.objects.create(cliente=cls.usuario)
+        marca, cor = Marca.objects.create(nome='Marca'), Cor.objects.create(nome='Preto')
+        cls.no_carrinho, cls.fora = [
+            DetalheProduto.objects.create(
+                produto=Produto.objects.create(nome=nome, marca=marca),
+                cor=cor, tamanho='40', genero='M', preco=100, estoque=10,
+            )
+            for nome in ('Runner', 'Trail')
+        ]
+        cls.item = ItemCarrinho.objects.create(carrinho=cls.carrinho, detalhe_produto=cls.no_carrinho, quantidade=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def resumo(self):
+        return self.client.get('/').context['resumo_carrinho']
+
+    def versao_do_carrinho(self):
+        return versao(_chave_versao(self.carrinho.id))
+
+    def test_so_variantes_do_carrinho_invalidam_o_resumo(self):
+        self.assertEqual(self.resumo().subtotal, 200)
+        inicial = self.versao_do_carrinho()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fora.preco = 50
+            self.fora.save()
+            Marca.objects.create(nome='Outra')
+        self.assertEqual(self.versao_do_carrinho(), inicial)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.no_carrinho.preco = 150
+            self.no_carrinho.save()
+        self.assertEqual(self.resumo().subtotal, 300)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            produto = self.no_carrinho.produto
+            produto.nome = 'Runner 2'
+            produto.save()
+        self.assertEqual(self.resumo().itens[0].produto_nome, 'Runner 2')
+
+    def test_edicao_no_admin_invalida_o_resumo(self):
+        self.assertEqual(self.resumo().qtd_unidades, 2)
+        admin = CustomUser.objects.create_superuser(
+            username='admin', password='senha', email='admin@example.com', cpf='2',
+        )
+        self.client.force_login(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(
+                f'/admin/pedidos/itemcarrinho/{self.item.id}/change/',
+                {'carrinho': self.carrinho.id, 'detalhe_produto': self.no_carrinho.id, 'quantidade': 5},
+            )
+        self.assertEqual(resposta.status_code, 302)
+
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.resumo().qtd_unidades, 5)
+
+
+class CarrinhoMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario, cls.outro = [
+            CustomUser.objects.create_user(username=nome, password='senha', email=f'{nome}@example.com', cpf=cpf)
+            for nome, cpf in (('comprador', '1'), ('outro', '2'))
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def requisicao(self, usuario, sessao):
+        request = RequestFactory().get('/')
+        request.user = usuario
+        request.session = sessao
+        return CarrinhoMiddleware(lambda request: request)(request)
+
+    def test_carrinho_criado_uma_vez_e_guardado_na_sessao(self):
+        sessao = SessionStore()
+        carrinho_id = self.requisicao(self.usuario, sessao).carrinho.id
+        self.assertEqual(Carrinho.objects.get(cliente=self.usuario).id, carrinho_id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.requisicao(self.usuario, sessao).carrinho.id, carrinho_id)
+        # Sessão de outro usuário: não reaproveita o carrinho dela
+        self.assertEqual(
+            self.requisicao(self.outro, sessao).carrinho.id, Carrinho.objects.get(cliente=self.outro).id
+        )
+
+    def test_resumo_preguicoso_e_vazio_para_anonimos(self):
+        with self.assertNumQueries(0):
+            request = self.requisicao(AnonymousUser(), SessionStore())
+            self.assertFalse(request.carrinho)
+            self.assertEqual((request.resumo_carrinho.qtd_linhas, request.resumo_carrinho.subtotal), (0, 0))
+
+        request = self.requisicao(self.usuario, SessionStore())
+        self.assertFalse(Carrinho.objects.exists())
+        self.assertEqual(request.resumo_carrinho.itens, [])
+        self.assertTrue(Carrinho.objects.filter(cliente=self.usuario).exists())
+
+
+class PedidoTestCase(TestCase):
+    """Base dos testes de finalização: um cliente com carrinho e duas variantes de produtos diferentes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = CustomUser.objects.create_user(
+            username='comprador', password='senha', email='comprador@example.com', cpf='1',
+        )
+        cls.carrinho = Carrinho.objects.create(cliente=cls.usuario)
+        marca, cor = Marca.objects.create(nome='Marca'), Cor.objects.create(nome='Preto')
+        cls.ultima, cls.outra = [
+            DetalheProduto.objects.create(
+                produto=Produto.objects.create(nome=nome, marca=marca),
+                cor=cor, tamanho=tamanho, genero='M', preco=100, estoque=estoque,
+            )
+            for nome, tamanho, estoque in (('Runner', '40', 1), ('Trail', '42', 5))
+        ]
+        reconstruir_resumos()
+
+    def setUp(self):
+        cache.clear()
+
+    def encher(self, variante, quantidade=1, carrinho=None):
+        carrinho = carrinho or self.carrinho
+        ItemCarrinho.objects.create(carrinho=carrinho, detalhe_produto=variante, quantidade=quantidade)
+        invalidar_resumos([carrinho.id])
+
+    def fechar(self, carrinho=None, usuario=None, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return fechar_pedido(
+                usuario or self.usuario, (carrinho or self.carrinho).id, 'Rua A, 1', 'pix', **kwargs
+            )
+
+
+class FinalizacaoTests(PedidoTestCase):
+    def test_pedido_baixa_estoque_sem_mudar_a_versao_do_catalogo(self):
+        indice = facetas.obter_indice()
+        self.assertEqual(indice.contagens({})['tamanho'], {'40': 1, '42': 1})
+        catalogo = versao_catalogo()
+        pagina = versao_estoque_produto(self.ultima.produto_id)
+
+        self.encher(self.ultima)
+        pedido = self.fechar()
+
+        self.assertEqual(pedido.total, 100)
+        self.assertEqual(list(ItemPedido.objects.values_list('detalhe_produto_id', 'quantidade')), [(self.ultima.id, 1)])
+        self.assertFalse(ItemCarrinho.objects.exists())
+        self.assertEqual(DetalheProduto.objects.get(id=self.ultima.id).estoque, 0)
+        self.assertEqual(ResumoProduto.objects.get(produto_id=self.ultima.produto_id).estoque_total, 0)
+
+        self.assertEqual(versao_catalogo(), catalogo)
+        self.assertNotEqual(versao_estoque_produto(self.ultima.produto_id), pagina)
+        # O índice de facetas é atualizado pelo estoque, não reconstruído
+        atualizado = facetas.obter_indice()
+        self.assertIsNot(atualizado, indice)
+        self.assertIs(atualizado.ids, indice.ids)
+        self.assertEqual(atualizado.contagens({})['tamanho'], {'40': 0, '42': 1})
+        self.assertEqual(atualizado.filtrar({'tamanho': {'40'}}), [])
+
+    def test_sem_estoque_nada_e_gravado(self):
+        self.encher(self.ultima, 2)
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            self.fechar()
+
+        self.assertEqual(erro.exception.erros[0]['disponivel'], 1)
+        self.assertFalse(Pedido.objects.exists())
+        self.assertEqual(DetalheProduto.objects.get(id=self.ultima.id).estoque, 1)
+        self.assertEqual(ItemCarrinho.objects.get().quantidade, 2)
+
+
+class ReservasTests(PedidoTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.concorrente = CustomUser.objects.create_user(
+            username='concorrente', password='senha', email='concorrente@example.com', cpf='2',
+        )
+        cls.carrinho_concorrente = Carrinho.objects.create(cliente=cls.concorrente)
+
+    def reservas_de(self, carrinho):
+        return list(ReservaEstoque.objects.filter(carrinho=carrinho).values_list('detalhe_produto_id', 'quantidade'))
+
+    def test_reservas_sao_admitidas_por_ordem_de_chegada(self):
+        reservas.reservar(self.carrinho.id, {self.ultima.id: 1})
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            reservas.reservar(self.carrinho_concorrente.id, {self.ultima.id: 1, self.outra.id: 2})
+
+        self.assertEqual([linha['variante_id'] for linha in erro.exception.erros], [self.ultima.id])
+        self.assertEqual(erro.exception.erros[0]['disponivel'], 0)
+        self.assertEqual(self.reservas_de(self.carrinho), [(self.ultima.id, 1)])
+        self.assertEqual(self.reservas_de(self.carrinho_concorrente), [(self.outra.id, 2)])
+
+    def test_reabrir_a_finalizacao_nao_renova_a_validade(self):
+        self.client.force_login(self.usuario)
+        self.encher(self.ultima)
+        self.client.get(reverse('pedidos:finalizar_pedido'))
+        primeira = ReservaEstoque.objects.get()
+
+        self.encher(self.outra, 2)
+        self.client.get(reverse('pedidos:finalizar_pedido'))
+
+        self.assertEqual(ReservaEstoque.objects.get(detalhe_produto=self.ultima), primeira)
+        self.assertEqual(ReservaEstoque.objects.get(detalhe_produto=self.ultima).expira_em, primeira.expira_em)
+        # A linha nova vence junto com a primeira reserva
+        self.assertEqual(ReservaEstoque.objects.get(detalhe_produto=self.outra).expira_em, primeira.expira_em)
+
+    def test_reserva_vencida_libera_o_estoque(self):
+        reservas.reservar(self.carrinho.id, {self.ultima.id: 1})
+        self.assertEqual(reservas.disponivel(self.carrinho_concorrente.id, self.ultima.id), 0)
+        self.assertEqual(reservas.disponivel(self.carrinho.id, self.ultima.id), 1)
+
+        ReservaEstoque.objects.update(expira_em=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(reservas.disponivel(self.carrinho_concorrente.id, self.ultima.id), 1)
+        reservas.reservar(self.carrinho_concorrente.id, {self.ultima.id: 1})
+        self.assertEqual(self.reservas_de(self.carrinho_concorrente), [(self.ultima.id, 1)])
+        self.assertEqual(reservas.expirar(), 1)
+
+    def test_carrinho_so_adiciona_o_estoque_livre(self):
+        reservas.reservar(self.carrinho.id, {self.ultima.id: 1})
+        self.client.force_login(self.concorrente)
+
+        resposta = self.client.get(f'/adicionar_ao_carrinho/{self.ultima.id}/')
+        self.assertEqual(resposta.status_code, 400)
+        resposta = self.client.post(
+            '/atualizar_carrinho/',
+            json.dumps({'operacoes': [{'variante': self.ultima.id, 'delta': 1}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json()['erros'], [{'variante_id': self.ultima.id, 'disponivel': 0}])
+        self.assertFalse(ItemCarrinho.objects.filter(carrinho=self.carrinho_concorrente).exists())
+
+    def test_pedido_consome_as_reservas_do_carrinho(self):
+        self.encher(self.ultima)
+        self.encher(self.ultima, carrinho=self.carrinho_concorrente)
+        reservas.reservar(self.carrinho.id, {self.ultima.id: 1})
+
+        with self.assertRaises(EstoqueInsuficiente):
+            self.fechar(self.carrinho_concorrente, self.concorrente)
+        self.fechar()
+
+        self.assertFalse(ReservaEstoque.objects.exists())
+        self.assertEqual(DetalheProduto.objects.get(id=self.ultima.id).estoque, 0)
+
+
+class IdempotenciaTests(PedidoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.usuario)
+
+    def enviar(self, chave='chave-1'):
+        return self.client.post(reverse('pedidos:finalizar_pedido'), {
+            'endereco': 'Rua A, 1', 'metodo_pagamento': 'pix', 'chave_idempotencia': chave,
+        })
+
+    def test_reenvio_devolve_o_mesmo_pedido(self):
+        self.encher(self.outra, 2)
+        primeira = self.enviar()
+        segunda = self.enviar()
+
+        pedido = Pedido.objects.get()
+        self.assertEqual(primeira.context['pedido'], pedido)
+        self.assertEqual(segunda.context['pedido'], pedido)
+        self.assertEqual(
+            [linha.quantidade for linha in segunda.context['item_carrinho']],
+            [linha.quantidade for linha in primeira.context['item_carrinho']],
+        )
+        self.assertEqual(DetalheProduto.objects.get(id=self.outra.id).estoque, 3)
+
+    def test_tentativa_sem_estoque_nao_gasta_a_chave(self):
+        self.encher(self.ultima, 2)
+        resposta = self.enviar()
+        self.assertEqual(resposta.status_code, 200)
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(ChaveIdempotencia.objects.exists())
+
+        ItemCarrinho.objects.update(quantidade=1)
+        invalidar_resumos([self.carrinho.id])
+        self.assertEqual(self.enviar().context['pedido'], Pedido.objects.get())
+
+    def test_chave_vencida_pode_ser_usada_de_novo(self):
+        self.encher(self.outra)
+        self.enviar()
+        ChaveIdempotencia.objects.update(expira_em=timezone.now() - timedelta(seconds=1))
+
+        self.encher(self.outra)
+        self.enviar()
+        self.assertEqual(Pedido.objects.count(), 2)
+        self.assertEqual(ChaveIdempotencia.objects.get().pedido, Pedido.objects.latest('id'))
+
+
+class ArquivamentoTests(PedidoTestCase):
+    """Pedidos 1 a 3 arquivados, 4 a 7 ainda em Pedido (numerados do mais antigo)"""
+    PEDIDOS = 7
+    ARQUIVADOS = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        agora = timezone.now()
+        cls.pedidos = []
+        for numero in range(1, cls.PEDIDOS + 1):
+            pedido = Pedido.objects.create(
+                cliente=cls.usuario, total=100 * numero, endereco_envio='Rua A, 1', metodo_pagamento='pix',
+            )
+            ItemPedido.objects.create(
+                pedido=pedido, cliente=cls.usuario, detalhe_produto=cls.outra,
+                quantidade=numero, preco_unitario=100,
+            )
+            Pedido.objects.filter(id=pedido.id).update(criado_em=agora - timedelta(days=cls.PEDIDOS - numero))
+            cls.pedidos.append(pedido.id)
+        DetalheProduto.objects.filter(id=cls.outra.id).update(sku='TR-42')
+        arquivar(agora - timedelta(days=cls.PEDIDOS - cls.ARQUIVADOS - 0.5))
+
+    def ids(self, pagina):
+        return [pedido.id for pedido in pagina]
+
+    def test_arquivados_saem_de_pedido(self):
+        self.assertEqual(list(PedidoArquivado.objects.order_by('id').values_list('id', flat=True)), self.pedidos[:3])
+        self.assertEqual(list(Pedido.objects.order_by('id').values_list('id', flat=True)), self.pedidos[3:])
+
+    def test_historico_atravessa_a_fronteira_nos_dois_sentidos(self):
+        paginador = historico(self.usuario, 3)
+        recentes_primeiro = self.pedidos[::-1]
+
+        paginas = [paginador.get_page(None)]
+        while paginas[-1].next_cursor:
+            paginas.append(paginador.get_page(paginas[-1].next_cursor))
+        self.assertEqual([self.ids(pagina) for pagina in paginas], [
+            recentes_primeiro[:3], recentes_primeiro[3:6], recentes_primeiro[6:],
+        ])
+        # A segunda página mistura o pedido 4 (recente) com os arquivados 3 e 2
+        self.assertIsInstance(paginas[1][0], Pedido)
+        self.assertIsInstance(paginas[1][1], PedidoArquivado)
+
+        voltando = [paginas[-1]]
+        while voltando[-1].previous_cursor:
+            voltando.append(paginador.get_page(voltando[-1].previous_cursor))
+        self.assertEqual([self.ids(pagina) for pagina in voltando], [self.ids(pagina) for pagina in paginas[::-1]])
+
+    def test_exportacao_inclui_os_arquivados(self):
+        linhas = [dict(zip(COLUNAS, linha)) for linha in linhas_pedidos()]
+
+        self.assertEqual([linha['pedido_id'] for linha in linhas], self.pedidos)
+        self.assertEqual([linha['quantidade'] for linha in linhas], list(range(1, self.PEDIDOS + 1)))
+        arquivada, recente = linhas[0], linhas[-1]
+        self.assertIsNone(arquivada['item_id'])
+        self.assertEqual(
+            (arquivada['sku'], arquivada['produto'], arquivada['preco_unitario']), ('TR-42', 'Trail', 100)
+        )
+        self.assertIsNotNone(recente['item_id'])
+        self.assertEqual(recente['sku'], 'TR-42')
+
+        desde = timezone.now() - timedelta(days=self.PEDIDOS - 2.5)
+        self.assertEqual([linha[0] for linha in linhas_pedidos(desde)], self.pedidos[2:])
+
+
+class CargaTests(TestCase):
+    def test_excecao_da_view_vai_para_o_relatorio(self):
+        def quebrar(caminho):
+            raise ValueError('quebrou')
+
+        resposta = carga.NavegadorLocal('sessao')._requisitar(quebrar, '/')
+        self.assertEqual((resposta.status, resposta.excecao, resposta.erro_trava), (500, 'ValueError: quebrou', False))
+        resumo = carga._resumo_etapa([resposta, resposta], mede_banco=True)
+        self.assertEqual(resumo['excecoes'], {'ValueError: quebrou': 2})
+
+    def test_no_processo_so_no_banco_de_testes(self):
+        self.assertTrue(carga.banco_de_teste())
+        with mock.patch.object(carga, 'banco_de_teste', return_value=False), \
+                mock.patch.object(carga, 'semear') as semear:
+            with self.assertRaises(carga.BancoNaoPermitido):
+                carga.executar(1, 1)
+            semear.assert_not_called()
+
+
+class HistoricoTests(PedidoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.usuario)
+
+    def pedido(self, *variantes, cliente=None, dias_atras=0):
+        pedido = Pedido.objects.create(
+            cliente=cliente or self.usuario, total=100 * len(variantes), endereco_envio='Rua A, 1',
+            metodo_pagamento='pix',
+        )
+        ItemPedido.objects.bulk_create([
+            ItemPedido(pedido=pedido, cliente=pedido.cliente, detalhe_produto=variante, quantidade=1, preco_unitario=100)
+            for variante in variantes
+        ])
+        Pedido.objects.filter(id=pedido.id).update(criado_em=timezone.now() - timedelta(days=dias_atras))
+        return pedido
+
+    def pagina(self):
+        resposta = self.client.get(reverse('pedidos:historico_de_pedidos'))
+        self.assertEqual(resposta.status_code, 200)
+        return resposta
+
+    def test_so_a_pagina_e_sem_consulta_por_item(self):
+        outro = CustomUser.objects.create_user(username='outro', password='senha', email='o@example.com', cpf='2')
+        self.pedido(self.outra, cliente=outro)
+        for _ in range(6):
+            self.pedido(self.ultima)
+        self.pagina()  # Carrinho na sessão e resumo em cache
+        with CaptureQueriesContext(connection) as um_item:
+            resposta = self.pagina()
+        pagina = resposta.context['page_obj']
+        self.assertEqual(len(pagina), 5)
+        self.assertContains(resposta, 'aria-label="Page navigation"', count=1)
+        self.assertTrue(all(pedido.cliente_id == self.usuario.id for pedido in pagina))
+
+        ItemPedido.objects.filter(pedido__cliente=self.usuario).delete()
+        Pedido.objects.filter(cliente=self.usuario).delete()
+        for _ in range(6):
+            self.pedido(self.ultima, self.outra, self.outra)
+        with CaptureQueriesContext(connection) as tres_itens:
+            self.assertContains(self.pagina(), 'Trail', count=10)
+        self.assertEqual(len(tres_itens), len(um_item))
+
+    def test_mostra_recentes_e_arquivados(self):
+        antigo = self.pedido(self.ultima, dias_atras=400)
+        recente = self.pedido(self.outra)
+        arquivar(timezone.now() - timedelta(days=365))
+
+        resposta = self.pagina()
+        self.assertEqual([pedido.id for pedido in resposta.context['page_obj']], [recente.id, antigo.id])
+        self.assertIsInstance(resposta.context['page_obj'][1], PedidoArquivado)
+        self.assertContains(resposta, 'Runner')
+        self.assertContains(resposta, 'Trail')
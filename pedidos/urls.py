@@ -1,8 +1,10 @@
 from django.urls import path
-from . import views
+from . import views, exportacao
 app_name = 'pedidos'
 
 urlpatterns = [
     path('finalizar_pedido/', views.finalizar_pedido, name='finalizar_pedido'),
+    path('cancelar_reserva/', views.cancelar_reserva, name='cancelar_reserva'),
     path('historico_de_pedidos/', views.historico_de_pedidos, name='historico_de_pedidos'),
+    path('exportar/', exportacao.exportar_pedidos, name='exportar_pedidos'),
 ]
\ No newline at end of file
@@ -1,21 +1,37 @@
+import uuid
 from django.shortcuts import render, get_object_or_404, redirect
-from pedidos.models import Pedido, Carrinho, ItemCarrinho, ItemPedido
-from clientes.models import CustomUser, EnderecoUser
-from utils.functions import calcula_valor_total_carrinho
+from pedidos.models import Pedido
+from pedidos.carrinho import EstoqueInsuficiente, OperacaoInvalida
+from pedidos.finalizacao import fechar_pedido, linhas_do_pedido
+from pedidos.arquivamento import historico
+from pedidos.idempotencia import ChaveRepetida, chave_valida
+from pedidos import reservas
+from django.views.decorators.http import require_POST
+from clientes.models import EnderecoUser
 from django.http import HttpResponse
 from clientes.forms import AddressForm
 from django.contrib import messages
-from django.core.paginator import Paginator
+from django.contrib.auth.decorators import login_required
 
 
+def contexto_status(pedido, status_pedido):
+    """Página de status montada a partir do pedido gravado, igual em todo reenvio"""
+    return {
+        'item_carrinho': linhas_do_pedido(pedido.id),
+        'pedido': pedido,
+        'status_pedido': status_pedido,
+        'subtotal': pedido.total,
+        # O carrinho foi esvaziado pelo pedido
+        'qtd_item_carrinho': 0,
+    }
+
+
+@login_required(login_url='clientes:login_cliente')
 def finalizar_pedido(request):
     address_form = AddressForm()
+    usuario = request.user
 
     if request.method == 'POST':
-        usuario = get_object_or_404(CustomUser, username=request.user)
-        carrinho_vinculado = get_object_or_404(Carrinho, cliente=usuario)
-        item_carrinho = ItemCarrinho.objects.filter(carrinho=carrinho_vinculado)
-        total = calcula_valor_total_carrinho(item_carrinho)
         metodo_pagamento = request.POST.get('metodo_pagamento')
         pedido_esta_correto = True
         
@@ -32,56 +48,79 @@ def finalizar_pedido(request):
             messages.error(request, 'Por favor, selecione um método de pagamento')
 
         if pedido_esta_correto:
-            pedido = Pedido.objects.create(
-                cliente=usuario,
-                carrinho=carrinho_vinculado,
-                total=total,
-                endereco_envio=endereco,
-                metodo_pagamento=metodo_pagamento,
-            )
+            try:
+                # Estoque baixado, itens e total gravados numa transação
+                pedido = fechar_pedido(
+                    usuario,
+                    request.carrinho.id,
+                    endereco_envio=endereco,
+                    metodo_pagamento=metodo_pagamento,
+                    chave=chave_valida(request.POST.get('chave_idempotencia')),
+                )
+            except ChaveRepetida as repetida:
+                # Reenvio do mesmo formulário: mostra o pedido já criado
+                pedido = get_object_or_404(Pedido, id=repetida.pedido_id, cliente=usuario)
+                return render(request, 'pedidos/status_pedido.html', contexto_status(pedido, msg_status_pedido))
+            except OperacaoInvalida:
+                return redirect('menu:index')
+            except EstoqueInsuficiente as erro:
+                for linha in erro.erros:
+                    messages.error(
+                        request,
+                        f"{linha['produto_nome']}: {linha['disponivel']} disponível, "
+                        f"{linha['solicitado']} no carrinho",
+                    )
+                if not erro.erros:
+                    messages.error(request, str(erro))
+            else:
+                return render(request, 'pedidos/status_pedido.html', contexto_status(pedido, msg_status_pedido))
 
-            pedido.finalizar_pedido()
-            context = {
-                'item_carrinho': item_carrinho,
-                'pedido': pedido,
-                'status_pedido': msg_status_pedido,
-                'subtotal': total,
-            }
-            return render(request, 'pedidos/status_pedido.html', context)
-
-    usuario = get_object_or_404(CustomUser, username=request.user)
     enderecos = EnderecoUser.objects.filter(user=usuario).all()
-    carrinho_vinculado = get_object_or_404(Carrinho, cliente=usuario)
-    item_carrinho = ItemCarrinho.objects.filter(carrinho=carrinho_vinculado)
-    qtd_itens_carrinho = item_carrinho.count()
-    if qtd_itens_carrinho == 0:
+    resumo = request.resumo_carrinho
+    if resumo.qtd_linhas == 0:
         return redirect('menu:index')
 
-    total = calcula_valor_total_carrinho(item_carrinho)
+    if request.method == 'GET':
+        # Separa as unidades do carrinho enquanto o cliente finaliza; recarregar
+        # a página só reserva o que falta, sem renovar a validade
+        try:
+            reservas.reservar(
+                request.carrinho.id, {linha.variante_id: linha.quantidade for linha in resumo.itens}
+            )
+        except EstoqueInsuficiente as erro:
+            for linha in erro.erros:
+                messages.warning(
+                    request,
+                    f"{linha['produto_nome']}: só {linha['disponivel']} disponível no momento, "
+                    f"{linha['solicitado']} no carrinho",
+                )
 
     context = {
         'usuario': usuario,
-        'carrinho': carrinho_vinculado,
         'enderecos': enderecos,
-        'item_carrinho': item_carrinho,
-        'qtd_item_carrinho': qtd_itens_carrinho,
-        'subtotal': total,
         'address_form': address_form,
+        # Um reenvio deste formulário devolve o mesmo pedido
+        'chave_idempotencia': uuid.uuid4().hex,
     }
 
     return render(request, 'pedidos/finalizar_pedido.html', context)
 
 
+@login_required(login_url='clientes:login_cliente')
+@require_POST
+def cancelar_reserva(request):
+    """Libera o estoque reservado ao abrir a finalização do pedido"""
+    reservas.liberar(request.carrinho.id)
+    return redirect('menu:index')
+
+
+@login_required(login_url='clientes:login_cliente')
 def historico_de_pedidos(request):
-    usuario = get_object_or_404(CustomUser, username=request.user)
-    pedidos = Pedido.objects.filter(cliente=usuario).all().order_by('-criado_em')
-    paginator = Paginator(pedidos, 5)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pedidos recentes e arquivados, só os da página atual
+    paginator = historico(request.user, 5)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
-    itens_pedidos = ItemPedido.objects.filter(cliente=usuario).all()
     context = {
-        'itens_pedidos': itens_pedidos,
         'page_obj': page_obj,
     }
     return render(request, 'pedidos/historico.html', context)
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from tarefas.models import Tarefa
+
+
+@admin.register(Tarefa)
+class TarefaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'nome', 'estado', 'prioridade', 'tentativas', 'executar_em', 'concluida_em')
+    list_filter = ('estado', 'nome')
+    search_fields = ('nome',)
+    readonly_fields = ('criado_em', 'concluida_em', 'travada_por', 'travada_em', 'ultimo_erro')
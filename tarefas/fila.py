@@ -0,0 +1,168 @@
+"""
+Fila de tarefas guardada no banco.
+
+enfileirar() só insere uma Tarefa, então roda na transação de quem chama:
+se o pedido for desfeito a tarefa some junto, e se for gravado a tarefa
+também foi. O comando `processar_tarefas` retira e executa as pendentes.
+
+Retirada (claim):
+  - PostgreSQL (e outros com SKIP LOCKED): SELECT ... FOR UPDATE SKIP LOCKED
+    das primeiras pendentes, marcadas como executando na mesma transação;
+    workers simultâneos pegam linhas diferentes sem esperar uns pelos outros.
+  - SQLite: sem travas de linha, cada candidata é tomada com um UPDATE
+    condicional (compare-and-swap) `WHERE id = ? AND estado = 'pendente'`;
+    quem atualizar zero linhas perdeu a disputa e passa para a próxima.
+
+A ordem é prioridade (menor primeiro), depois executar_em. Uma tarefa que
+levanta exceção volta para a fila com espera exponencial até esgotar
+maximo_tentativas. A entrega é "pelo menos uma vez": um worker que morre
+no meio deixa a tarefa em executando, e recuperar_travadas() a devolve à
+fila depois de TEMPO_LIMITE; as tarefas devem tolerar rodar de novo.
+"""
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from tarefas.models import Tarefa, PENDENTE, EXECUTANDO, CONCLUIDA, FALHOU
+
+ESPERA_BASE = 10
+ESPERA_MAXIMA = 60 * 60
+TEMPO_LIMITE = 60 * 15
+
+_registro = {}
+
+
+def tarefa(nome):
+    """Decorador que registra a função que executa as tarefas `nome`"""
+    def registrar(funcao):
+        _registro[nome] = funcao
+        return funcao
+    return registrar
+
+
+def enfileirar(nome, prioridade=100, atraso=0, maximo_tentativas=5, **argumentos):
+    """Cria a tarefa na transação atual; `argumentos` precisam ser serializáveis em JSON"""
+    if nome not in _registro:
+        raise LookupError(f'Tarefa não registrada: {nome}')
+    return Tarefa.objects.create(
+        nome=nome,
+        argumentos=argumentos,
+        prioridade=prioridade,
+        maximo_tentativas=maximo_tentativas,
+        executar_em=timezone.now() + timedelta(seconds=atraso),
+    )
+
+
+def identificar_trabalhador():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _fila(agora):
+    return Tarefa.objects.filter(estado=PENDENTE, executar_em__lte=agora).order_by(
+        'prioridade', 'executar_em', 'id'
+    )
+
+
+def _marcar_executando(tarefas, trabalhador, agora):
+    return tarefas.update(
+        estado=EXECUTANDO,
+        travada_por=trabalhador,
+        travada_em=agora,
+        tentativas=F('tentativas') + 1,
+    )
+
+
+def _retirar_skip_locked(trabalhador, limite, agora):
+    with transaction.atomic():
+        ids = list(
+            _fila(agora).select_for_update(skip_locked=True).values_list('id', flat=True)[:limite]
+        )
+        _marcar_executando(Tarefa.objects.filter(id__in=ids), trabalhador, agora)
+    return ids
+
+
+def _retirar_cas(trabalhador, limite, agora):
+    # Lê mais candidatas do que o limite: algumas serão tomadas por outros workers
+    candidatas = list(_fila(agora).values_list('id', flat=True)[:limite * 2])
+    ids = []
+    for pk in candidatas:
+        if _marcar_executando(Tarefa.objects.filter(id=pk, estado=PENDENTE), trabalhador, agora):
+            ids.append(pk)
+            if len(ids) == limite:
+                break
+    return ids
+
+
+def retirar(trabalhador, limite=10):
+    """Marca até `limite` tarefas prontas como executando por `trabalhador` e as retorna"""
+    agora = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        ids = _retirar_skip_locked(trabalhador, limite, agora)
+    else:
+        ids = _retirar_cas(trabalhador, limite, agora)
+    por_id = Tarefa.objects.in_bulk(ids)
+    return [por_id[pk] for pk in ids]
+
+
+def espera(tentativas):
+    """Segundos até a próxima tentativa: exponencial, com variação aleatória"""
+    base = min(ESPERA_MAXIMA, ESPERA_BASE * 2 ** (tentativas - 1))
+    return base + random.uniform(0, base / 2)
+
+
+def _falhar(item, erro):
+    agora = timezone.now()
+    if item.tentativas >= item.maximo_tentativas:
+        alteracoes = {'estado': FALHOU, 'concluida_em': agora}
+    else:
+        alteracoes = {'estado': PENDENTE, 'executar_em': agora + timedelta(seconds=espera(item.tentativas))}
+    Tarefa.objects.filter(id=item.id).update(
+        travada_por='', travada_em=None, ultimo_erro=erro, **alteracoes
+    )
+
+
+def executar(item):
+    """Roda uma tarefa já retirada; retorna se deu certo"""
+    funcao = _registro.get(item.nome)
+    try:
+        if funcao is None:
+            raise LookupError(f'Tarefa não registrada: {item.nome}')
+        with transaction.atomic():
+            funcao(**item.argumentos)
+    except Exception:
+        _falhar(item, traceback.format_exc())
+        return False
+    Tarefa.objects.filter(id=item.id).update(
+        estado=CONCLUIDA, concluida_em=timezone.now(), travada_por='', travada_em=None
+    )
+    return True
+
+
+def processar(trabalhador, limite=10):
+    """Retira e executa um lote; retorna (concluídas, falhas)"""
+    concluidas = falhas = 0
+    for item in retirar(trabalhador, limite):
+        if executar(item):
+            concluidas += 1
+        else:
+            falhas += 1
+    return concluidas, falhas
+
+
+def recuperar_travadas(tempo_limite=TEMPO_LIMITE):
+    """Devolve à fila as tarefas em executando há mais de `tempo_limite` segundos"""
+    agora = timezone.now()
+    travadas = Tarefa.objects.filter(estado=EXECUTANDO, travada_em__lt=agora - timedelta(seconds=tempo_limite))
+    esgotadas = travadas.filter(tentativas__gte=F('maximo_tentativas')).update(
+        estado=FALHOU, concluida_em=agora, travada_por='', travada_em=None,
+        ultimo_erro='Tempo limite excedido',
+    )
+    devolvidas = travadas.update(
+        estado=PENDENTE, executar_em=agora, travada_por='', travada_em=None,
+        ultimo_erro='Tempo limite excedido',
+    )
+    return esgotadas + devolvidas
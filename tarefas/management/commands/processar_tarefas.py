@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from tarefas import fila
+
+
+class Command(BaseCommand):
+    help = 'Worker da fila de tarefas: retira e executa as tarefas pendentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=10,
+                            help='Tarefas retiradas por vez')
+        parser.add_argument('--espera', type=float, default=1.0,
+                            help='Segundos entre consultas quando a fila está vazia')
+        parser.add_argument('--uma-vez', action='store_true',
+                            help='Esvazia a fila e termina, em vez de continuar esperando')
+
+    def handle(self, *args, **options):
+        trabalhador = fila.identificar_trabalhador()
+        self.stdout.write(f'Worker {trabalhador} iniciado')
+        ultima_recuperacao = 0
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() - ultima_recuperacao > 60:
+                    if recuperadas := fila.recuperar_travadas():
+                        self.stdout.write(self.style.WARNING(f'{recuperadas} tarefas travadas devolvidas à fila'))
+                    ultima_recuperacao = time.monotonic()
+
+                concluidas, falhas = fila.processar(trabalhador, options['lote'])
+                if concluidas or falhas:
+                    self.stdout.write(self.style.SUCCESS(f'✓ {concluidas} concluídas, {falhas} com erro'))
+                    continue
+                if options['uma_vez']:
+                    return
+                time.sleep(options['espera'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker encerrado')
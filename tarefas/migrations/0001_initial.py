@@ -0,0 +1,38 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100)),
+                ('argumentos', models.JSONField(blank=True, default=dict)),
+                ('prioridade', models.SmallIntegerField(default=100)),
+                ('estado', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluida', 'Concluída'), ('falhou', 'Falhou')], default='pendente', max_length=10)),
+                ('executar_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('maximo_tentativas', models.PositiveSmallIntegerField(default=5)),
+                ('travada_por', models.CharField(blank=True, max_length=100)),
+                ('travada_em', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_erro', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('concluida_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Tarefa',
+                'verbose_name_plural': 'Tarefas',
+                'indexes': [models.Index(condition=models.Q(('estado', 'pendente')), fields=['prioridade', 'executar_em', 'id'], name='tarefa_fila'), models.Index(condition=models.Q(('estado', 'executando')), fields=['travada_em'], name='tarefa_executando')],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDA = 'concluida'
+FALHOU = 'falhou'
+
+
+class Tarefa(models.Model):
+    """
+    Trabalho a ser feito fora da requisição, pelo comando `processar_tarefas`.
+    Enfileirada com tarefas.fila.enfileirar, na transação de quem a cria.
+    """
+    nome = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True)
+    # Menor número roda primeiro
+    prioridade = models.SmallIntegerField(default=100)
+    estado = models.CharField(
+        max_length=10,
+        choices=[
+            (PENDENTE, 'Pendente'),
+            (EXECUTANDO, 'Executando'),
+            (CONCLUIDA, 'Concluída'),
+            (FALHOU, 'Falhou'),
+        ],
+        default=PENDENTE,
+    )
+    executar_em = models.DateTimeField(default=timezone.now)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    maximo_tentativas = models.PositiveSmallIntegerField(default=5)
+    travada_por = models.CharField(max_length=100, blank=True)
+    travada_em = models.DateTimeField(null=True, blank=True)
+    ultimo_erro = models.TextField(blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    concluida_em = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.nome} #{self.id} ({self.estado})"
+
+    class Meta:
+        verbose_name = 'Tarefa'
+        verbose_name_plural = 'Tarefas'
+        indexes = [
+            # Fila: só as pendentes, na ordem em que são retiradas
+            models.Index(
+                fields=['prioridade', 'executar_em', 'id'],
+                condition=Q(estado=PENDENTE),
+                name='tarefa_fila',
+            ),
+            # Tarefas presas em workers que morreram
+            models.Index(
+                fields=['travada_em'],
+                condition=Q(estado=EXECUTANDO),
+                name='tarefa_executando',
+            ),
+        ]
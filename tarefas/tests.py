@@ -0,0 +1,178 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+from django.core import mail
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from clientes.models import CustomUser
+from menu.models import Cor, DetalheProduto, Marca, Produto
+from pedidos.carrinho import EstoqueInsuficiente
+from pedidos.finalizacao import fechar_pedido
+from pedidos import tarefas
+from pedidos.models import Carrinho, ItemCarrinho, Pedido
+from tarefas import fila
+from tarefas.models import Tarefa, PENDENTE, EXECUTANDO, CONCLUIDA, FALHOU
+
+executadas = []
+
+
+@fila.tarefa('testes.registrar')
+def registrar(valor):
+    executadas.append(valor)
+
+
+@fila.tarefa('testes.falhar')
+def falhar():
+    raise RuntimeError('falha de teste')
+
+
+class FilaTests(TestCase):
+    def setUp(self):
+        executadas.clear()
+
+    def test_executa_por_prioridade(self):
+        fila.enfileirar('testes.registrar', valor='depois')
+        fila.enfileirar('testes.registrar', prioridade=1, valor='antes')
+        fila.enfileirar('testes.registrar', atraso=60, valor='agendada')
+
+        self.assertEqual(fila.processar('teste'), (2, 0))
+        self.assertEqual(executadas, ['antes', 'depois'])
+        self.assertEqual(Tarefa.objects.filter(estado=CONCLUIDA).count(), 2)
+        self.assertEqual(Tarefa.objects.get(estado=PENDENTE).argumentos, {'valor': 'agendada'})
+
+    def test_tarefa_nao_registrada(self):
+        with self.assertRaises(LookupError):
+            fila.enfileirar('testes.inexistente')
+
+    def test_falhas_voltam_com_espera_ate_esgotar(self):
+        tarefa = fila.enfileirar('testes.falhar', maximo_tentativas=2)
+
+        self.assertEqual(fila.processar('teste'), (0, 1))
+        tarefa.refresh_from_db()
+        self.assertEqual((tarefa.estado, tarefa.tentativas), (PENDENTE, 1))
+        self.assertIn('falha de teste', tarefa.ultimo_erro)
+        self.assertGreaterEqual(tarefa.executar_em, timezone.now() + timedelta(seconds=fila.ESPERA_BASE - 1))
+        # Ainda esperando: nada a retirar
+        self.assertEqual(fila.processar('teste'), (0, 0))
+
+        Tarefa.objects.update(executar_em=timezone.now())
+        self.assertEqual(fila.processar('teste'), (0, 1))
+        tarefa.refresh_from_db()
+        self.assertEqual((tarefa.estado, tarefa.tentativas), (FALHOU, 2))
+        self.assertIsNotNone(tarefa.concluida_em)
+
+    def test_espera_exponencial(self):
+        for tentativas in (1, 2, 3):
+            base = fila.ESPERA_BASE * 2 ** (tentativas - 1)
+            self.assertTrue(base <= fila.espera(tentativas) <= base * 1.5)
+        self.assertLessEqual(fila.espera(50), fila.ESPERA_MAXIMA * 1.5)
+
+    def test_recuperar_travadas(self):
+        antiga = timezone.now() - timedelta(seconds=fila.TEMPO_LIMITE + 1)
+        devolvida = Tarefa.objects.create(
+            nome='testes.registrar', estado=EXECUTANDO, tentativas=1, travada_por='morto', travada_em=antiga,
+        )
+        esgotada = Tarefa.objects.create(
+            nome='testes.registrar', estado=EXECUTANDO, tentativas=5, travada_por='morto', travada_em=antiga,
+        )
+        recente = Tarefa.objects.create(
+            nome='testes.registrar', estado=EXECUTANDO, tentativas=1, travada_por='vivo',
+            travada_em=timezone.now(),
+        )
+
+        self.assertEqual(fila.recuperar_travadas(), 2)
+        estados = dict(Tarefa.objects.values_list('id', 'estado'))
+        self.assertEqual(estados, {devolvida.id: PENDENTE, esgotada.id: FALHOU, recente.id: EXECUTANDO})
+        self.assertEqual(Tarefa.objects.get(id=devolvida.id).travada_por, '')
+
+    def test_enfileirar_desfeito_com_a_transacao(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            fila.enfileirar('testes.registrar', valor=1)
+            raise RuntimeError
+        self.assertFalse(Tarefa.objects.exists())
+
+
+class TarefaDoPedidoTests(TestCase):
+    """O evento pedidos.pedido_criado só existe se o pedido foi gravado"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = CustomUser.objects.create_user(
+            username='comprador', password='senha', email='comprador@example.com', cpf='1',
+        )
+        cls.carrinho = Carrinho.objects.create(cliente=cls.usuario)
+        cls.variante = DetalheProduto.objects.create(
+            produto=Produto.objects.create(nome='Runner', marca=Marca.objects.create(nome='Marca')),
+            cor=Cor.objects.create(nome='Preto'), tamanho='40', genero='M', preco=100, estoque=1,
+        )
+
+    def fechar(self, quantidade):
+        ItemCarrinho.objects.update_or_create(
+            carrinho=self.carrinho, detalhe_produto=self.variante, defaults={'quantidade': quantidade},
+        )
+        return fechar_pedido(self.usuario, self.carrinho.id, 'Rua A, 1', 'pix')
+
+    def test_pedido_desfeito_leva_a_tarefa(self):
+        with self.assertRaises(EstoqueInsuficiente):
+            self.fechar(2)
+        self.assertFalse(Tarefa.objects.filter(nome='pedidos.pedido_criado').exists())
+
+        pedido = self.fechar(1)
+        self.assertEqual(
+            Tarefa.objects.get(nome='pedidos.pedido_criado').argumentos, {'pedido_id': pedido.id}
+        )
+
+    def test_tarefas_repetidas_nao_refazem_as_etapas(self):
+        pedido = self.fechar(1)
+        self.assertEqual(fila.processar('teste'), (1, 0))
+        with mock.patch.object(tarefas, 'send_mail', side_effect=OSError('smtp fora do ar')):
+            self.assertEqual(fila.processar('teste'), (2, 1))
+        # O envio que falhou não deixa a marca
+        self.assertIsNone(Pedido.objects.get(id=pedido.id).confirmacao_enviada_em)
+        Tarefa.objects.update(executar_em=timezone.now())
+        fila.processar('teste')
+        self.assertEqual(len(mail.outbox), 1)
+
+        # Worker morto depois de fazer o trabalho: as tarefas voltam à fila
+        Tarefa.objects.filter(nome__in=['pedidos.pedido_criado', 'pedidos.enviar_confirmacao']).update(
+            estado=PENDENTE, executar_em=timezone.now(),
+        )
+        self.assertEqual(fila.processar('teste'), (2, 0))
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Tarefa.objects.filter(nome='pedidos.enviar_confirmacao').count(), 1)
+        pedido.refresh_from_db()
+        self.assertIsNotNone(pedido.tarefas_enfileiradas_em)
+        self.assertIsNotNone(pedido.confirmacao_enviada_em)
+
+
+class RetiradaConcorrenteTests(TransactionTestCase):
+    """Vários workers retirando ao mesmo tempo: cada tarefa vai para um só"""
+    WORKERS = 8
+    TAREFAS = 20
+
+    def test_cada_tarefa_retirada_uma_vez(self):
+        for valor in range(self.TAREFAS):
+            fila.enfileirar('testes.registrar', valor=valor)
+        barreira = threading.Barrier(self.WORKERS)
+        retiradas = []
+
+        def trabalhar(numero):
+            try:
+                barreira.wait()
+                while tarefas := fila.retirar(f'worker-{numero}', limite=2):
+                    retiradas.extend(tarefa.id for tarefa in tarefas)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=trabalhar, args=(n,)) for n in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(retiradas), sorted(Tarefa.objects.values_list('id', flat=True)))
+        self.assertEqual(
+            set(Tarefa.objects.values_list('estado', 'tentativas')), {(EXECUTANDO, 1)}
+        )
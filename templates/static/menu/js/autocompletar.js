@@ -0,0 +1,62 @@
+// Sugestões da busca enquanto o usuário digita (menu:autocompletar)
+const ROTULOS_SUGESTAO = { produto: "Produto", marca: "Marca", cor: "Cor" };
+
+document.addEventListener("DOMContentLoaded", function () {
+  const input = document.querySelector(".search-input");
+  const lista = document.getElementById("search-suggestions");
+  if (!input || !lista) return;
+  // URL no atributo data-url do campo, gerada pelo {% url %} do template
+  const url = input.getAttribute("data-url");
+  if (!url) return;
+
+  let controller = null;
+  let timer = null;
+
+  function fechar() {
+    lista.innerHTML = "";
+    lista.hidden = true;
+  }
+
+  function mostrar(sugestoes) {
+    if (!sugestoes.length) return fechar();
+    lista.innerHTML = "";
+    sugestoes.forEach(function (sugestao) {
+      const link = document.createElement("a");
+      link.href = sugestao.url;
+      link.className = "search-suggestion";
+      link.textContent = sugestao.rotulo;
+      const tipo = document.createElement("small");
+      tipo.textContent = ROTULOS_SUGESTAO[sugestao.tipo] || "";
+      link.appendChild(tipo);
+      lista.appendChild(link);
+    });
+    lista.hidden = false;
+  }
+
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    const texto = input.value;
+    if (!texto.trim()) return fechar();
+    // Espera uma pausa curta na digitação e cancela a requisição anterior
+    timer = setTimeout(function () {
+      if (controller) controller.abort();
+      controller = new AbortController();
+      fetch(url + "?q=" + encodeURIComponent(texto), {
+        signal: controller.signal,
+      })
+        .then((response) => response.json())
+        .then((data) => mostrar(data.sugestoes))
+        .catch(function (error) {
+          if (error.name !== "AbortError") fechar();
+        });
+    }, 80);
+  });
+
+  input.addEventListener("keydown", function (event) {
+    if (event.key === "Escape") fechar();
+  });
+
+  document.addEventListener("click", function (event) {
+    if (!lista.contains(event.target) && event.target !== input) fechar();
+  });
+});
@@ -1,4 +1,7 @@
 const URL_FINALIZAR_PEDIDO = "/pedido/finalizar_pedido/";
+const URL_ATUALIZAR_CARRINHO = "/atualizar_carrinho/";
+// Cliques em sequência são juntados e enviados num lote só após esta pausa (ms)
+const ESPERA_LOTE_CARRINHO = 250;
 
 function createMenuItem(productId, data) {
   return `
@@ -31,7 +34,7 @@ function createMenuItem(productId, data) {
 
 document.addEventListener("DOMContentLoaded", function () {
   function updateCartUI(data) {
-    const productId = data.produto_id;
+    const productId = data.variante_id;
     const quantityCartElement = document.querySelector(
       `#quantidade-${productId}-carrinho`
     );
@@ -166,12 +169,80 @@ document.addEventListener("DOMContentLoaded", function () {
   `;
     }
   }
+  // Operações pendentes por variante: {delta} ou {quantidade}
+  const pendingOperations = new Map();
+  let batchTimer = null;
+
+  function cartOperation(url) {
+    const match = url.match(
+      /\/(adicionar_ao_carrinho|remover_do_carrinho|excluir_do_carrinho)\/(\d+)\/$/
+    );
+    if (!match) return null;
+    const operations = {
+      adicionar_ao_carrinho: { delta: 1 },
+      remover_do_carrinho: { delta: -1 },
+      excluir_do_carrinho: { quantidade: 0 },
+    };
+    return { variante: parseInt(match[2], 10), ...operations[match[1]] };
+  }
+
+  function queueOperation(operation) {
+    const previous = pendingOperations.get(operation.variante);
+    if (!previous || "quantidade" in operation) {
+      pendingOperations.set(operation.variante, operation);
+    } else if ("quantidade" in previous) {
+      previous.quantidade = Math.max(0, previous.quantidade + operation.delta);
+    } else {
+      previous.delta += operation.delta;
+    }
+    clearTimeout(batchTimer);
+    batchTimer = setTimeout(flushOperations, ESPERA_LOTE_CARRINHO);
+  }
+
+  function flushOperations() {
+    const operacoes = Array.from(pendingOperations.values()).filter(
+      (operation) => !("delta" in operation) || operation.delta !== 0
+    );
+    pendingOperations.clear();
+    if (!operacoes.length) return;
+
+    fetch(URL_ATUALIZAR_CARRINHO, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "X-Requested-With": "XMLHttpRequest",
+        "X-CSRFToken": getCSRFToken(),
+      },
+      body: JSON.stringify({ operacoes: operacoes }),
+    })
+      .then((response) => response.json())
+      .then((data) => {
+        if (data.status === "success") {
+          data.itens.forEach((item) =>
+            updateCartUI({
+              ...item,
+              qtd_item_carrinho: data.qtd_item_carrinho,
+              total_price: data.total_price,
+            })
+          );
+        } else {
+          alert(data.message);
+        }
+      })
+      .catch((error) => console.error("Erro:", error));
+  }
+
   function handleAjaxButtonClick(event) {
     const target = event.target.closest(".btn-ajax");
     if (target) {
       event.preventDefault();
       const url = target.getAttribute("href");
-      sendAjaxRequest(url, "GET");
+      const operation = cartOperation(url);
+      if (operation) {
+        queueOperation(operation);
+      } else {
+        sendAjaxRequest(url, "GET");
+      }
     }
   }
   document.addEventListener("click", handleAjaxButtonClick);
@@ -0,0 +1,112 @@
+"""
+Exportação em fluxo (JSONL ou CSV) usada pelos endpoints e comandos de
+exportação do catálogo e dos pedidos.
+
+As consultas são projeções com values_list lidas com .iterator(), então
+nenhuma lista de objetos é montada: a memória fica constante qualquer que
+seja o número de linhas.
+"""
+import csv
+from datetime import datetime, time
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+TAMANHO_BLOCO = 2000
+FORMATOS = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class DataInvalida(ValueError):
+    pass
+
+
+def interpretar_desde(valor):
+    """
+    Converte o parâmetro `desde` (data ou data/hora ISO 8601) em datetime
+    com fuso. Datas sem hora valem a partir da meia-noite.
+    """
+    if not valor:
+        return None
+    try:
+        data_hora = parse_datetime(valor)
+        if data_hora is None:
+            data = parse_date(valor)
+            data_hora = datetime.combine(data, time.min) if data else None
+    except ValueError:
+        data_hora = None
+    if data_hora is None:
+        raise DataInvalida(f'Data inválida: {valor}')
+    if timezone.is_naive(data_hora):
+        data_hora = timezone.make_aware(data_hora)
+    return data_hora
+
+
+class _Eco:
+    """Arquivo falso para o csv.writer devolver a linha em vez de gravá-la"""
+
+    def write(self, valor):
+        return valor
+
+
+def linhas_csv(colunas, linhas):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(colunas)
+    for linha in linhas:
+        yield escritor.writerow(linha)
+
+
+def linhas_jsonl(colunas, linhas):
+    codificador = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for linha in linhas:
+        yield codificador.encode(dict(zip(colunas, linha))) + '\n'
+
+
+def serializar(formato, colunas, linhas):
+    """Gera o texto da exportação, linha a linha"""
+    if formato == 'csv':
+        return linhas_csv(colunas, linhas)
+    return linhas_jsonl(colunas, linhas)
+
+
+def gravar_exportacao(saida, formato, colunas, linhas):
+    """Grava a exportação num arquivo aberto; retorna quantas linhas foram escritas"""
+    total = 0
+
+    def contar():
+        nonlocal total
+        for linha in linhas:
+            total += 1
+            yield linha
+
+    for trecho in serializar(formato, colunas, contar()):
+        saida.write(trecho)
+    return total
+
+
+def exportar(request, nome, colunas, linhas_desde):
+    """
+    Resposta de um endpoint de exportação. Lê ?formato=jsonl|csv e
+    ?desde=<ISO 8601>; `linhas_desde(desde)` devolve as linhas (tuplas).
+    O cabeçalho X-Exportado-Em traz o instante de início, a ser usado
+    como `desde` na próxima exportação incremental.
+    """
+    formato = request.GET.get('formato', 'jsonl')
+    if formato not in FORMATOS:
+        return JsonResponse({'status': 'error', 'message': 'Formato inválido'}, status=400)
+    try:
+        desde = interpretar_desde(request.GET.get('desde'))
+    except DataInvalida as erro:
+        return JsonResponse({'status': 'error', 'message': str(erro)}, status=400)
+
+    exportado_em = timezone.now()
+    resposta = StreamingHttpResponse(
+        serializar(formato, colunas, linhas_desde(desde)),
+        content_type=FORMATOS[formato],
+    )
+    resposta['Content-Disposition'] = f'attachment; filename="{nome}.{formato}"'
+    resposta['X-Exportado-Em'] = exportado_em.isoformat()
+    return resposta
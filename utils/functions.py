@@ -1,40 +1,21 @@
 def calcula_valor_total_carrinho(carrinho):
     """
     Calcula o valor total de um carrinho.
-    
-    Aceita tanto um QuerySet de ItemCarrinho quanto um ID de Carrinho.
-    Compatível com a estrutura normalizada (DetalheProduto).
-    
-    Exemplos:
-        # Passando QuerySet de itens
-        item_carrinho = ItemCarrinho.objects.filter(carrinho=carrinho_obj)
-        total = calcula_valor_total_carrinho(item_carrinho)
-        
-        # Passando ID do carrinho
-        total = calcula_valor_total_carrinho(carrinho_id)
+
+    Mantida por compatibilidade; o código novo deve usar
+    pedidos.carrinho.resumo_carrinho, que traz também os itens e contagens.
+
+    Aceita o ID do carrinho, um QuerySet de ItemCarrinho (somado no banco)
+    ou uma lista de itens já carregados.
     """
-    from pedidos.models import ItemCarrinho, Carrinho
-    
-    subtotal = 0
-    
-    # Se receber um ID (int), busca os itens do carrinho
+    from django.db.models import QuerySet
+    from pedidos.carrinho import agregados, resumo_carrinho
+
     if isinstance(carrinho, int):
-        try:
-            carrinho_obj = Carrinho.objects.get(id=carrinho)
-            itens = ItemCarrinho.objects.filter(carrinho=carrinho_obj)
-        except Carrinho.DoesNotExist:
-            return 0
-    else:
-        # Se receber um QuerySet ou lista de ItemCarrinho
-        itens = carrinho
-    
-    # Calcula o subtotal usando o método get_total() de cada item
-    # que agora usa detalhe_produto.preco
-    if itens:
-        for item in itens:
-            subtotal += item.get_total()
-    
-    return subtotal
+        return resumo_carrinho(carrinho, com_itens=False).subtotal
+    if isinstance(carrinho, QuerySet):
+        return carrinho.aggregate(subtotal=agregados(None)['subtotal'])['subtotal']
+    return sum((item.get_total() for item in carrinho), 0)
 
 
 import re
@@ -0,0 +1,232 @@
+"""
+Paginação por cursor (keyset).
+
+Em vez de COUNT(*) + OFFSET, cada página é buscada a partir da chave de
+ordenação do último (ou primeiro) item da página anterior, então as
+páginas profundas custam o mesmo que a primeira.
+
+Uso:
+    paginator = CursorPaginator(queryset, 12, ordering=('nome', 'id'))
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+
+Os cursores são opacos e assinados (django.core.signing). O total de
+itens só é calculado se `paginator.count` for acessado.
+"""
+import datetime
+from collections.abc import Sequence
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+SALT_CURSOR = 'utils.paginacao.cursor'
+PARA_FRENTE = 'n'
+PARA_TRAS = 'p'
+
+
+class _EncoderCursor(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder corta os microssegundos; a chave precisa ser exata
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class _SerializadorCursor(signing.JSONSerializer):
+    def dumps(self, obj):
+        return _EncoderCursor(separators=(',', ':')).encode(obj).encode('latin-1')
+
+
+def codificar_cursor(direcao, chave):
+    return signing.dumps([direcao, chave], salt=SALT_CURSOR, serializer=_SerializadorCursor, compress=True)
+
+
+def decodificar_cursor(cursor):
+    """Retorna (direcao, chave) ou None se o cursor for inválido"""
+    if not cursor:
+        return None
+    try:
+        direcao, chave = signing.loads(cursor, salt=SALT_CURSOR)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if direcao not in (PARA_FRENTE, PARA_TRAS):
+        return None
+    return direcao, chave
+
+
+class CursorPage(Sequence):
+    """Página compatível com o uso de django.core.paginator.Page nos templates"""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f"<CursorPage ({len(self)} itens)>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        if not isinstance(self.object_list, list):
+            self.object_list = list(self.object_list)
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginador por cursor para QuerySets ordenados por (chave, id) ou
+    para listas já ordenadas (ex.: ids ranqueados pela busca), caso em
+    que a chave é a posição do item na lista.
+
+    `ordering` deve terminar em um campo único (normalmente 'id') e os
+    campos não podem ser nulos.
+    """
+
+    def __init__(self, object_list, per_page, ordering=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self._eh_queryset = isinstance(object_list, QuerySet)
+        if self._eh_queryset:
+            ordering = tuple(ordering or object_list.query.order_by)
+            if not ordering or ordering[-1].lstrip('-') not in ('id', 'pk'):
+                ordering += ('-id',) if ordering and ordering[-1].startswith('-') else ('id',)
+            self.ordering = ordering
+            self._campos = [(campo.lstrip('-'), campo.startswith('-')) for campo in ordering]
+
+    @cached_property
+    def count(self):
+        """Total de itens; só é calculado se alguém pedir"""
+        if self._eh_queryset:
+            return self.object_list.count()
+        return len(self.object_list)
+
+    def get_page(self, cursor=None):
+        posicao = decodificar_cursor(cursor)
+        if self._eh_queryset:
+            return self._pagina_queryset(posicao)
+        return self._pagina_lista(posicao)
+
+    # QuerySet
+
+    def _chave(self, obj):
+        valores = []
+        for campo, _ in self._campos:
+            valor = obj
+            for parte in campo.split('__'):
+                valor = getattr(valor, parte)
+            valores.append(valor)
+        return valores
+
+    def _filtro(self, chave, para_frente):
+        # (a, b) > (x, y)  ==>  a > x OR (a = x AND b > y), respeitando asc/desc
+        filtro = Q()
+        iguais = {}
+        for (campo, desc), valor in zip(self._campos, chave):
+            maior = desc != para_frente
+            filtro |= Q(**iguais, **{f"{campo}__{'gt' if maior else 'lt'}": valor})
+            iguais[campo] = valor
+        return filtro
+
+    def _buscar(self, filtro, para_frente, limite):
+        """Até `limite` itens após (ou antes de) a chave, na ordem da busca"""
+        queryset = self.object_list if filtro is None else self.object_list.filter(filtro)
+        return list(queryset.order_by(*self._ordem(para_frente))[:limite])
+
+    def _ordem(self, para_frente):
+        if para_frente:
+            return self.ordering
+        return [c[1:] if c.startswith('-') else f'-{c}' for c in self.ordering]
+
+    def _pagina_queryset(self, posicao):
+        if (
+            posicao is None
+            # Cursor do modo lista (chave int) ou de outra ordenação: volta ao início
+            or not isinstance(posicao[1], list)
+            or len(posicao[1]) != len(self._campos)
+        ):
+            direcao, chave = PARA_FRENTE, None
+        else:
+            direcao, chave = posicao
+
+        if direcao == PARA_FRENTE:
+            filtro = None if chave is None else self._filtro(chave, para_frente=True)
+            itens = self._buscar(filtro, True, self.per_page + 1)
+            tem_mais = len(itens) > self.per_page
+            itens = itens[:self.per_page]
+            proximo = tem_mais and bool(itens)
+            anterior = chave is not None and bool(itens)
+        else:
+            itens = self._buscar(self._filtro(chave, para_frente=False), False, self.per_page + 1)
+            tem_mais = len(itens) > self.per_page
+            itens = itens[:self.per_page][::-1]
+            proximo = bool(itens)
+            anterior = tem_mais and bool(itens)
+
+        return CursorPage(
+            itens,
+            self,
+            next_cursor=codificar_cursor(PARA_FRENTE, self._chave(itens[-1])) if proximo else None,
+            previous_cursor=codificar_cursor(PARA_TRAS, self._chave(itens[0])) if anterior else None,
+        )
+
+    # Lista
+
+    def _pagina_lista(self, posicao):
+        total = len(self.object_list)
+        inicio = 0
+        if posicao is not None and type(posicao[1]) is int:
+            direcao, indice = posicao
+            if direcao == PARA_FRENTE:
+                inicio = indice + 1
+            else:
+                inicio = max(indice - self.per_page, 0)
+        inicio = min(max(inicio, 0), total)
+        fim = min(inicio + self.per_page, total)
+
+        return CursorPage(
+            self.object_list[inicio:fim],
+            self,
+            next_cursor=codificar_cursor(PARA_FRENTE, fim - 1) if fim < total else None,
+            previous_cursor=codificar_cursor(PARA_TRAS, inicio) if inicio > 0 else None,
+        )
+
+
+class CursorPaginatorEncadeado(CursorPaginator):
+    """
+    Pagina vários QuerySets como se fossem um só, na ordem dada: todos os
+    itens do primeiro vêm antes de qualquer item do segundo na `ordering`
+    (ex.: pedidos recentes e pedidos arquivados). Os campos da ordenação
+    precisam existir com o mesmo nome em todos; cada página consulta só
+    as tabelas que alcança.
+    """
+
+    def __init__(self, querysets, per_page, ordering=None):
+        super().__init__(querysets[0], per_page, ordering)
+        self.querysets = list(querysets)
+
+    @cached_property
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def _buscar(self, filtro, para_frente, limite):
+        itens = []
+        for queryset in self.querysets if para_frente else reversed(self.querysets):
+            if filtro is not None:
+                queryset = queryset.filter(filtro)
+            itens += queryset.order_by(*self._ordem(para_frente))[:limite - len(itens)]
+            if len(itens) >= limite:
+                break
+        return itens